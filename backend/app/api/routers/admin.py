@@ -0,0 +1,75 @@
+import hmac
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse
+from app.core.config import settings
+from app.core.lifecycle import streams
+from app.core.profiling import profiler
+from app.core.runtime import process_stats
+from app.db.session import engine, read_engine
+from app.schemas.admin import ProfileCaptureRequest
+from app.services.stream_hub import stream_hub
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """
+    Admin endpoints are off unless ADMIN_TOKEN is set; then X-Admin-Token must match it.
+    """
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+
+def _engines() -> dict:
+    return {"primary": engine} if read_engine is engine else {"primary": engine, "replica": read_engine}
+
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+@router.post("/profiles/capture")
+async def capture_profiles(req: ProfileCaptureRequest):
+    """
+    Sample the next N /chat/ask requests of this worker; each one is
+    written to PROFILE_DIR when it finishes (see GET /admin/profiles).
+    """
+    profiler.arm(req.requests)
+    return {"armed": profiler.armed, "slow_ms": settings.PROFILE_SLOW_MS}
+
+@router.get("/profiles")
+async def list_profiles():
+    """
+    Profiles on this worker's disk, newest first, with latency and per-stage timings.
+    """
+    return {
+        "armed": profiler.armed,
+        "slow_ms": settings.PROFILE_SLOW_MS,
+        "active": len(profiler.captures),
+        "profiles": profiler.list(),
+    }
+
+@router.get("/profiles/{name}")
+async def get_profile(name: str):
+    """
+    Folded stacks of one profile: flamegraph.pl, speedscope or inferno input.
+    """
+    path = profiler.path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=f"{name}.folded")
+
+@router.get("/runtime")
+async def runtime():
+    """
+    Leak-prone resources of this worker (threads, tasks, DB connections,
+    streams, memory), polled by scripts/soak.py.
+    """
+    return {
+        **process_stats(),
+        "db_checked_out": {role: e.sync_engine.pool.checkedout() for role, e in _engines().items()},
+        "streams_active": len(streams.active),
+        "pending_writes": len(streams.pending_writes),
+        "stream_buffers": len(stream_hub.buffers),
+        "stream_buffer_bytes": sum(b.size for b in list(stream_hub.buffers.values())),
+    }
@@ -1,122 +1,264 @@
 import asyncio
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc
-from typing import List
-from app.db.session import get_db, AsyncSessionLocal
-from app.schemas.chat import ChatRequest, ChatHistoryItem
+import json
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, WebSocket
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import delete
+from typing import List, Optional
+from app.db.session import AsyncSessionLocal
+from app.schemas.chat import ChatRequest, ChatResponse, ChatHistoryItem, BatchQuestion, PrepareRequest
 from app.services.chat_service import ChatService
+from app.services.prewarm import prewarm_pool
+from app.services.batch_service import BatchService
+from app.services.ws_mux import WsConnection
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.compression import compress_stream, negotiate
+from app.services.stream_hub import stream_hub, parse_last_event_id
+from app.services.history_cache import etag_matches, history_cache
+from app.services.retention_service import RetentionService
+from app.services.faq_index import forget_rows
+from app.api.routers.admin import require_admin
 from app.models.chat_log import ChatLog
+from app.core.lifecycle import streams
 from loguru import logger
-import json
-import asyncio
-import uuid
+from pydantic import ValidationError
 
 router = APIRouter()
 
 @router.get("/history", response_model=List[ChatHistoryItem])
-async def get_history(limit: int = 30):
+async def get_history(limit: int = 30, if_none_match: Optional[str] = Header(None)):
     """
     Get the last N chat records globally.
+    Served from the read replica when one is configured, through the history
+    page cache; revalidate with If-None-Match to get a 304.
     """
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(ChatLog).order_by(desc(ChatLog.created_at)).limit(limit)
-        )
-        logs = result.scalars().all()
-        return logs
+    page = await history_cache.get(limit)
+    headers = {"ETag": page.etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, page.etag):
+        metrics.inc("history_not_modified_total")
+        return Response(status_code=304, headers=headers)
+    return Response(content=page.body, media_type="application/json", headers=headers)
 
 @router.delete("/history/{log_id}")
 async def delete_chat_log(log_id: int):
     async with AsyncSessionLocal() as session:
-        result = await session.execute(select(ChatLog).where(ChatLog.id == log_id))
-        chat_log = result.scalars().first()
-        if not chat_log:
-            raise HTTPException(status_code=404, detail="Chat log not found")
-        
-        await session.delete(chat_log)
+        result = await session.execute(delete(ChatLog).where(ChatLog.id == log_id))
         await session.commit()
-        return {"message": "Deleted successfully"}
+    if not result.rowcount:
+        raise HTTPException(status_code=404, detail="Chat log not found")
+    await history_cache.invalidate()
+    # An FAQ canonical answer copied from this row goes too (same as a session delete)
+    await asyncio.to_thread(forget_rows, [log_id])
+    return {"message": "Deleted successfully"}
+
+@router.delete("/history", status_code=202, dependencies=[Depends(require_admin)])
+async def delete_history_before(before: datetime, response: Response, wait: bool = False):
+    """
+    Bulk delete of every chat log created before `before` (ISO 8601), in
+    bounded batches. Returns the deletion job; follow it with
+    GET /history/jobs/{job_id}, or pass `wait=true` to get the final status.
+    Needs X-Admin-Token.
+    """
+    if before.tzinfo is None:
+        before = before.replace(tzinfo=timezone.utc)
+    job = RetentionService.start("before", {"before": before.isoformat()}, before=before)
+    if wait:
+        await job.task
+        response.status_code = 200
+    return job.to_dict()
+
+@router.delete("/sessions/{session_id}", status_code=202, dependencies=[Depends(require_admin)])
+async def delete_session(session_id: str, response: Response, wait: bool = False):
+    """
+    Privacy delete: every chat log of a session (and its per-session usage
+    rollups, and FAQ answers taken from it), in bounded batches. Same job
+    semantics and admin token as DELETE /history.
+    """
+    job = RetentionService.start("session", {"session_id": session_id}, session_id=session_id)
+    if wait:
+        await job.task
+        response.status_code = 200
+    return job.to_dict()
+
+@router.get("/history/jobs/{job_id}", dependencies=[Depends(require_admin)])
+async def get_deletion_job(job_id: str):
+    job = await RetentionService.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Deletion job not found (unknown or expired)")
+    return job
+
+def _sse_response(frames, encoding: Optional[str] = None) -> StreamingResponse:
+    # Keep proxies (nginx) from buffering or caching the stream
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if encoding:
+        # Opt-in (?compress=true): one compression context, flushed per frame
+        frames = compress_stream(frames, encoding)
+        headers.update({"Content-Encoding": encoding, "Vary": "Accept-Encoding"})
+    return StreamingResponse(frames, media_type="text/event-stream", headers=headers)
+
+def _wants_json(stream: bool, accept: Optional[str]) -> bool:
+    if not stream:
+        return True
+    # Browsers / EventSource send text/event-stream or */*; only an explicit JSON-only Accept switches
+    return bool(accept) and "application/json" in accept and "text/event-stream" not in accept
+
+async def _answer_json(request: ChatRequest, tenant_id: Optional[str]) -> ChatResponse:
+    """
+    Non-streaming path: one aggregated ChatResponse, no SSE framing.
+    """
+    result = await ChatService.answer(request.question, request.session_id, tenant_id)
+    if result["persist"]:
+        streams.track_write(ChatService.save_chat_log(
+            request_id=result["request_id"],
+            session_id=request.session_id,
+            question=request.question,
+            answer=result["answer"],
+            metadata_info=result["metadata_info"]
+        ))
+
+    if result["error"] and not result["answer"]:
+        raise HTTPException(status_code=504 if result["timeout"] else 502, detail=result["error"])
+    return ChatResponse(answer=result["answer"], sources=result["sources"] or [], request_id=result["request_id"])
+
+@router.post("/prepare")
+async def prepare(request: PrepareRequest, http_request: Request):
+    """
+    Called by the frontend when the input box gets focus / typing starts.
+    Pre-opens an upstream connection for the session so the following
+    /chat/ask skips the handshake (and keeps a DB pool connection open,
+    shared, not tied to the session). New slots are rate limited per client.
+    """
+    if streams.draining:
+        raise HTTPException(status_code=503, detail="Server is restarting, please retry")
+    # The client address as seen past trusted proxies (uvicorn's proxy headers, FORWARDED_ALLOW_IPS)
+    client = http_request.client.host if http_request.client else "unknown"
+    slot = prewarm_pool.prepare(request.session_id, client)
+    if slot is None:
+        raise HTTPException(status_code=429, detail="Too many pre-warm requests")
+    return {"status": "warm" if slot.ready else "warming", "ttl": settings.PREWARM_TTL_SECONDS}
 
 @router.post("/ask")
-async def ask_question(request: ChatRequest):
+async def ask_question(
+    request: ChatRequest,
+    stream: bool = True,
+    compress: bool = False,
+    accept: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    tenant_id: Optional[str] = Header(None, alias="X-Tenant-Id"),
+):
     """
     Chat endpoint that returns a Server-Sent Events (SSE) stream.
+    Every frame carries an `id: <stream_id>:<seq>`. Re-posting with a
+    Last-Event-ID header resumes that stream after the given frame, without a
+    new upstream call, as long as it is still running or finished recently.
+
+    With `?stream=false` or `Accept: application/json` it returns a single
+    ChatResponse once the answer is complete instead (for integrations/bots).
+
+    `?compress=true` gzip/brotli-compresses the stream (per Accept-Encoding),
+    flushed after every frame so nothing is held back.
     """
+    encoding = negotiate(accept_encoding) if compress else None
+    resume = parse_last_event_id(last_event_id)
+    if resume:
+        stream_id, seq = resume
+        buffer = stream_hub.get(stream_id)
+        if buffer is not None:
+            logger.info(f"Resuming stream {stream_id} after frame {seq}")
+            return _sse_response(stream_hub.subscribe(buffer, seq + 1), encoding)
+        if await stream_hub.exists_shared(stream_id):
+            # Produced by another worker, follow it through the shared cache
+            logger.info(f"Resuming shared stream {stream_id} after frame {seq}")
+            return _sse_response(stream_hub.subscribe_shared(stream_id, seq + 1), encoding)
+        # Expired or unknown: answer from scratch, the new stream id tells the client to reset
+        logger.info(f"Stream {stream_id} not resumable, starting a new one")
+
     if not request.question.strip():
         raise HTTPException(status_code=400, detail="Quesion cannot be empty")
 
-    logger.info(f"Received question: {request.question}")
-    
-    # We generate UUID here to track it across stream and save
-    # request_id = str(uuid.uuid4())
-
-    async def event_generator():
-        full_response_text = ""
-        sources = []
-        usage = None
-        latency = None
-        rag_result = None
-        web_result = None
-        
-        # Track effective Request ID (fallback to UUID, prefer Aliyun ID)
-
-        # final_request_id = request_id 自改
-
-        # 1. Stream from Bailian
-        async for data_str in ChatService.chat_stream_generator(request.question, request.session_id, request_id=None): #自改为 None
-            # Capture data for DB
-            try:
-                data = json.loads(data_str)
-                if "text" in data and data["text"]:
-                     full_response_text += data["text"]
-                if "sources" in data and data["sources"]:
-                     sources = data["sources"]
-                if "usage" in data and data["usage"]:
-                     usage = data["usage"]
-                if "latency" in data and data["latency"]:
-                     latency = data["latency"]
-                if "rag_result" in data and data["rag_result"]:
-                     rag_result = data["rag_result"]
-                if "web_result" in data and data["web_result"]:
-                     web_result = data["web_result"]
-                
-                # Capture Aliyun Request ID if available
-                if "request_id" in data and data["request_id"] and data["request_id"] != "init":
-                     final_request_id = data["request_id"]
-            except:
-                pass
-            
-            yield f"data: {data_str}\n\n"
-            await asyncio.sleep(0.02) # Throttling for UI
-        
-        yield "data: [DONE]\n\n"
-
-        # 2. Save to DB after stream finishes
-        # Check if we got any response
-        if full_response_text or sources:
-            logger.info(f"Saving chat log for {final_request_id}...")
-            try:
-                # Use a new session manually
-                async with AsyncSessionLocal() as session:
-                    chat_log = ChatLog(
-                        request_id=final_request_id,
-                        session_id=request.session_id,
-                        user_query=request.question,
-                        ai_response=full_response_text,
-                        # sources=sources, # Removed, using metadata_info property
-                        metadata_info={
-                            "usage": usage,
-                            "latency": latency,
-                            "rag_result": rag_result,
-                            "web_result": web_result
-                        }
-                    )
-                    session.add(chat_log)
-                    await session.commit()
-                    logger.info(f"Successfully saved chat log {final_request_id}")
-            except Exception as e:
-                logger.error(f"Failed to save chat log: {e}")
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    if streams.draining:
+        # Worker is shutting down; the client should retry against another instance
+        raise HTTPException(status_code=503, detail="Server is restarting, please retry")
+
+    logger.info("Received question ({question_chars} chars)", question_chars=len(request.question), session_id=request.session_id)
+    logger.debug("Question: {question}", question=request.question)
+
+    if _wants_json(stream, accept):
+        return await _answer_json(request, tenant_id)
+
+    # Upstream runs in a background producer so a dropped connection can resume
+    buffer = stream_hub.start(request.question, request.session_id, request.render_markdown, tenant_id)
+    return _sse_response(stream_hub.subscribe(buffer), encoding)
+
+@router.websocket("/ws")
+async def chat_ws(websocket: WebSocket):
+    """
+    WebSocket transport for clients running many conversations at once
+    (agent consoles): concurrent turns multiplexed by id over one connection,
+    SSE frame schema, per-turn cancel and credit-based flow control.
+    Protocol in app/services/ws_mux.py.
+    """
+    await WsConnection(websocket).serve()
+
+async def _read_capped(request: Request, max_bytes: int) -> bytes:
+    """
+    The request body, refused with 413 as soon as it is known to exceed
+    `max_bytes` (declared Content-Length, or bytes received so far).
+    """
+    too_large = HTTPException(status_code=413, detail=f"Body larger than {max_bytes} bytes")
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise too_large
+    return bytes(body)
+
+@router.post("/ask_batch")
+async def ask_batch(
+    request: Request,
+    concurrency: int = settings.BATCH_DEFAULT_CONCURRENCY,
+    persist: bool = True,
+    tenant_id: Optional[str] = Header(None, alias="X-Tenant-Id"),
+):
+    """
+    Batch endpoint for knowledge-base regression runs.
+    Body: JSONL, one {"question": ..., "session_id"?: ..., "id"?: ...} per line,
+    at most BATCH_MAX_BODY_BYTES.
+    Response: NDJSON, one result per question in completion order, then a summary line.
+    """
+    if streams.draining:
+        raise HTTPException(status_code=503, detail="Server is restarting, please retry")
+
+    try:
+        body = (await _read_capped(request, settings.BATCH_MAX_BODY_BYTES)).decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Body is not UTF-8: {e}")
+    items = []
+    for line_no, line in enumerate(body.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            item = BatchQuestion(**json.loads(line))
+        except (ValueError, TypeError, ValidationError) as e:
+            raise HTTPException(status_code=400, detail=f"Line {line_no}: {e}")
+        if not item.question.strip():
+            raise HTTPException(status_code=400, detail=f"Line {line_no}: question cannot be empty")
+        items.append(item)
+
+    if not items:
+        raise HTTPException(status_code=400, detail="No questions in body")
+    if len(items) > settings.BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_MAX_QUESTIONS} questions per batch")
+
+    concurrency = max(1, min(concurrency, settings.BATCH_MAX_CONCURRENCY))
+    logger.info(f"Batch of {len(items)} questions, concurrency {concurrency}")
+    return StreamingResponse(
+        BatchService.run(items, concurrency, persist, tenant_id),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,52 @@
+import asyncio
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from app.core.lifecycle import readiness, streams
+from app.db.session import engine
+from app.services.resilience import breaker
+
+router = APIRouter()
+
+CHECK_TIMEOUT_SECONDS = 2.0
+
+@router.get("/healthz")
+async def healthz():
+    """
+    Liveness probe. Only proves the event loop is responsive, no dependencies.
+    Upstream health is reported from the circuit breaker (outcome of real calls),
+    never probed here.
+    """
+    return {"status": "ok", "upstream": breaker.state_name}
+
+async def _check_db() -> bool:
+    try:
+        async with engine.connect() as conn:
+            await asyncio.wait_for(conn.execute(text("SELECT 1")), timeout=CHECK_TIMEOUT_SECONDS)
+        return True
+    except Exception:
+        return False
+
+@router.get("/readyz")
+async def readyz():
+    """
+    Readiness probe. 200 only once the DB pool and upstream connections are warm,
+    the DB still answers, and the worker is not draining for shutdown.
+
+    Upstream is only checked during warm-up: a DashScope outage affects every
+    replica alike, taking them all out of rotation would not help, and a HEAD
+    per probe per replica adds up. Its state (the circuit breaker) is reported
+    for information and exported as upstream_circuit_state.
+    """
+    status = readiness.status()
+    status["draining"] = streams.draining
+    status["active_streams"] = len(streams.active)
+
+    if status["ready"] and not streams.draining:
+        db_ok = await _check_db()
+        status["checks"] = {"db": db_ok, "upstream": breaker.state_name}
+        status["ready"] = db_ok
+    else:
+        status["ready"] = False
+
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
@@ -0,0 +1,30 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException
+from app.db.session import AsyncReadSessionLocal
+from app.services.rollup_service import RollupService, GRAINS, DIMENSIONS, default_range
+
+router = APIRouter()
+
+@router.get("")
+async def get_stats(
+    grain: str = "day",
+    dimension: str = "tenant",
+    key: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    """
+    Token usage and latency per hour/day from the usage_rollups table,
+    for one tenant/session (`key`) or summed over all of them.
+    Only touches rollup rows of the requested range, never chat_logs.
+    Defaults: last 30 days (day grain) / last 48 hours (hour grain).
+    """
+    if grain not in GRAINS:
+        raise HTTPException(status_code=400, detail=f"grain must be one of {GRAINS}")
+    if dimension not in DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"dimension must be one of {DIMENSIONS}")
+    since, until = default_range(grain, since, until)
+
+    async with AsyncReadSessionLocal() as session:
+        return await RollupService.query(session, grain, dimension, key, since, until)
@@ -0,0 +1,83 @@
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+
+class Automaton:
+    """
+    Aho-Corasick matcher: finds every occurrence of any of the patterns in
+    one pass over the text, whatever the number of patterns.
+
+    `scan` takes and returns the automaton state, so a text that arrives in
+    pieces can be scanned piece by piece and still match across the seams;
+    `depth(state)` is how many of the last characters are a pattern prefix
+    in progress, i.e. what a streaming caller has to keep (capped at
+    `longest - 1`: a match that a later character completes starts no
+    further back).
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = list(patterns)
+        self.longest = max(map(len, self.patterns), default=0)
+        goto: List[Dict[str, int]] = [{}]
+        depth = [0]
+        out: List[Tuple[int, ...]] = [()]
+        for index, pattern in enumerate(self.patterns):
+            if not pattern:
+                continue
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto.append({})
+                    depth.append(depth[state] + 1)
+                    out.append(())
+                    goto[state][ch] = nxt
+                state = nxt
+            out[state] += (index,)
+
+        # Failure links breadth-first, so a state's link target is always done before it
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] += out[fail[nxt]] # Patterns that end here as a suffix
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+        self._depth = depth
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def scan(self, text: str, state: int = 0) -> Tuple[List[Tuple[int, int]], int]:
+        """
+        Matches in `text` as (end, pattern index) with `end` exclusive, in
+        order of end position, and the state to continue from.
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        matches = []
+        for i, ch in enumerate(text):
+            while True:
+                nxt = goto[state].get(ch)
+                if nxt is not None:
+                    state = nxt
+                    break
+                if not state:
+                    break
+                state = fail[state]
+            if out[state]:
+                end = i + 1
+                for index in out[state]:
+                    matches.append((end, index))
+        return matches, state
+
+    def depth(self, state: int) -> int:
+        return self._depth[state]
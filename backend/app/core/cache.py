@@ -0,0 +1,116 @@
+import time
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+
+
+class MemoryCache:
+    """
+    Process-local cache with per-key TTL. Used when REDIS_URL is not set,
+    i.e. single worker / local development.
+    """
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._lists: Dict[str, Tuple[List[str], Optional[float]]] = {}
+
+    def _alive(self, key: str):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._alive(key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._data.pop(key, None)
+            self._lists.pop(key, None)
+
+    async def incr(self, key: str) -> int:
+        value = int(self._alive(key) or 0) + 1
+        expires_at = self._data.get(key, (None, None))[1]
+        self._data[key] = (str(value), expires_at)
+        return value
+
+    async def rpush(self, key: str, *values: str):
+        items, expires_at = self._lists.get(key, ([], None))
+        items.extend(values)
+        self._lists[key] = (items, expires_at)
+
+    async def lrange(self, key: str, start: int, end: int) -> List[str]:
+        item = self._lists.get(key)
+        if item is None:
+            return []
+        items, expires_at = item
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._lists[key]
+            return []
+        # Redis semantics: end is inclusive, -1 means last
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    async def expire(self, key: str, ttl: float):
+        expires_at = time.monotonic() + ttl
+        if key in self._lists:
+            self._lists[key] = (self._lists[key][0], expires_at)
+        if key in self._data:
+            self._data[key] = (self._data[key][0], expires_at)
+
+    async def close(self):
+        pass
+
+
+class RedisCache:
+    """
+    Redis-backed cache shared by every worker and node (REDIS_URL).
+    """
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis # Only needed when a shared cache is configured
+        self._client = redis.from_url(url, decode_responses=True)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._client.get(key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        await self._client.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self._client.delete(*keys)
+
+    async def incr(self, key: str) -> int:
+        return await self._client.incr(key)
+
+    async def rpush(self, key: str, *values: str):
+        await self._client.rpush(key, *values)
+
+    async def lrange(self, key: str, start: int, end: int) -> List[str]:
+        return await self._client.lrange(key, start, end)
+
+    async def expire(self, key: str, ttl: float):
+        await self._client.pexpire(key, int(ttl * 1000))
+
+    async def close(self):
+        await self._client.aclose()
+
+
+_cache = None
+
+
+def get_cache():
+    """
+    The shared cache for this process: Redis when REDIS_URL is set, otherwise in-memory.
+    Anything that must be consistent across gunicorn workers goes through here.
+    """
+    global _cache
+    if _cache is None:
+        _cache = RedisCache(settings.REDIS_URL) if settings.REDIS_URL else MemoryCache()
+    return _cache
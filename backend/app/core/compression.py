@@ -0,0 +1,150 @@
+import asyncio
+import gzip
+import zlib
+from typing import AsyncIterator, Optional, Sequence
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# Brotli is optional (pip install brotli): without it only gzip is negotiated.
+_brotli = None
+_brotli_checked = False
+
+
+def get_brotli():
+    global _brotli, _brotli_checked
+    if not _brotli_checked:
+        try:
+            import brotli
+            _brotli = brotli
+        except ImportError:
+            _brotli = None
+        _brotli_checked = True
+    return _brotli
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    "br" or "gzip" from an Accept-Encoding header (br preferred when available), or None.
+    """
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q=") and params[2:] in ("0", "0.0", "0.00", "0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    if "br" in accepted and get_brotli() is not None:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return get_brotli().compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL)
+
+
+class StreamCompressor:
+    """
+    One compression context for a whole SSE response. Every `compress(frame)`
+    output is flushed (gzip Z_SYNC_FLUSH / brotli flush), so the client can
+    decode each frame as soon as it arrives, while later frames still
+    back-reference earlier ones (the repeated sources compress to almost nothing).
+    """
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = get_brotli().Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31) # 31: gzip container
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+
+async def compress_stream(frames: AsyncIterator[str], encoding: str) -> AsyncIterator[bytes]:
+    compressor = StreamCompressor(encoding)
+    raw = sent = 0
+    try:
+        async for frame in frames:
+            data = frame.encode("utf-8")
+            chunk = compressor.compress(data)
+            raw += len(data)
+            sent += len(chunk)
+            yield chunk
+        chunk = compressor.finish()
+        sent += len(chunk)
+        yield chunk
+    finally:
+        metrics.inc("compression_bytes_in_total", raw, kind="sse", encoding=encoding)
+        metrics.inc("compression_bytes_out_total", sent, kind="sse", encoding=encoding)
+
+
+class CompressionMiddleware:
+    """
+    gzip / brotli for complete (non-streaming) responses under `paths` whose
+    body is at least `minimum_size` bytes. Streaming responses pass through
+    untouched; compressed SSE is opt-in per request (see compress_stream).
+    Large bodies are compressed in a worker thread to keep the event loop free.
+    """
+
+    def __init__(self, app: ASGIApp, paths: Sequence[str], minimum_size: int = 1024):
+        self.app = app
+        self.paths = tuple(paths)
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+
+        async def send_wrapper(message: Message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message # Held until we know whether the body gets compressed
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            headers = MutableHeaders(raw=start["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size or "content-encoding" in headers:
+                await send(start)
+                await send(message)
+                return
+
+            if len(body) >= settings.COMPRESSION_THREAD_MIN_BYTES:
+                compressed = await asyncio.to_thread(compress_body, body, encoding)
+            else:
+                compressed = compress_body(body, encoding)
+            metrics.inc("compression_bytes_in_total", len(body), kind="response", encoding=encoding)
+            metrics.inc("compression_bytes_out_total", len(compressed), kind="response", encoding=encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            await send(start)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
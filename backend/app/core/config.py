@@ -53,9 +53,152 @@ class Settings(BaseSettings):
             path=f"{values.get('POSTGRES_DB') or ''}",
         ).unicode_string()
 
+    # Connection pool (per engine, per worker process)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0 # Seconds to wait for a free connection before erroring
+    DB_POOL_RECYCLE: int = 1800 # Recycle connections older than this (seconds), replaces per-checkout pre-ping
+    DB_POOL_PRE_PING: bool = False # Extra round trip on every checkout, only enable behind flaky proxies
+
+    # Optional read replica. History reads go here when configured.
+    POSTGRES_READ_SERVER: Union[str, None] = None
+    POSTGRES_READ_PORT: int = 5432
+
+    SQLALCHEMY_READ_DATABASE_URI: Union[str, None] = None
+
+    @validator("SQLALCHEMY_READ_DATABASE_URI", pre=True)
+    def assemble_read_db_connection(cls, v: Union[str, None], values: dict) -> Any:
+        if isinstance(v, str):
+            return v or None
+        if not values.get("POSTGRES_READ_SERVER"):
+            return None
+        return PostgresDsn.build(
+            scheme="postgresql+asyncpg",
+            username=values.get("POSTGRES_USER"),
+            password=values.get("POSTGRES_PASSWORD"),
+            host=values.get("POSTGRES_READ_SERVER"),
+            port=int(values.get("POSTGRES_READ_PORT")),
+            path=f"{values.get('POSTGRES_DB') or ''}",
+        ).unicode_string()
+
     # Bailian / Dashscope
     DASHSCOPE_API_KEY: str = ""
     BAILIAN_APP_ID: str = ""
+    UPSTREAM_POOL_SIZE: int = 20 # Max keep-alive connections to DashScope per worker
+    UPSTREAM_WARM_CONNECTIONS: int = 2 # Connections opened at startup before /readyz goes green
+    UPSTREAM_CONNECT_TIMEOUT: float = 5.0 # Also the connect deadline of streaming calls
+    UPSTREAM_FIRST_CHUNK_TIMEOUT: float = 30.0 # From the start of a call to its first chunk, retries included
+    UPSTREAM_STALL_TIMEOUT: float = 30.0 # Max gap between two chunks
+    UPSTREAM_TOTAL_TIMEOUT: float = 120.0 # Whole answer
+
+    # Upstream resilience (app/services/resilience.py)
+    UPSTREAM_RETRIES: int = 2 # Retries when a call fails before its first chunk
+    UPSTREAM_BREAKER_FAILURES: int = 5 # Consecutive failed calls that open the circuit
+    UPSTREAM_BREAKER_COOLDOWN_SECONDS: float = 30.0 # Fail fast this long, then let one probe call through
+    HEDGE_ENABLED: bool = False # Second call when the first chunk is later than the TTFT percentile below
+    HEDGE_PERCENTILE: float = 95.0
+    HEDGE_MIN_DELAY_MS: int = 300
+    HEDGE_MAX_DELAY_MS: int = 5000 # Also the delay used until HEDGE_MIN_SAMPLES TTFTs are known
+    HEDGE_MIN_SAMPLES: int = 50
+    HEDGE_BUDGET_RATIO: float = 0.1 # Hedges never exceed this share of calls
+
+    # Mock upstream (app/services/mock_upstream.py) for load tests / local runs without credentials
+    BAILIAN_MOCK: bool = False
+    MOCK_TTFT_MS: int = 300
+    MOCK_CHUNK_INTERVAL_MS: int = 30
+    MOCK_CHUNK_CHARS: int = 12
+    MOCK_ANSWER_CHARS: int = 600
+    MOCK_SOURCES: int = 3
+    MOCK_ERROR_RATE: float = 0.0
+    MOCK_SLOW_RATE: float = 0.0 # Share of calls whose first chunk takes MOCK_SLOW_TTFT_MS (tail latency)
+    MOCK_SLOW_TTFT_MS: int = 3000
+    MOCK_MIDSTREAM_ERROR_RATE: float = 0.0 # Share of calls whose stream breaks after some chunks
+
+    # Startup warm-up
+    DB_WARM_CONNECTIONS: int = 2 # Pool connections opened at startup
+
+    # Multi-worker deployment (gunicorn.conf.py)
+    METRICS_MULTIPROC_DIR: Union[str, None] = None # Shared dir for per-worker metric snapshots
+    METRICS_FLUSH_SECONDS: float = 5.0
+    REDIS_URL: Union[str, None] = None # Shared cache across workers/nodes; in-process when unset
+    DB_MAX_CONNECTIONS: int = 100 # Server-side max_connections, used to sanity check pool budget
+
+    # Resumable streams (Last-Event-ID)
+    STREAM_REPLAY_TTL_SECONDS: float = 120.0 # How long a finished stream can still be resumed
+    STREAM_POLL_INTERVAL_SECONDS: float = 0.1 # Poll interval when following a stream owned by another worker
+    STREAM_MAX_BYTES: int = 4 * 1024 * 1024 # Per-stream cap on buffered frames; a longer answer is cut short (and saved)
+
+    # History reads (/chat/history ETag + page cache, see app/services/history_cache.py)
+    HISTORY_CACHE_TTL_SECONDS: float = 5.0 # Upper bound on staleness (e.g. read replica lag); 0 disables the page cache
+
+    # Bulk deletion and retention of chat_logs (see app/services/retention_service.py)
+    RETENTION_DAYS: int = 0 # Scheduled cleanup of rows older than this; 0 disables it
+    RETENTION_INTERVAL_SECONDS: float = 3600.0 # How often the scheduled cleanup runs
+    RETENTION_BATCH_SIZE: int = 5000 # Rows per DELETE statement (bounds lock time per transaction)
+    RETENTION_BATCH_PAUSE_SECONDS: float = 0.05 # Pause between batches, lets other writers through
+    RETENTION_PROGRESS_EVERY: int = 20 # Batches between progress logs / job status updates
+    RETENTION_JOB_TTL_SECONDS: float = 86400.0 # How long a finished job's status can be read
+
+    # Usage roll-up (usage_rollups, see app/services/rollup_service.py), out of band of the chat_logs inserts
+    ROLLUP_INTERVAL_SECONDS: float = 5.0 # Delay of /stats behind chat_logs
+    ROLLUP_BATCH_SIZE: int = 5000 # chat_logs rows per roll-up transaction
+    ROLLUP_LAG_SECONDS: float = 2.0 # Rows younger than this wait for the next run (lets lower ids still in flight commit)
+
+    # Admin endpoints (/api/v1/admin, X-Admin-Token header); disabled while unset
+    ADMIN_TOKEN: Union[str, None] = None
+
+    # Request profiling (see app/core/profiling.py)
+    PROFILE_DIR: str = "data/profiles" # Folded stacks + JSON sidecar per captured request
+    PROFILE_SAMPLE_INTERVAL_MS: float = 5.0 # Stack sampling period while a capture is active
+    PROFILE_SLOW_MS: int = 0 # Sample every request, keep those slower than this; 0 disables it
+    PROFILE_MAX_FILES: int = 200 # Oldest profiles are deleted beyond this
+
+    # Logging (see app/core/logging.py)
+    LOG_LEVEL: str = "INFO" # DEBUG brings back the per-chunk diagnostics
+    LOG_JSON: bool = False # One JSON object per record, for log shippers
+    LOG_ENQUEUE: bool = True # Write from a background thread, not the event loop
+    LOG_SAMPLE_PER_SECOND: float = 5.0 # Per-chunk / slow-chunk lines let through per second
+
+    # Instant answers for fixed intents (see app/services/instant_answers.py), ahead of the FAQ and the agent
+    INSTANT_ANSWERS_ENABLED: bool = False
+    INSTANT_RULES_PATH: str = "data/instant_rules.json" # Re-read when it changes
+
+    # Masking of terms in answers (see app/services/output_filter.py), streamed and saved alike
+    OUTPUT_FILTER_ENABLED: bool = False
+    OUTPUT_FILTER_TERMS_PATH: str = "data/output_filter_terms.txt" # One term per line, re-read when it changes
+    OUTPUT_FILTER_MASK_CHAR: str = "*"
+
+    # FAQ fast path, index built offline by scripts/build_faq.py
+    FAQ_ENABLED: bool = False
+    FAQ_INDEX_PATH: str = "data/faq_index.json"
+    FAQ_STATE_PATH: str = "data/faq_state.json" # Clustering checkpoint of the build job
+    FAQ_MATCH_THRESHOLD: float = 0.7 # Cosine similarity needed to answer from the index
+
+    # Speculative pre-warming (/chat/prepare)
+    PREWARM_TTL_SECONDS: int = 30
+    PREWARM_MAX_SLOTS: int = 200
+    PREWARM_SLOTS_PER_CLIENT_MINUTE: int = 10 # New slots one client address may open per minute (per worker)
+
+    # WebSocket transport (/chat/ws), many turns per connection
+    WS_MAX_STREAMS: int = 1000 # Open turns per connection
+    WS_INITIAL_CREDIT: int = 64 # Frames a turn may send before the client grants more
+    WS_OUTBOX_SIZE: int = 256 # Frames queued for the socket before pumps wait
+
+    # Response compression (app/core/compression.py)
+    COMPRESSION_MIN_BYTES: int = 1024 # Smaller responses are sent as is
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 5 # Brotli only when the optional `brotli` package is installed
+    COMPRESSION_THREAD_MIN_BYTES: int = 65536 # Compress bodies this large in a worker thread
+
+    # Batch endpoint (/chat/ask_batch)
+    BATCH_DEFAULT_CONCURRENCY: int = 8
+    BATCH_MAX_CONCURRENCY: int = 32
+    BATCH_MAX_QUESTIONS: int = 2000
+    BATCH_MAX_BODY_BYTES: int = 4 * 1024 * 1024 # Larger bodies are refused with 413 while reading
+
+    # Graceful shutdown
+    DRAIN_TIMEOUT_SECONDS: float = 25.0 # In-flight streams get this long to finish after SIGTERM
+    DRAIN_WRITE_TIMEOUT_SECONDS: float = 5.0 # Extra time to flush pending ChatLog writes
 
     class Config:
         case_sensitive = True
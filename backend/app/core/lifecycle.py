@@ -0,0 +1,169 @@
+import asyncio
+import signal
+import time
+from typing import Dict
+from loguru import logger
+from app.core.config import settings
+from app.core.metrics import metrics
+
+
+class Readiness:
+    """
+    Tracks which startup components are warm.
+    /readyz only goes green once every component has been marked ready,
+    so the load balancer / autoscaler doesn't route to a cold worker.
+    """
+    COMPONENTS = ("db", "upstream")
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.ready_at = None
+        self._components: Dict[str, bool] = {c: False for c in self.COMPONENTS}
+
+    def mark_ready(self, component: str):
+        self._components[component] = True
+        if self.ready_at is None and self.is_ready():
+            self.ready_at = time.time()
+
+    def is_ready(self) -> bool:
+        return all(self._components.values())
+
+    def status(self) -> dict:
+        return {
+            "ready": self.is_ready(),
+            "components": dict(self._components),
+            "startup_ms": int((self.ready_at - self.started_at) * 1000) if self.ready_at else None,
+        }
+
+
+readiness = Readiness()
+
+
+class StreamHandle:
+    __slots__ = ("id", "task", "aborted")
+
+    def __init__(self, stream_id: str, task):
+        self.id = stream_id
+        self.task = task
+        self.aborted = False
+
+
+class StreamTracker:
+    """
+    Keeps track of in-flight SSE streams and pending ChatLog writes,
+    and implements drain mode for graceful shutdown:
+
+    - SIGTERM flips `draining`, new streams are refused (503) and /readyz goes red
+    - in-flight streams get DRAIN_TIMEOUT_SECONDS to finish
+    - streams still running after that are aborted (error frame + partial save)
+    - pending DB writes are awaited in the shutdown hook
+    """
+
+    def __init__(self):
+        self.draining = False
+        self.active: Dict[str, StreamHandle] = {}
+        self.pending_writes = set()
+        self.drained = 0
+        self.aborted = 0
+        self._idle = None
+        self._drain_task = None
+
+    def open_stream(self, stream_id: str) -> StreamHandle:
+        handle = StreamHandle(stream_id, asyncio.current_task())
+        self.active[stream_id] = handle
+        metrics.inc("chat_streams_started_total")
+        return handle
+
+    def close_stream(self, handle: StreamHandle):
+        self.active.pop(handle.id, None)
+        if handle.aborted:
+            self.aborted += 1
+            metrics.inc("chat_streams_aborted_total")
+        elif self.draining:
+            self.drained += 1
+            metrics.inc("chat_streams_drained_total")
+        if not self.active and self._idle is not None:
+            self._idle.set()
+
+    def track_write(self, coro) -> asyncio.Task:
+        """
+        Run a DB write in the background, detached from the client connection,
+        and keep a reference so shutdown can flush it.
+        """
+        task = asyncio.create_task(coro)
+        self.pending_writes.add(task)
+        task.add_done_callback(self.pending_writes.discard)
+        return task
+
+    def begin_drain(self):
+        if self.draining:
+            return
+        self.draining = True
+        logger.warning(f"Drain mode: refusing new streams, waiting for {len(self.active)} in-flight")
+        self._drain_task = asyncio.create_task(self._enforce_deadline())
+
+    async def _enforce_deadline(self):
+        self._idle = asyncio.Event()
+        if not self.active:
+            self._idle.set()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=settings.DRAIN_TIMEOUT_SECONDS)
+            return
+        except asyncio.TimeoutError:
+            pass
+
+        logger.warning(f"Drain deadline reached, aborting {len(self.active)} streams")
+        for handle in list(self.active.values()):
+            # The stream checks the flag between frames and sends an error frame itself
+            handle.aborted = True
+
+        # Streams stuck waiting on upstream never reach that check, cancel them
+        await asyncio.sleep(1)
+        for handle in list(self.active.values()):
+            if handle.task is not None and not handle.task.done():
+                handle.task.cancel()
+
+    async def shutdown(self):
+        self.begin_drain()
+        if self._drain_task is not None:
+            await self._drain_task
+
+        pending = list(self.pending_writes)
+        if pending:
+            done, not_done = await asyncio.wait(pending, timeout=settings.DRAIN_WRITE_TIMEOUT_SECONDS)
+        else:
+            done, not_done = (), ()
+        if not_done:
+            # Cancel rather than abandon them, so they can record that they were cut short
+            # (e.g. a deletion job's status) while the cache and DB are still open
+            for task in not_done:
+                task.cancel()
+            await asyncio.wait(not_done, timeout=1)
+
+        logger.info(
+            f"Drain finished: {self.drained} streams drained, {self.aborted} aborted, "
+            f"{len(done)} pending writes flushed, {len(not_done)} writes lost"
+        )
+
+    def install_signal_handlers(self):
+        """
+        Chain onto the server's SIGTERM/SIGINT handlers: start draining first,
+        then let uvicorn stop accepting connections and wait for the open ones.
+        """
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            previous = signal.getsignal(sig)
+
+            def handler(signum, frame, previous=previous):
+                loop.call_soon_threadsafe(self.begin_drain)
+                if callable(previous):
+                    previous(signum, frame)
+
+            try:
+                signal.signal(sig, handler)
+            except ValueError:
+                # Not in the main thread (e.g. TestClient), nothing to hook
+                return
+
+
+streams = StreamTracker()
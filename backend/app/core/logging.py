@@ -0,0 +1,77 @@
+import sys
+import threading
+import time
+from typing import Dict, Optional
+from loguru import logger
+from app.core.config import settings
+
+# Log calls on the streaming hot path use loguru's brace style,
+#     logger.info("TTFT {ttft_ms}ms", ttft_ms=...)
+# instead of f-strings: the message is only formatted when the level is enabled,
+# and the keyword arguments land in record["extra"] as structured fields.
+
+_min_level_no = 0
+
+
+def setup_logging():
+    """
+    Replace loguru's default synchronous stderr handler with a queue-backed one:
+    the calling thread (usually the event loop) only formats and enqueues the
+    record, a background thread does the actual write.
+    LOG_JSON=true emits one JSON object per record (extra fields included).
+    """
+    global _min_level_no
+    logger.remove()
+    logger.add(
+        sys.stderr,
+        level=settings.LOG_LEVEL,
+        enqueue=settings.LOG_ENQUEUE,
+        serialize=settings.LOG_JSON,
+        backtrace=False,
+        diagnose=False, # Don't dump local variables (user questions) into tracebacks
+    )
+    _min_level_no = logger.level(settings.LOG_LEVEL).no
+
+
+def debug_enabled() -> bool:
+    """
+    Cheap guard for debug-only work (building values just to log them).
+    """
+    return _min_level_no <= 10
+
+
+class LogSampler:
+    """
+    Per-key token bucket for high-frequency log lines (per chunk, per frame).
+    Across all requests of the process, at most `per_second` lines per key
+    (bursts up to `burst`) get through; the rest are counted and reported
+    with the next line that is let through.
+    """
+
+    def __init__(self, per_second: float, burst: int = 5):
+        self.per_second = per_second
+        self.burst = burst
+        self._tokens: Dict[str, float] = {}
+        self._updated: Dict[str, float] = {}
+        self._dropped: Dict[str, int] = {}
+        self._lock = threading.Lock() # The Bailian producer threads log too
+
+    def sample(self, key: str) -> Optional[int]:
+        """
+        None if this line should be dropped, otherwise how many lines of
+        this key were dropped since the last one that was logged.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._tokens.get(key, float(self.burst))
+            tokens = min(float(self.burst), tokens + (now - self._updated.get(key, now)) * self.per_second)
+            self._updated[key] = now
+            if tokens < 1.0:
+                self._tokens[key] = tokens
+                self._dropped[key] = self._dropped.get(key, 0) + 1
+                return None
+            self._tokens[key] = tokens - 1.0
+            return self._dropped.pop(key, 0)
+
+
+log_sampler = LogSampler(settings.LOG_SAMPLE_PER_SECOND)
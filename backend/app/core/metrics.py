@@ -0,0 +1,276 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Tuple
+
+# Label sets are stored as sorted tuples so they can be used as dict keys
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Seconds. Covers everything from a warm pool checkout to a slow upstream call.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labels: dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class MetricsRegistry:
+    """
+    Minimal in-process metrics registry (counters, gauges, histograms).
+    Thread-safe, because the Bailian producer threads report into it too.
+    Rendered in Prometheus text format by GET /metrics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauge_callbacks: Dict[str, Dict[LabelKey, Callable[[], float]]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def register_gauge(self, name: str, callback: Callable[[], float], **labels):
+        """
+        Register a gauge whose value is read lazily at scrape time
+        (e.g. the current number of checked-out pool connections).
+        """
+        with self._lock:
+            self._gauge_callbacks.setdefault(name, {})[_label_key(labels)] = callback
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = _Histogram(buckets)
+            hist.observe(value)
+
+    def snapshot(self) -> dict:
+        """
+        Plain-dict copy of every series, evaluated callbacks included.
+        """
+        with self._lock:
+            gauges = {name: dict(series) for name, series in self._gauges.items()}
+            callbacks = {name: dict(series) for name, series in self._gauge_callbacks.items()}
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {
+                name: {
+                    key: {"buckets": h.buckets, "counts": list(h.counts), "sum": h.sum, "count": h.count}
+                    for key, h in series.items()
+                }
+                for name, series in self._histograms.items()
+            }
+
+        # Callbacks run outside the lock, they may touch other locks (pool internals)
+        for name, series in callbacks.items():
+            for key, callback in series.items():
+                try:
+                    gauges.setdefault(name, {})[key] = float(callback())
+                except Exception:
+                    continue
+
+        return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+    def render_prometheus(self) -> str:
+        return render_prometheus(self.snapshot())
+
+
+def render_prometheus(snapshot: dict) -> str:
+    lines = []
+    for name, series in sorted(snapshot["counters"].items()):
+        lines.append(f"# TYPE {name} counter")
+        for key, value in series.items():
+            lines.append(f"{name}{_format_labels(key)} {value}")
+
+    for name, series in sorted(snapshot["gauges"].items()):
+        lines.append(f"# TYPE {name} gauge")
+        for key, value in series.items():
+            lines.append(f"{name}{_format_labels(key)} {value}")
+
+    for name, series in sorted(snapshot["histograms"].items()):
+        lines.append(f"# TYPE {name} histogram")
+        for key, h in series.items():
+            cumulative = 0
+            for bound, count in zip(h["buckets"], h["counts"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', str(bound))])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {h['count']}")
+            lines.append(f"{name}_sum{_format_labels(key)} {h['sum']}")
+            lines.append(f"{name}_count{_format_labels(key)} {h['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+def percentile(values, p: float) -> float:
+    """
+    Nearest-rank percentile of a list of numbers (p in 0..100), 0 if empty.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+metrics = MetricsRegistry()
+
+
+# --- Multi-worker aggregation -------------------------------------------------
+# Under gunicorn each worker has its own registry. Workers periodically dump a
+# snapshot to METRICS_MULTIPROC_DIR/<pid>.json and /metrics merges all files:
+# counters and histograms are summed, gauges are summed over live workers only.
+# When a worker exits, gunicorn's child_exit hook folds its counters and
+# histograms into dead.json and removes its file, so restarts don't pile up files.
+
+DEAD_FILE = "dead.json"
+_MERGED_KEPT = 100 # Folded snapshot ids remembered in dead.json
+
+# Tells this process's snapshots apart from those of an earlier worker that had the same pid
+_PROCESS_STARTED = time.time()
+
+
+def _encode(snapshot: dict) -> dict:
+    encoded = {}
+    for kind in ("counters", "gauges"):
+        encoded[kind] = {
+            name: [[list(map(list, key)), value] for key, value in series.items()]
+            for name, series in snapshot[kind].items()
+        }
+    encoded["histograms"] = {
+        name: [[list(map(list, key)), h] for key, h in series.items()]
+        for name, series in snapshot["histograms"].items()
+    }
+    return encoded
+
+
+def _decode(encoded: dict) -> dict:
+    snapshot = {"counters": {}, "gauges": {}, "histograms": {}}
+    for kind in snapshot:
+        for name, series in encoded.get(kind, {}).items():
+            snapshot[kind][name] = {
+                tuple(tuple(pair) for pair in key): value for key, value in series
+            }
+    return snapshot
+
+
+def _write_json(path: str, encoded: dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(encoded, f)
+    os.replace(tmp_path, path) # Atomic, readers never see half a file
+
+
+def _read_json(path: str):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None # Missing, or removed concurrently
+
+
+def write_snapshot(directory: str, pid: int, snapshot: dict):
+    encoded = _encode(snapshot)
+    encoded["process"] = f"{pid}:{_PROCESS_STARTED}"
+    _write_json(os.path.join(directory, f"{pid}.json"), encoded)
+
+
+def mark_process_dead(directory: str, pid: int):
+    """
+    Called from the gunicorn master when a worker exits: fold its counters
+    and histograms (they must stay monotonic) into dead.json, drop its
+    gauges, and remove its file.
+
+    dead.json lists the snapshots it already holds ("merged"), written before
+    the worker file is removed, so a concurrent /metrics never counts one twice
+    (see aggregate). Only the last few are kept, the race lasts one scrape.
+    """
+    path = os.path.join(directory, f"{pid}.json")
+    encoded = _read_json(path)
+    if encoded is None:
+        return
+    snapshot = _decode(encoded)
+    snapshot["gauges"] = {}
+
+    dead_path = os.path.join(directory, DEAD_FILE)
+    dead = _read_json(dead_path) or {}
+    merged = _encode(merge_snapshots([_decode(dead), snapshot]))
+    merged["merged"] = (dead.get("merged", []) + [encoded.get("process")])[-_MERGED_KEPT:]
+    _write_json(dead_path, merged)
+    os.remove(path)
+
+
+def merge_snapshots(snapshots: Iterable[dict]) -> dict:
+    merged = {"counters": {}, "gauges": {}, "histograms": {}}
+    for snapshot in snapshots:
+        for kind in ("counters", "gauges"):
+            for name, series in snapshot[kind].items():
+                target = merged[kind].setdefault(name, {})
+                for key, value in series.items():
+                    target[key] = target.get(key, 0.0) + value
+        for name, series in snapshot["histograms"].items():
+            target = merged["histograms"].setdefault(name, {})
+            for key, h in series.items():
+                if key not in target:
+                    target[key] = {"buckets": tuple(h["buckets"]), "counts": list(h["counts"]), "sum": h["sum"], "count": h["count"]}
+                else:
+                    agg = target[key]
+                    agg["counts"] = [a + b for a, b in zip(agg["counts"], h["counts"])]
+                    agg["sum"] += h["sum"]
+                    agg["count"] += h["count"]
+    return merged
+
+
+def aggregate(directory: str, own_pid: int, own_snapshot: dict) -> dict:
+    """
+    Merge the snapshot files of every worker; the calling worker uses its live snapshot.
+    """
+    workers = []
+    for filename in os.listdir(directory):
+        if not filename.endswith(".json") or filename in (f"{own_pid}.json", DEAD_FILE):
+            continue
+        encoded = _read_json(os.path.join(directory, filename))
+        if encoded is not None:
+            workers.append(encoded)
+    # Read last: a worker file that was gone by now is already in it, one folded meanwhile is skipped
+    dead = _read_json(os.path.join(directory, DEAD_FILE)) or {}
+    folded = set(dead.get("merged", []))
+
+    snapshots = [own_snapshot, _decode(dead)]
+    snapshots.extend(_decode(encoded) for encoded in workers if encoded.get("process") not in folded)
+    return merge_snapshots(snapshots)
@@ -0,0 +1,207 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from loguru import logger
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# Per-request stage timers (seconds), shared by every task the request spawns
+_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("profile_stages", default=None)
+
+
+def begin_stages() -> Dict[str, float]:
+    """
+    Start stage accounting for the request running in the current task
+    (tasks it creates afterwards inherit the same dict).
+    """
+    stages: Dict[str, float] = {}
+    _stages.set(stages)
+    return stages
+
+
+def add_stage(name: str, started: float, clock=time.thread_time):
+    """
+    Charge `clock() - started` to stage `name` of the current request.
+    The default clock is this thread's CPU time, so waits are not counted;
+    only use it around code that doesn't await.
+    """
+    stages = _stages.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + clock() - started
+
+
+def flush_stages(stages: Dict[str, float]):
+    """
+    Record a finished request's stages in the chat_stage_seconds histogram.
+    """
+    for name, seconds in stages.items():
+        metrics.observe("chat_stage_seconds", seconds, stage=name)
+
+
+class Capture:
+    __slots__ = ("request_id", "reason", "task", "started", "samples", "stacks")
+
+    def __init__(self, request_id: str, reason: str, task):
+        self.request_id = request_id
+        self.reason = reason # armed | slow
+        self.task = task
+        self.started = time.monotonic()
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+
+class Profiler:
+    """
+    Sampling profiler for chat requests, stdlib only.
+
+    While at least one request is being captured, a thread reads the event
+    loop thread's stack every PROFILE_SAMPLE_INTERVAL_MS and charges the
+    sample to the asyncio task running at that moment, so concurrent
+    requests get separate profiles. Captures either the next N requests
+    (arm) or, with PROFILE_SLOW_MS set, every request and keeps only those
+    that took longer. Profiles are written to PROFILE_DIR in the folded
+    stack format (flamegraph.pl, speedscope, inferno) with a JSON sidecar.
+
+    Only the request's producer task is sampled: upstream reader threads and
+    the SSE writers of connected clients are not part of a profile.
+    """
+
+    def __init__(self):
+        self.armed = 0
+        self.captures: Dict[object, Capture] = {}
+        self._loop = None
+        self._loop_thread_id = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock() # Sampler start/exit vs. new captures
+        self._labels: Dict[object, str] = {}
+        metrics.register_gauge("profiler_active_captures", lambda: len(self.captures))
+
+    def arm(self, requests: int):
+        self.armed = max(0, requests)
+
+    def begin(self, request_id: str) -> Optional[Capture]:
+        if self.armed > 0:
+            self.armed -= 1
+            reason = "armed"
+        elif settings.PROFILE_SLOW_MS > 0:
+            reason = "slow"
+        else:
+            return None
+        task = asyncio.current_task()
+        capture = Capture(request_id, reason, task)
+        with self._lock:
+            self.captures[task] = capture
+            if self._thread is None:
+                self._loop = asyncio.get_running_loop()
+                self._loop_thread_id = threading.get_ident()
+                self._thread = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+                self._thread.start()
+        return capture
+
+    async def end(self, capture: Capture, stages: Optional[Dict[str, float]] = None, **extra) -> Optional[str]:
+        """
+        Stop sampling the request; write its profile unless it was only
+        captured in case it turned out slow and didn't.
+        """
+        self.captures.pop(capture.task, None)
+        elapsed_ms = int((time.monotonic() - capture.started) * 1000)
+        if capture.reason == "slow" and elapsed_ms < settings.PROFILE_SLOW_MS:
+            return None
+        meta = {
+            "request_id": capture.request_id,
+            "reason": capture.reason,
+            "latency_ms": elapsed_ms,
+            "samples": capture.samples,
+            "sample_interval_ms": settings.PROFILE_SAMPLE_INTERVAL_MS,
+            "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in (stages or {}).items()},
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            **extra,
+        }
+        name = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}_{capture.reason}_{capture.request_id}"
+        try:
+            await asyncio.to_thread(self._write, name, capture.stacks, meta)
+        except OSError as e:
+            logger.warning(f"Failed to write profile {name}: {e}")
+            return None
+        metrics.inc("profiles_written_total", reason=capture.reason)
+        logger.info(f"Profile {name} written ({capture.samples} samples, {elapsed_ms}ms)")
+        return name
+
+    def list(self) -> List[dict]:
+        profiles = []
+        if not os.path.isdir(settings.PROFILE_DIR):
+            return profiles
+        for entry in sorted(os.listdir(settings.PROFILE_DIR), reverse=True):
+            if not entry.endswith(".json"):
+                continue
+            name = entry[:-len(".json")]
+            try:
+                with open(os.path.join(settings.PROFILE_DIR, entry)) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            profiles.append({"name": name, **meta})
+        return profiles
+
+    def path(self, name: str) -> Optional[str]:
+        """
+        Path of a listed profile's folded stacks, or None (never outside PROFILE_DIR).
+        """
+        if os.path.basename(name) != name or name.startswith("."):
+            return None
+        path = os.path.join(settings.PROFILE_DIR, f"{name}.folded")
+        return path if os.path.isfile(path) else None
+
+    def _write(self, name: str, stacks: Counter, meta: dict):
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(settings.PROFILE_DIR, f"{name}.folded"), "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(settings.PROFILE_DIR, f"{name}.json"), "w") as f:
+            json.dump(meta, f)
+
+        # Keep the newest PROFILE_MAX_FILES profiles
+        names = sorted(e[:-len(".json")] for e in os.listdir(settings.PROFILE_DIR) if e.endswith(".json"))
+        for old in names[:-settings.PROFILE_MAX_FILES]:
+            for suffix in (".json", ".folded"):
+                try:
+                    os.remove(os.path.join(settings.PROFILE_DIR, old + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def _sample(self):
+        interval = settings.PROFILE_SAMPLE_INTERVAL_MS / 1000
+        while True:
+            with self._lock:
+                if not self.captures:
+                    self._thread = None
+                    return
+            frame = sys._current_frames().get(self._loop_thread_id)
+            capture = self.captures.get(asyncio.current_task(self._loop)) if frame is not None else None
+            if capture is not None:
+                capture.stacks[self._fold(frame)] += 1
+                capture.samples += 1
+            del frame
+            time.sleep(interval)
+
+    def _fold(self, frame) -> str:
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            labels.append(label)
+            frame = frame.f_back
+        labels.reverse()
+        return ";".join(labels)
+
+
+profiler = Profiler()
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import Counter
+from app.core.metrics import metrics
+
+# "Thread-12 (run_producer)" -> "Thread (run_producer)", so threads group by what they run
+_THREAD_NO_RE = re.compile(r"-\d+")
+
+_started = time.monotonic()
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0 # Not Linux
+
+
+def open_fds() -> int:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return 0
+
+
+def _tasks():
+    try:
+        return asyncio.all_tasks()
+    except RuntimeError:
+        return set() # Scraped outside the event loop (e.g. the final metrics snapshot)
+
+
+def _task_name(task) -> str:
+    coro = task.get_coro()
+    return getattr(coro, "__qualname__", None) or type(coro).__name__
+
+
+def process_stats(top: int = 20) -> dict:
+    """
+    Counts that leak when something is not cleaned up: threads, asyncio tasks,
+    memory and file descriptors, with the most common thread targets and task
+    coroutines so growth points at the code that owns it.
+    """
+    threads = threading.enumerate()
+    tasks = _tasks()
+    return {
+        "pid": os.getpid(),
+        "uptime_s": round(time.monotonic() - _started, 1),
+        "rss_bytes": rss_bytes(),
+        "open_fds": open_fds(),
+        "threads": len(threads),
+        "threads_by_name": dict(Counter(_THREAD_NO_RE.sub("", t.name) for t in threads).most_common(top)),
+        "tasks": len(tasks),
+        "tasks_by_coro": dict(Counter(_task_name(t) for t in tasks).most_common(top)),
+    }
+
+
+metrics.register_gauge("process_threads", threading.active_count)
+metrics.register_gauge("process_rss_bytes", rss_bytes)
+metrics.register_gauge("process_open_fds", open_fds)
+metrics.register_gauge("asyncio_tasks", lambda: len(_tasks()))
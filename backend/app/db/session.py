@@ -1,19 +1,97 @@
+import asyncio
+import time
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.core.config import settings
+from app.core.metrics import metrics
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that records how long callers wait for a connection.
+    `role` is set on the per-engine subclass created by `_pool_class`.
+    """
+    role = "primary"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.observe("db_pool_wait_seconds", time.perf_counter() - start, role=self.role)
+
+
+def _pool_class(role: str):
+    # Subclass per engine so the label survives pool.recreate() (which re-instantiates the class)
+    return type(f"InstrumentedQueuePool_{role}", (InstrumentedQueuePool,), {"role": role})
+
+
+def _instrument(engine, role: str):
+    # Callbacks look the pool up again on every scrape, dispose() swaps it out
+    metrics.register_gauge("db_pool_size", lambda: engine.sync_engine.pool.size(), role=role)
+    metrics.register_gauge("db_pool_checked_out", lambda: engine.sync_engine.pool.checkedout(), role=role)
+    # QueuePool.overflow() starts at -pool_size, only the positive part is real overflow
+    metrics.register_gauge("db_pool_overflow", lambda: max(0, engine.sync_engine.pool.overflow()), role=role)
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def _on_error(context):
+        if getattr(context, "is_pre_ping", False):
+            metrics.inc("db_pool_pre_ping_failures_total", role=role)
+
+    @event.listens_for(engine.sync_engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.inc("db_pool_invalidated_total", role=role)
 
-engine = create_async_engine(
-    settings.SQLALCHEMY_DATABASE_URI, 
-    echo=False, # Reduce noise
-    pool_pre_ping=True, # Verify connection before usage
-    pool_size=10,
-    max_overflow=20
-)
+
+def _create_engine(url: str, role: str):
+    engine = create_async_engine(
+        url,
+        echo=False, # Reduce noise
+        poolclass=_pool_class(role),
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+    )
+    _instrument(engine, role)
+    return engine
+
+
+engine = _create_engine(settings.SQLALCHEMY_DATABASE_URI, "primary")
+
+# Reads that tolerate replica lag (history listing) use this engine.
+# Falls back to the primary when no replica is configured.
+if settings.SQLALCHEMY_READ_DATABASE_URI:
+    read_engine = _create_engine(settings.SQLALCHEMY_READ_DATABASE_URI, "replica")
+else:
+    read_engine = engine
 
 AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
+AsyncReadSessionLocal = sessionmaker(
+    read_engine, class_=AsyncSession, expire_on_commit=False
+)
+
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
+
+async def get_read_db():
+    async with AsyncReadSessionLocal() as session:
+        yield session
+
+async def warm_up_pool(target_engine, connections: int):
+    """
+    Open `connections` pool connections concurrently and return them to the pool,
+    so the first requests don't pay for TCP/TLS/auth setup.
+    """
+    async def touch():
+        async with target_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(touch() for _ in range(max(1, connections))))
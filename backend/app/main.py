@@ -1,7 +1,17 @@
+import asyncio
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.core.config import settings
-from app.api.routers import chat
+from app.core.compression import CompressionMiddleware
+from app.core.logging import setup_logging
+from app.core.metrics import metrics, aggregate, render_prometheus, write_snapshot
+from app.core.lifecycle import readiness, streams
+from app.api.routers import admin, chat, health, stats
+from loguru import logger
+
+setup_logging()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -19,19 +29,127 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip / brotli for the large JSON reads (history rows carry full RAG payloads)
+app.add_middleware(
+    CompressionMiddleware,
+    paths=[f"{settings.API_V1_STR}/chat/history", f"{settings.API_V1_STR}/stats"],
+    minimum_size=settings.COMPRESSION_MIN_BYTES,
+)
+
 app.include_router(chat.router, prefix=f"{settings.API_V1_STR}/chat", tags=["chat"])
+app.include_router(stats.router, prefix=f"{settings.API_V1_STR}/stats", tags=["stats"])
+app.include_router(admin.router, prefix=f"{settings.API_V1_STR}/admin", tags=["admin"])
+app.include_router(health.router, tags=["health"])
 
 @app.on_event("startup")
 async def startup_event():
     from app.db.session import engine
     from app.db.base_class import Base
     # Import models to ensure they are registered
-    from app.models import chat_log
+    from app.models import chat_log, usage_rollup
     
     async with engine.begin() as conn:
         # Create tables if they don't exist
         await conn.run_sync(Base.metadata.create_all)
 
+    # Before serving: turns saved from now on are rolled up by rollup_loop
+    from app.services.rollup_service import RollupService
+    await RollupService.ensure_checkpoint()
+    app.state.rollup_task = asyncio.create_task(RollupService.rollup_loop())
+
+    # Warm pools in the background; /readyz stays red until both are done
+    app.state.warm_up_task = asyncio.create_task(warm_up())
+
+    # SIGTERM -> drain mode (see StreamTracker)
+    streams.install_signal_handlers()
+
+    if settings.METRICS_MULTIPROC_DIR:
+        app.state.metrics_flush_task = asyncio.create_task(flush_metrics())
+
+    # Indexes added after a database was created; built in the background, startup doesn't wait
+    app.state.index_task = asyncio.create_task(ensure_indexes())
+
+    if settings.RETENTION_DAYS > 0:
+        from app.services.retention_service import RetentionService
+        app.state.retention_task = asyncio.create_task(RetentionService.retention_loop())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Wait for in-flight streams (bounded) and flush pending ChatLog writes
+    await streams.shutdown()
+
+    from app.services.prewarm import prewarm_pool
+    prewarm_pool.close()
+
+    if settings.METRICS_MULTIPROC_DIR:
+        write_snapshot(settings.METRICS_MULTIPROC_DIR, os.getpid(), metrics.snapshot())
+
+    from app.core.cache import get_cache
+    await get_cache().close()
+
+    # Flush the queued log sink before the process exits
+    await logger.complete()
+
+async def flush_metrics():
+    """
+    Multi-worker mode: dump this worker's metrics so /metrics on any worker can aggregate.
+    """
+    os.makedirs(settings.METRICS_MULTIPROC_DIR, exist_ok=True)
+    while True:
+        try:
+            write_snapshot(settings.METRICS_MULTIPROC_DIR, os.getpid(), metrics.snapshot())
+        except OSError as e:
+            logger.warning(f"Failed to write metrics snapshot: {e}")
+        await asyncio.sleep(settings.METRICS_FLUSH_SECONDS)
+
+async def ensure_indexes():
+    from app.services.retention_service import RetentionService
+    try:
+        await RetentionService.ensure_index()
+    except Exception as e:
+        logger.error(f"Index migration failed, run scripts/retention.py --create-index: {e}")
+
+async def warm_up():
+    from app.db.session import engine, read_engine, warm_up_pool
+    from app.services import upstream
+
+    async def warm_db():
+        while True:
+            try:
+                await warm_up_pool(engine, settings.DB_WARM_CONNECTIONS)
+                if read_engine is not engine:
+                    await warm_up_pool(read_engine, settings.DB_WARM_CONNECTIONS)
+                readiness.mark_ready("db")
+                return
+            except Exception as e:
+                logger.warning(f"DB warm-up failed: {e}. Retrying...")
+                await asyncio.sleep(2)
+
+    async def warm_upstream():
+        # SDK import + TLS handshakes are blocking, keep them off the event loop
+        while not await asyncio.to_thread(upstream.warm_up):
+            await asyncio.sleep(5)
+        readiness.mark_ready("upstream")
+
+    async def warm_faq():
+        # The index file can be large, parse it off the event loop before the first lookup
+        from app.services.faq_index import faq_index
+        if settings.FAQ_ENABLED:
+            await asyncio.to_thread(faq_index.maybe_reload)
+
+    await asyncio.gather(warm_db(), warm_upstream(), warm_faq())
+    logger.info(f"Warm-up finished in {readiness.status()['startup_ms']}ms since app import")
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to LUMI Customer Service Agent API"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus text exposition of in-process metrics (DB pool, etc).
+    With METRICS_MULTIPROC_DIR set, the sum over all workers of this instance.
+    """
+    if settings.METRICS_MULTIPROC_DIR and os.path.isdir(settings.METRICS_MULTIPROC_DIR):
+        return render_prometheus(aggregate(settings.METRICS_MULTIPROC_DIR, os.getpid(), metrics.snapshot()))
+    return metrics.render_prometheus()
@@ -69,4 +69,4 @@ class ChatLog(Base):
         
         return sources_list # Store retrieval sources
     metadata_info = Column(JSON, nullable=True) # Rename from metadata to avoid conflict with SQLAlchemy
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True) # Indexed for retention deletes
@@ -0,0 +1,51 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, UniqueConstraint
+from app.db.base_class import Base
+
+# Upper bounds (ms) of the latency histogram columns below, lat_gt_30000 is the overflow
+LATENCY_BUCKETS_MS = (250, 500, 1000, 2000, 5000, 10000, 30000)
+LATENCY_COLUMNS = [f"lat_le_{b}" for b in LATENCY_BUCKETS_MS] + ["lat_gt_30000"]
+
+class UsageRollup(Base):
+    """
+    Pre-aggregated usage/latency per time bucket, maintained on every ChatLog
+    write (see RollupService). One row per (grain, bucket_start, dimension, dim_key).
+    """
+    __tablename__ = "usage_rollups"
+    __table_args__ = (
+        # Also the lookup index for /stats (grain + dimension + key, then time range)
+        UniqueConstraint("grain", "dimension", "dim_key", "bucket_start", name="uq_usage_rollups_bucket"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    grain = Column(String(8), nullable=False) # hour | day
+    bucket_start = Column(DateTime(timezone=True), nullable=False) # UTC start of the hour/day
+    dimension = Column(String(16), nullable=False) # tenant | session
+    dim_key = Column(String, nullable=False)
+
+    turns = Column(BigInteger, nullable=False, default=0)
+    errors = Column(BigInteger, nullable=False, default=0)
+    input_tokens = Column(BigInteger, nullable=False, default=0)
+    output_tokens = Column(BigInteger, nullable=False, default=0)
+    latency_count = Column(BigInteger, nullable=False, default=0) # Turns that reported a latency
+    latency_sum_ms = Column(BigInteger, nullable=False, default=0)
+
+    # Latency histogram, for approximate percentiles without touching chat_logs
+    lat_le_250 = Column(BigInteger, nullable=False, default=0)
+    lat_le_500 = Column(BigInteger, nullable=False, default=0)
+    lat_le_1000 = Column(BigInteger, nullable=False, default=0)
+    lat_le_2000 = Column(BigInteger, nullable=False, default=0)
+    lat_le_5000 = Column(BigInteger, nullable=False, default=0)
+    lat_le_10000 = Column(BigInteger, nullable=False, default=0)
+    lat_le_30000 = Column(BigInteger, nullable=False, default=0)
+    lat_gt_30000 = Column(BigInteger, nullable=False, default=0)
+
+class RollupCheckpoint(Base):
+    """
+    Progress of scripts/backfill_rollups.py, committed in the same
+    transaction as the rollup increments of each batch (exactly once).
+    """
+    __tablename__ = "rollup_checkpoints"
+
+    name = Column(String, primary_key=True)
+    last_id = Column(BigInteger, nullable=False, default=0)
+    until_id = Column(BigInteger, nullable=False)
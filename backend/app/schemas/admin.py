@@ -0,0 +1,4 @@
+from pydantic import BaseModel, Field
+
+class ProfileCaptureRequest(BaseModel):
+    requests: int = Field(1, ge=0, le=1000) # Profile the next N chat requests; 0 disarms
@@ -5,6 +5,15 @@ from datetime import datetime
 class ChatRequest(BaseModel):
     question: str
     session_id: Optional[str] = None
+    render_markdown: bool = False # Opt-in: server sends completed Markdown blocks as HTML
+
+class PrepareRequest(BaseModel):
+    session_id: str
+
+class BatchQuestion(BaseModel):
+    question: str
+    session_id: Optional[str] = None
+    id: Optional[str] = None # Caller's own key, echoed back in the result line
 
 class ChatResponse(BaseModel):
     answer: str
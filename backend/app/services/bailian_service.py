@@ -1,76 +1,347 @@
 import json
 import asyncio
+import re
 import threading
 import time
 from http import HTTPStatus
 from typing import AsyncGenerator
-import dashscope
 from loguru import logger
 from app.core.config import settings
+from app.core.logging import debug_enabled, log_sampler
+from app.core.metrics import metrics
+from app.core.profiling import add_stage
+from app.services.resilience import UpstreamCall
+from app.services.upstream import get_dashscope, get_http_session
+
+# Precompiled patterns for the partial-JSON helpers below (previously compiled per chunk)
+_JSON_KEY_PATTERNS = {
+    key: re.compile(rf'"{key}"\s*:\s*')
+    for key in ("rag_result", "web_result", "web_resul")
+}
+_WEB_RESULT_TAIL_RE = re.compile(r'"web_resul(?:t)?":\s*(\[.*)', re.DOTALL)
+
+
+def extract_balanced_json(text, key_name):
+    """
+    Manual helper to extract a JSON object/array value for `key_name`
+    from a (possibly incomplete) JSON string using bracket balancing.
+    """
+    key_re = _JSON_KEY_PATTERNS.get(key_name)
+    if key_re is None:
+        key_re = re.compile(rf'"{re.escape(key_name)}"\s*:\s*')
+    match = key_re.search(text)
+    if not match:
+        return None
+
+    start_idx = match.end()
+    if start_idx >= len(text): return None
+
+    # Fix: Skip whitespace/newlines to find real start char
+    while start_idx < len(text) and text[start_idx].isspace():
+        start_idx += 1
+
+    if start_idx >= len(text): return None
+    start_char = text[start_idx]
+
+    if start_char not in ['{', '[']:
+         # Maybe it's null or string or number. For rag/web result we expect obj or list.
+         return None
+
+    # Balance counting
+    stack = [start_char]
+    curr = start_idx + 1
+    in_quote = False
+    escape = False
+
+    while curr < len(text) and stack:
+        c = text[curr]
+        if not in_quote:
+            if c == '"':
+                in_quote = True
+            elif c == '{' or c == '[':
+                stack.append(c)
+            elif c == '}' or c == ']':
+                # Check match
+                last = stack[-1]
+                if (last == '{' and c == '}') or (last == '[' and c == ']'):
+                    stack.pop()
+                else:
+                    # Mismatch? Malformed?
+                    pass
+        else:
+            # In quote
+            if escape:
+                escape = False
+            elif c == '\\':
+                escape = True
+            elif c == '"':
+                in_quote = False
+
+        curr += 1
+
+    if not stack:
+        # Complete
+        json_substr = text[start_idx:curr]
+        try:
+            return json.loads(json_substr)
+        except:
+            return None
+    return None
+
+
+# A run of string-body characters and complete escape pairs, up to the closing quote
+_STRING_BODY_RE = re.compile(r'(?:[^"\\]|\\[\s\S])*')
+# Escapes that can't be decoded yet: a cut \uXXXX, or a high surrogate whose pair may follow
+# (held together with any cut escape after it, so the pair is never split into lone halves)
+_HELD_ESCAPE_RE = re.compile(r'\\u(?:[0-9a-fA-F]{0,3}|[dD][89abAB][0-9a-fA-F]{2}(?:\\u[0-9a-fA-F]{0,3})?)$')
+_OBJECT_START_RE = re.compile(r'\s*\{')
+
+
+class LlmResultScanner:
+    """
+    Incremental decoder of the "llm_result" string of a growing workflow JSON
+    text: scan() only looks at what was appended since the last call and
+    returns the newly decoded characters, so a long answer is neither
+    re-scanned nor rebuilt per chunk. The text must only grow between calls.
+    """
+
+    __slots__ = ("found", "closed", "pos", "length")
+
+    def __init__(self):
+        self.found = False # Saw the "llm_result" key and its opening quote
+        self.closed = False # Saw the closing quote
+        self.pos = 0 # Raw index up to which the value has been decoded
+        self.length = 0 # Decoded characters so far
+
+    def scan(self, text: str) -> str:
+        if self.closed:
+            return ""
+        if not self.found:
+            key = text.find('"llm_result"')
+            if key == -1:
+                return ""
+            value_start = text.find('"', key + 12) # length of "llm_result"
+            if value_start == -1:
+                return ""
+            self.found = True
+            self.pos = value_start + 1
+
+        end = _STRING_BODY_RE.match(text, self.pos).end()
+        self.closed = end < len(text) and text[end] == '"'
+        raw = text[self.pos:end]
+        if not self.closed:
+            held = _HELD_ESCAPE_RE.search(raw)
+            if held is not None and _escape_aligned(raw, held.start()):
+                raw = raw[:held.start()]
+        if not raw:
+            return ""
+        self.pos += len(raw)
+        try:
+            delta = json.loads(f'"{raw}"', strict=False)
+        except ValueError:
+            delta = raw.replace('\\n', '\n').replace('\\t', '\t').replace('\\"', '"')
+        self.length += len(delta)
+        return delta
+
+
+def _escape_aligned(raw: str, index: int) -> bool:
+    # The backslash at `index` starts an escape unless it is itself escaped
+    run = 0
+    while index - run - 1 >= 0 and raw[index - run - 1] == '\\':
+        run += 1
+    return run % 2 == 0
+
+
+def safe_get(obj, key):
+    """Helper to safely get a key/attribute from SDK output objects."""
+    try:
+        if isinstance(obj, dict): return obj.get(key)
+        if hasattr(obj, key): return getattr(obj, key)
+    except:
+        return None
+    return None
+
+
+def get_token_count(obj, attr):
+    """Helper to safely read a token counter from a usage object."""
+    try:
+        val = getattr(obj, attr, 0)
+        return val if val is not None else 0
+    except (KeyError, AttributeError):
+        return 0
+
+
+def build_sources(std_refs, rag_res, web_res) -> list:
+    """
+    The `sources` list sent to the UI, from the standard doc references and the
+    workflow rag/web results (copies, so the raw results stay untouched for the DB).
+    """
+    sources_list = []
+
+    # A. Standard Bailian sources
+    if std_refs:
+        sources_list.extend(std_refs)
+
+    # B. Workflow: "rag_result" (Knowledge Base)
+    if rag_res:
+        if isinstance(rag_res, dict) and 'chunkList' in rag_res:
+            chunk_list = rag_res['chunkList']
+            if isinstance(chunk_list, list):
+                for item in chunk_list:
+                    s_item = item.copy() if isinstance(item, dict) else {"raw": item}
+                    if isinstance(item, dict):
+                        s_item["title"] = item.get('title') or item.get('documentName') or '知识库文档'
+                        s_item["url"] = item.get('docUrl') or item.get('url') or '#'
+                    else:
+                        s_item["title"] = '知识库文档'
+                        s_item["url"] = '#'
+                    s_item["type"] = "rag"
+                    sources_list.append(s_item)
+        elif isinstance(rag_res, list):
+            for item in rag_res:
+                if isinstance(item, dict):
+                    s_item = item.copy()
+                    s_item["title"] = item.get('title') or item.get('doc_name') or '知识库文档'
+                    s_item["url"] = item.get('url') or item.get('docUrl') or item.get('doc_id') or '#'
+                    s_item["type"] = "rag"
+                    sources_list.append(s_item)
+        elif isinstance(rag_res, dict):
+             s_item = rag_res.copy()
+             s_item["title"] = rag_res.get('title') or rag_res.get('documentName') or '知识库文档'
+             s_item["url"] = rag_res.get('docUrl') or rag_res.get('url') or '#'
+             s_item["type"] = "rag"
+             sources_list.append(s_item)
+
+    # C. Workflow: "web_result" (Search)
+    if web_res:
+         if not isinstance(web_res, list): web_res = [web_res]
+         for item in web_res:
+             s_item = {}
+             if isinstance(item, dict):
+                 s_item = item.copy()
+                 s_item["title"] = item.get('title') or '网络搜索结果'
+                 s_item["link"] = item.get('link') or item.get('url') or '#'
+             else:
+                 # Handle string/other primitives (e.g. raw URL)
+                 s_item = {"raw": item}
+                 s_item["title"] = '网络搜索结果'
+                 s_item["link"] = str(item) if item else '#'
+
+             # Unify URL field
+             s_item["url"] = s_item.get("link", "#")
+             s_item["type"] = "web"
+             sources_list.append(s_item)
+
+    return sources_list
+
+
+def _deadline(chunk_count: int, started: float):
+    """
+    (phase, seconds left) for the next queue wait: first chunk or stall,
+    whichever the total deadline doesn't cut shorter.
+    """
+    elapsed = time.monotonic() - started
+    if chunk_count == 0:
+        phase, left = "first_chunk", settings.UPSTREAM_FIRST_CHUNK_TIMEOUT - elapsed
+    else:
+        phase, left = "stall", settings.UPSTREAM_STALL_TIMEOUT
+    total_left = settings.UPSTREAM_TOTAL_TIMEOUT - elapsed
+    if total_left < left:
+        phase, left = "total", total_left
+    return phase, max(0.0, left)
+
+
+_TIMEOUT_MESSAGES = {
+    "connect": "Could not connect to the answer service in time. Please retry.",
+    "first_chunk": "The answer service did not start answering in time. Please retry.",
+    "stall": "The answer service stopped responding, answer was cut short. Please retry.",
+    "total": "The answer took too long and was cut short. Please retry.",
+}
+
+
+def _timeout_frame(phase: str, elapsed: float) -> dict:
+    metrics.inc("upstream_timeouts_total", phase=phase)
+    logger.warning("Upstream {phase} deadline exceeded after {elapsed_ms}ms", phase=phase, elapsed_ms=int(elapsed * 1000))
+    return {"error": _TIMEOUT_MESSAGES[phase], "timeout": phase}
+
+
+def _is_connect_timeout(error: Exception) -> bool:
+    from requests.exceptions import ConnectTimeout
+    return isinstance(error, ConnectTimeout)
 
-# Configure DashScope
-dashscope.api_key = settings.DASHSCOPE_API_KEY
 
 class BailianService:
     @staticmethod
-    async def stream_chat(query: str, session_id: str = None) -> AsyncGenerator[str, None]:
+    async def stream_chat(query: str, session_id: str = None, http_session=None) -> AsyncGenerator[str, None]:
+        """
+        Call Bailian Application (Agent) API with streaming.
+        Returns a generator of JSON strings (SSE data), paced for the UI.
+        """
+        async for event in BailianService.stream_events(query, session_id, http_session=http_session):
+            yield json.dumps(event)
+
+    @staticmethod
+    async def stream_events(query: str, session_id: str = None, paced: bool = True, http_session=None) -> AsyncGenerator[dict, None]:
         """
         Call Bailian Application (Agent) API with streaming.
-        Returns a generator of JSON strings (SSE data).
+        Returns a generator of event dicts (the SSE data before serialization).
         Uses a separate thread to handle the synchronous DashScope API call
         to prevent blocking the asyncio event loop.
+
+        paced=False is for machine clients that only want the final answer:
+        no typing-effect sub-chunks or sleeps, and workflow pieces that are
+        already superseded by queued ones are not re-parsed.
+
+        http_session: a pre-warmed requests.Session (see prewarm.py) to use
+        instead of the shared pool; it is closed when the call is done.
+
+        Deadlines per phase: connect (UPSTREAM_CONNECT_TIMEOUT, at the socket),
+        first chunk, stall between chunks and total duration (awaited here, on
+        the queue). A missed deadline ends the stream with an error frame that
+        carries `timeout: <phase>`; the text so far is kept by the caller.
         """
         start_time = time.time()
+        started = time.monotonic()
         # Explicitly set maxsize=0 for infinite capacity, though it is the default
         queue = asyncio.Queue(maxsize=0)
         loop = asyncio.get_running_loop()
 
-        def producer():
-            # Retry logic for connection setup or early failures
-            max_retries = 2
-            for attempt in range(max_retries + 1):
-                has_yielded = False
-                try:
-                    # Set a reasonable timeout (e.g., 60s connect, 120s read)
-                    # DashScope 'timeout' arg applies to requests.
-                    responses = dashscope.Application.call(
-                        app_id=settings.BAILIAN_APP_ID,
-                        prompt=query,
-                        session_id=session_id,
-                        stream=True,
-                        flow_stream_mode="message_format",
-                        incremental_output=True, # Ensure we get full text states for delta calculation
-                        timeout=120  # 2 minutes timeout to prevent infinite hangs
-                    )
-                    
-                    for response in responses:
-                        has_yielded = True
-                        loop.call_soon_threadsafe(queue.put_nowait, response)
-                    
-                    # If completed successfully
-                    loop.call_soon_threadsafe(queue.put_nowait, None) # Sentinel
-                    return
-
-                except Exception as e:
-                    is_last_attempt = (attempt == max_retries)
-                    
-                    # Only retry if we haven't sent any partial data yet (to avoid duplicate text on UI)
-                    if not has_yielded and not is_last_attempt:
-                        logger.warning(f"Bailian API Attempt {attempt+1} failed: {e}. Retrying...")
-                        time.sleep(1) # Brief pause
-                        continue
-                    
-                    # Otherwise, propagate error
-                    logger.error(f"Bailian API failed (Attempt {attempt+1}, yielded={has_yielded}): {e}")
-                    loop.call_soon_threadsafe(queue.put_nowait, e)
-                    return
+        def call(session):
+            # request_timeout goes to requests as (connect, read); any other unknown kwarg, 'timeout'
+            # included, ends up in the request body. The read timeout frees the thread of a stalled
+            # socket about when the event loop side gives up on it.
+            return get_dashscope().Application.call(
+                app_id=settings.BAILIAN_APP_ID,
+                prompt=query,
+                session_id=session_id,
+                stream=True,
+                flow_stream_mode="message_format",
+                incremental_output=True, # Ensure we get full text states for delta calculation
+                request_timeout=(settings.UPSTREAM_CONNECT_TIMEOUT, max(settings.UPSTREAM_FIRST_CHUNK_TIMEOUT, settings.UPSTREAM_STALL_TIMEOUT)),
+                session=session
+            )
+
+        def emit(item):
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        # Retries before the first chunk, hedging and the circuit breaker (see resilience.py).
+        # Retries and the hedge use the shared pool (warmed at startup), never the single-use session.
+        upstream_call = UpstreamCall(call, emit, http_session or get_http_session(), get_http_session())
+
+        def run_producer():
+            try:
+                upstream_call.run()
+            finally:
+                if http_session is not None:
+                    http_session.close() # Dedicated pre-warmed session, single use
 
         # Start the producer thread
-        logger.info(f"Starting Bailian thread for query: {query}")
-        thread = threading.Thread(target=producer, daemon=True)
+        logger.info("Starting Bailian thread for query ({query_chars} chars)", query_chars=len(query), session_id=session_id)
+        logger.debug("Query: {query}", query=query)
+        thread = threading.Thread(target=run_producer, daemon=True)
         thread.start()
 
-        yield json.dumps({"text": "", "is_finish": False, "request_id": "init"}) # Keep-alive / Start
+        yield {"text": "", "is_finish": False, "request_id": "init"} # Keep-alive / Start
 
         # Keep track of length to calculate delta
         last_text_len = 0
@@ -78,18 +349,32 @@ class BailianService:
         
         # Diagnostic Timers
         t0 = time.time()
-        last_chunk_time = t0
         chunk_count = 0
         
         # Buffer for Workflow specific message accumulation
         accumulated_workflow_content = ""
         last_workflow_seq_id = -1
+        llm_scanner = LlmResultScanner()
+        found_rag = found_web = None
+        built_sources, built_from = [], (None, None, None)
+        sent_sources = None # Sources as last sent; frames only carry them again when they change
 
         try:
             while True:
                 # Measure waiting time for API
                 wait_start = time.time()
-                item = await queue.get()
+                if not queue.empty():
+                    if time.monotonic() - started > settings.UPSTREAM_TOTAL_TIMEOUT:
+                        yield _timeout_frame("total", time.monotonic() - started)
+                        break
+                    item = queue.get_nowait() # Common case while streaming, no timer needed
+                else:
+                    phase, timeout = _deadline(chunk_count, started)
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        yield _timeout_frame(phase, time.monotonic() - started)
+                        break
                 wait_duration_ms = (time.time() - wait_start) * 1000
                 
                 if item is None:
@@ -97,30 +382,33 @@ class BailianService:
                 
                 chunk_count += 1
                 current_time = time.time()
-                interval_ms = (current_time - last_chunk_time) * 1000
-                last_chunk_time = current_time
                 
                 # Log first packet specifically (Time To First Token)
                 if chunk_count == 1:
-                    logger.info(f"[Perf] TTFT (Time To First Token): {int((current_time - t0) * 1000)}ms. Request ID: {getattr(item, 'request_id', 'unknown')}")
+                    logger.info("[Perf] TTFT (Time To First Token): {ttft_ms}ms. Request ID: {request_id}",
+                                ttft_ms=int((current_time - t0) * 1000), request_id=getattr(item, 'request_id', 'unknown'))
                 elif wait_duration_ms > 1000:
-                    # If we waited more than 1 second for the NEXT chunk from API
-                    logger.warning(f"[Perf] Slow API Detected! Waited {int(wait_duration_ms)}ms for chunk #{chunk_count} from Bailian")
+                    # If we waited more than 1 second for the NEXT chunk from API (sampled, this fires per chunk when upstream degrades)
+                    dropped = log_sampler.sample("slow_chunk")
+                    if dropped is not None:
+                        logger.warning("[Perf] Slow API Detected! Waited {wait_ms}ms for chunk #{chunk} from Bailian",
+                                       wait_ms=int(wait_duration_ms), chunk=chunk_count, suppressed=dropped)
                 
                 if isinstance(item, Exception):
+                    if _is_connect_timeout(item):
+                        yield _timeout_frame("connect", time.monotonic() - started)
+                        break
                     logger.error(f"Error in Bailian thread: {item}")
-                    yield json.dumps({"error": str(item), "request_id": getattr(item, 'request_id', 'unknown')})
+                    yield {"error": str(item), "request_id": getattr(item, 'request_id', 'unknown')}
                     break
 
                 response = item
                 
-                # processing start
-                proc_start = time.time()
-                
                 if response.status_code == HTTPStatus.OK:
+                    parse_cpu = time.thread_time()
                     full_text = ""
-                    rag_res = None
-                    web_res = None
+                    rag_res = found_rag
+                    web_res = found_web
                     
                     # RAW OUTPUT from Bailian (this might be the JSON string)
                     raw_output_text = getattr(response.output, 'text', '')
@@ -171,145 +459,53 @@ class BailianService:
                     if f_reason and f_reason != "null":
                         is_finish = True
 
-                    # 1. Try to Parse if it is a JSON String
+                    if not paced and wf_msg and not is_finish and queue.qsize() > 1:
+                        # Newer pieces are already queued (the sentinel is always last, so the next
+                        # item is a response); parse once at the latest state instead of per piece
+                        continue
+
+                    # 1. Decode "llm_result" incrementally: the workflow text only grows, so only the
+                    # new piece is looked at. A plain container text is re-scanned from the start.
+                    is_workflow_text = bool(accumulated_workflow_content)
+                    scanner = llm_scanner if is_workflow_text else LlmResultScanner()
+                    was_in_text = scanner.found and not scanner.closed
+                    decoded = scanner.scan(parse_source_text)
+                    in_text = scanner.found and not scanner.closed
+
+                    # 2. The container can only be complete JSON once the llm_result string is closed
                     is_json_parsed = False
-                    try:
-                        # Try parsing full text as JSON first
-                        json_data = json.loads(parse_source_text)
-                        
-                        if isinstance(json_data, dict):
-                            llm_result = json_data.get('llm_result')
-                            
-                            # Note: rag_result/web_result might still be in raw_output_text or response.output
-                            # We check those in Step 3/Manual Helper separately or assume they are extracted elsewhere.
-                            # But if they are inside this json_data (because parse_source_text was the container), grab them.
-                            if not rag_res: rag_res = json_data.get('rag_result')
-                            if not web_res: web_res = json_data.get('web_result') or json_data.get('web_resul')
-                            
-                            if llm_result:
-                                full_text = llm_result
-                                is_json_parsed = True
-                    except:
-                        pass
-                        
-                    # 2. If parsing failed, try Manual Extraction from partial string (For Streaming 'llm_result')
-                    # We use 'parse_source_text' which now points to the correct container
-                    if not is_json_parsed and parse_source_text:
-                         # Heuristic: Extract content of "llm_result"
-                         import re
-                         # Look for "llm_result": " ...
-                         match_start = parse_source_text.find('"llm_result"')
-                         if match_start != -1:
-                             # Locate start of value quote
-                             val_start = parse_source_text.find('"', match_start + 12) # length of "llm_result"
-                             if val_start != -1:
-                                 # We are inside the string value.
-                                 # This logic extracts until non-escaped quote
-                                 curr = val_start + 1 
-                                 chars = []
-                                 while curr < len(parse_source_text):
-                                     c = parse_source_text[curr]
-                                     if c == '\\':
-                                         if curr + 1 < len(parse_source_text):
-                                             next_c = parse_source_text[curr+1]
-                                             chars.append('\\' + next_c) 
-                                             curr += 2
-                                         else:
-                                             break
-                                     elif c == '"':
-                                         break
-                                     else:
-                                         chars.append(c)
-                                         curr += 1
-                                 
-                                 partial_json_str = '"' + "".join(chars) + '"'
-                                 try:
-                                     full_text = json.loads(partial_json_str)
-                                 except:
-                                     full_text = "".join(chars).replace('\\n', '\n').replace('\\t', '\t').replace('\\"', '"')
+                    if not in_text:
+                        try:
+                            json_data = json.loads(parse_source_text)
+
+                            if isinstance(json_data, dict):
+                                llm_result = json_data.get('llm_result')
+
+                                # Note: rag_result/web_result might still be in raw_output_text or response.output
+                                # We check those in Step 3/Manual Helper separately or assume they are extracted elsewhere.
+                                # But if they are inside this json_data (because parse_source_text was the container), grab them.
+                                if not rag_res: rag_res = json_data.get('rag_result')
+                                if not web_res: web_res = json_data.get('web_result') or json_data.get('web_resul')
+
+                                if llm_result:
+                                    full_text = llm_result
+                                    is_json_parsed = True
+                        except:
+                            pass
 
                     # 3. Fallback: If no llm_result found, use raw text ONLY if it's not a JSON structure
-                    is_workflow_like = parse_source_text.strip().startswith('{') and ('"llm_result"' in parse_source_text or '"rag_result"' in parse_source_text)
-                    
+                    is_workflow_like = _OBJECT_START_RE.match(parse_source_text) is not None and (
+                        scanner.found or '"llm_result"' in parse_source_text or '"rag_result"' in parse_source_text)
+
+                    if not is_json_parsed and scanner.found:
+                         full_text = decoded
                     if not full_text and not is_json_parsed and not is_workflow_like:
                          full_text = parse_source_text
-                    
-                    # Log parsing state for debugging
-                    if not full_text and is_workflow_like and not is_finish:
-                         # This explains "NO content" chunks: Workflow is streaming internal state (like RAG) but LLM hasn't started correcting text yet.
-                         # logger.debug(f"[Perf] Workflow state update (No LLM text yet). Raw head: {raw_output_text[:50]}...")
-                         pass
-
-                    # Manual Helper to extract JSON fields from string (Balanced Bracket)
-                    def extract_balanced_json(text, key_name):
-                        import re
-                        # Find key followed by colon
-                        key_pat = f'"{key_name}"\s*:\s*'
-                        match = re.search(key_pat, text)
-                        if not match:
-                            return None
-                        
-                        start_idx = match.end()
-                        if start_idx >= len(text): return None
-                        
-                        # Check start char
-                        start_char = text[start_idx]
-                        
-                        # Fix: Skip whitespace/newlines to find real start char
-                        while start_idx < len(text) and text[start_idx].isspace():
-                            start_idx += 1
-                        
-                        if start_idx >= len(text): return None
-                        start_char = text[start_idx]
-
-                        if start_char not in ['{', '[']:
-                             # Maybe it's null or string or number. For rag/web result we expect obj or list.
-                             return None
-                        
-                        # Balance counting
-                        stack = [start_char]
-                        curr = start_idx + 1
-                        in_quote = False
-                        escape = False
-                        
-                        while curr < len(text) and stack:
-                            c = text[curr]
-                            if not in_quote:
-                                if c == '"':
-                                    in_quote = True
-                                elif c == '{' or c == '[':
-                                    stack.append(c)
-                                elif c == '}' or c == ']':
-                                    # Check match
-                                    last = stack[-1]
-                                    if (last == '{' and c == '}') or (last == '[' and c == ']'):
-                                        stack.pop()
-                                    else:
-                                        # Mismatch? Malformed?
-                                        pass
-                            else:
-                                # In quote
-                                if escape:
-                                    escape = False
-                                elif c == '\\':
-                                    escape = True
-                                elif c == '"':
-                                    in_quote = False
-                            
-                            curr += 1
-                        
-                        if not stack:
-                            # Complete
-                            json_substr = text[start_idx:curr]
-                            try:
-                                return json.loads(json_substr)
-                            except:
-                                return None
-                        return None
 
                     # If not fully parsed via json.loads, try to extract rag/web result incrementally
-                    # Use 'parse_source_text' to support both direct and workflow modes
-                    if not is_json_parsed and parse_source_text:
+                    # Use 'parse_source_text' to support both direct and workflow modes.
+                    # While the answer text is still streaming, nothing new can have completed after it
+                    if not is_json_parsed and parse_source_text and not (was_in_text and in_text):
                         if not rag_res:
                             rag_res = extract_balanced_json(parse_source_text, "rag_result")
                         if not web_res:
@@ -322,10 +518,18 @@ class BailianService:
                             web_res_candidate = extract_balanced_json(parse_source_text, "web_resul")
                             if web_res_candidate:
                                 web_res = web_res_candidate
+                    if rag_res:
+                        found_rag = rag_res # Complete once extracted, not re-parsed per chunk
+                    if web_res:
+                        found_web = web_res
 
-                    # Manual Delta Calculation
-                    delta_text = full_text[last_text_len:]
-                    last_text_len = len(full_text)
+                    # Delta Calculation
+                    if is_workflow_text and scanner.found:
+                        delta_text = decoded
+                        last_text_len += len(delta_text)
+                    else:
+                        delta_text = full_text[last_text_len:]
+                        last_text_len = len(full_text)
 
                     # (is_finish logic moved up)
                     
@@ -337,22 +541,15 @@ class BailianService:
                         # NEW: Measure Real TTFT (Time To First Text)
                         if last_text_len == len(delta_text): # This is the FIRST chunk with text content (since last_text_len was 0 before this block)
                             real_ttft = int((time.time() - start_time) * 1000)
-                            logger.info(f"[Perf] REAL TTFT (Content Arrived): {real_ttft}ms at Chunk #{chunk_count}")
-                        if chunk_count % 42 == 0:
-                            logger.debug(f"[Perf] Chunk #{chunk_count} Delta: {len(delta_text)} chars")
+                            logger.info("[Perf] REAL TTFT (Content Arrived): {real_ttft_ms}ms at Chunk #{chunk}", real_ttft_ms=real_ttft, chunk=chunk_count)
+                        if debug_enabled():
+                            dropped = log_sampler.sample("chunk_delta")
+                            if dropped is not None:
+                                logger.debug("[Perf] Chunk #{chunk} Delta: {delta_chars} chars", chunk=chunk_count, delta_chars=len(delta_text), suppressed=dropped)
 
                     # --- Sources Extraction (Standard + Workflow JSON) ---
                     sources_list = []
 
-                    # Helper to safely get
-                    def safe_get(obj, key):
-                        try:
-                            if isinstance(obj, dict): return obj.get(key)
-                            if hasattr(obj, key): return getattr(obj, key)
-                        except:
-                            return None
-                        return None
-                    
                     # COMMENTED OUT: Do not eagerly fetch from response.output if we are in string parsing mode (implied by non-empty raw_output_text which is a dict string)
                     # This respects the User's claim that sources come "from complete json" and prevents "fake" early display if SDK returns them early.
                     # However, we only do this if we haven't found them yet, to allow the manual extraction to take precedence if successful.
@@ -376,12 +573,11 @@ class BailianService:
                     # 3. Fallback: Last Resort Pattern Match for Web Result at End of Stream
                     # If we still have no web_res, and we are in a workflow stream, try to grab the tail
                     if not web_res and is_workflow_json_stream and parse_source_text:
-                         import re
                          # Look for "web_result" or "web_resul" followed by anything until end
                          # This handles cases like: ... "web_resul": [{"title" ... }] }
                          # or even malformed ... "web_resul": [{"title" ... 
                          
-                         tail_match = re.search(r'"web_resul(?:t)?":\s*(\[.*)', parse_source_text, re.DOTALL)
+                         tail_match = _WEB_RESULT_TAIL_RE.search(parse_source_text)
                          if tail_match:
                              potential_json = tail_match.group(1).strip()
                              # Try to fix closing brackets if missing
@@ -408,60 +604,16 @@ class BailianService:
                     # User request: "Separate these two, append reference sources AFTER real stream output"
                     # Solution: We calculate sources as we find them, but we only YIELD them when is_finish=True.
                     
-                    # A. Standard Bailian sources
+                    # A-C. Built only when one of its inputs changed, not per chunk
                     std_refs = safe_get(response.output, 'doc_references')
-                    if std_refs:
-                        sources_list.extend(std_refs)
-
-                    # B. Workflow: "rag_result" (Knowledge Base)
-                    if rag_res:
-                        if isinstance(rag_res, dict) and 'chunkList' in rag_res:
-                            chunk_list = rag_res['chunkList']
-                            if isinstance(chunk_list, list):
-                                for item in chunk_list:
-                                    s_item = item.copy() if isinstance(item, dict) else {"raw": item}
-                                    if isinstance(item, dict):
-                                        s_item["title"] = item.get('title') or item.get('documentName') or '知识库文档'
-                                        s_item["url"] = item.get('docUrl') or item.get('url') or '#'
-                                    else:
-                                        s_item["title"] = '知识库文档'
-                                        s_item["url"] = '#'
-                                    s_item["type"] = "rag"
-                                    sources_list.append(s_item)
-                        elif isinstance(rag_res, list):
-                            for item in rag_res:
-                                if isinstance(item, dict):
-                                    s_item = item.copy()
-                                    s_item["title"] = item.get('title') or item.get('doc_name') or '知识库文档'
-                                    s_item["url"] = item.get('url') or item.get('docUrl') or item.get('doc_id') or '#'
-                                    s_item["type"] = "rag"
-                                    sources_list.append(s_item)
-                        elif isinstance(rag_res, dict):
-                             s_item = rag_res.copy()
-                             s_item["title"] = rag_res.get('title') or rag_res.get('documentName') or '知识库文档'
-                             s_item["url"] = rag_res.get('docUrl') or rag_res.get('url') or '#'
-                             s_item["type"] = "rag"
-                             sources_list.append(s_item)
-
-                    # C. Workflow: "web_result" (Search)
-                    if web_res:
-                         if not isinstance(web_res, list): web_res = [web_res]
-                         for item in web_res:
-                             s_item = {}
-                             if isinstance(item, dict):
-                                 s_item = item.copy()
-                                 s_item["title"] = item.get('title') or '网络搜索结果'
-                                 s_item["link"] = item.get('link') or item.get('url') or '#'
-                             else:
-                                 # Handle string/other primitives (e.g. raw URL)
-                                 s_item = {"raw": item}
-                                 s_item["title"] = '网络搜索结果'
-                                 s_item["link"] = str(item) if item else '#'
-                             
-                             # Unify URL field
-                             s_item["url"] = s_item.get("link", "#")
-                             s_item["type"] = "web"
-                             sources_list.append(s_item)
+                    if web_res and not isinstance(web_res, list): web_res = [web_res]
+                    add_stage("parse", parse_cpu)
+                    if std_refs is not built_from[0] or rag_res is not built_from[1] or web_res is not built_from[2]:
+                        sources_cpu = time.thread_time()
+                        built_sources = build_sources(std_refs, rag_res, web_res)
+                        built_from = (std_refs, rag_res, web_res)
+                        add_stage("sources", sources_cpu)
+                    sources_list = built_sources
 
                     # KEY CHANGE: Do not assign to 'sources' variable for immediate yield unless finished
                     # But we also need to pass rag_res/web_res to router for DB only at the end?
@@ -470,7 +622,8 @@ class BailianService:
                     # So we HIDE it from frontend by sending None, but we need to eventually send it.
                     
                     current_sources = sources_list if sources_list else None
-                    yield_sources = None # Default to None for intermediate chunks
+                    # Unchanged sources are not repeated: clients keep the last ones they got
+                    yield_sources = current_sources if current_sources is not sent_sources else None
                     
                     # Capture raw results for DB storage
                     # rag_res and web_res are already extracted above via safe_get
@@ -482,14 +635,6 @@ class BailianService:
                         # Temporarily remove DEBUG log
                         usage_obj = response.usage
                         
-                        # Helper to safely get attributes
-                        def get_token_count(obj, attr):
-                            try:
-                                val = getattr(obj, attr, 0)
-                                return val if val is not None else 0
-                            except (KeyError, AttributeError):
-                                return 0
-
                         # Try direct access first
                         in_tokens = get_token_count(usage_obj, 'input_tokens')
                         out_tokens = get_token_count(usage_obj, 'output_tokens')
@@ -514,7 +659,7 @@ class BailianService:
                     # Base: ~500-1000 chars/sec to ensure we don't lag behind model too much
                     SMOOTH_THRESHOLD = 5
                     
-                    if len(delta_text) > SMOOTH_THRESHOLD: 
+                    if paced and len(delta_text) > SMOOTH_THRESHOLD: 
                         # Adaptive step size: if chunk is huge, step bigger to drain faster
                         # Target ~0.5s to drain any chunk size
                         step = max(5, int(len(delta_text) / 20)) 
@@ -540,23 +685,26 @@ class BailianService:
                                  else:
                                      finished_emitted = True
                                      sub_latency = int((time.time() - start_time) * 1000)
-                                     logger.info(f"[Perf] Request Finished [ID:{response.request_id}] - Latency: {sub_latency}ms - Usage: {usage_info}")
+                                     logger.info("[Perf] Request Finished [ID:{request_id}] - Latency: {latency_ms}ms - Usage: {usage}",
+                                                 request_id=response.request_id, latency_ms=sub_latency, usage=usage_info)
                             
                             chunk_data = {
                                 "text": sub_chunk,
                                 "is_finish": sub_is_finish,
-                                "sources": current_sources, # Update sources live
+                                "sources": yield_sources, # Update sources live
                                 "request_id": response.request_id,
                                 "usage": usage_info if sub_is_finish else None,
                                 "latency": sub_latency,
                                 "rag_result": rag_res if sub_is_finish and rag_res else None,
                                 "web_result": web_res if sub_is_finish and web_res else None
                             }
-                            yield json.dumps(chunk_data)
+                            if yield_sources is not None:
+                                sent_sources, yield_sources = yield_sources, None
+                            yield chunk_data
                             # Minimal sleep to yield control but resume fast
                             await asyncio.sleep(0.015)
 
-                    elif delta_text or is_finish or (current_sources and not last_text_len) or (is_finish and (rag_res or web_res)):
+                    elif delta_text or is_finish or (yield_sources and not last_text_len) or (is_finish and (rag_res or web_res)):
                         
                         latency_ms = None
                         # Handle Finish State
@@ -567,19 +715,22 @@ class BailianService:
                              else:
                                  finished_emitted = True
                                  latency_ms = int((time.time() - start_time) * 1000)
-                                 logger.info(f"[Perf] Request Finished [ID:{response.request_id}] - Latency: {latency_ms}ms - Usage: {usage_info}")
+                                 logger.info("[Perf] Request Finished [ID:{request_id}] - Latency: {latency_ms}ms - Usage: {usage}",
+                                             request_id=response.request_id, latency_ms=latency_ms, usage=usage_info)
 
                         chunk_data = {
                             "text": delta_text,
                             "is_finish": is_finish,
-                            "sources": current_sources, # Live streaming of sources
+                            "sources": yield_sources, # Live streaming of sources
                             "request_id": response.request_id,
                             "usage": usage_info if is_finish else None,
                             "latency": latency_ms,
                             "rag_result": rag_res if is_finish and rag_res else None,
                             "web_result": web_res if is_finish and web_res else None
                         }
-                        yield json.dumps(chunk_data)
+                        if yield_sources is not None:
+                            sent_sources = yield_sources
+                        yield chunk_data
 
                 else:
                     # Non-OK status loop
@@ -595,8 +746,10 @@ class BailianService:
                             pass
                     
                     logger.error(f"Bailian API Error: {response.code} - {error_msg}")
-                    yield json.dumps({"error": f"Error: {response.code} - {error_msg}"})
+                    yield {"error": f"Error: {response.code} - {error_msg}"}
         except Exception as e:
             logger.exception("Exception in BailianService async loop")
-            yield json.dumps({"error": str(e)})
+            yield {"error": str(e)}
+        finally:
+            upstream_call.cancel() # Consumer gone or done: attempts still streaming stop reading
 
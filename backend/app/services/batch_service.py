@@ -0,0 +1,107 @@
+import asyncio
+import json
+import time
+from typing import AsyncGenerator, List, Optional
+from loguru import logger
+from app.core.lifecycle import streams
+from app.core.metrics import metrics, percentile
+from app.schemas.chat import BatchQuestion
+from app.services.chat_service import ChatService
+
+
+class BatchService:
+    @staticmethod
+    async def run(items: List[BatchQuestion], concurrency: int, persist: bool = True, tenant_id: Optional[str] = None) -> AsyncGenerator[str, None]:
+        """
+        Answer many questions with at most `concurrency` upstream calls in flight.
+        Yields one NDJSON line per question in completion order, then a summary line.
+        The answered turns are persisted with a single bulk insert, run detached
+        from the client connection: a client that goes away mid-batch still gets
+        the turns answered so far saved.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(index: int, item: BatchQuestion):
+            async with semaphore:
+                if streams.draining:
+                    # Queued behind the semaphore: don't start new upstream calls during shutdown
+                    return index, item, {"answer": "", "sources": [], "error": "Server is restarting, please retry", "elapsed_ms": 0}
+                try:
+                    result = await ChatService.answer(item.question, item.session_id, tenant_id)
+                except Exception as e:
+                    logger.error(f"Batch question #{index} failed: {e}")
+                    result = {"answer": "", "sources": [], "error": str(e), "elapsed_ms": 0}
+            return index, item, result
+
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(run_one(i, item)) for i, item in enumerate(items)]
+        latencies = []
+        errors = 0
+        rows = []
+        save = None
+
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, item, result = await next_done
+                latencies.append(result["elapsed_ms"])
+                if result.get("error"):
+                    errors += 1
+                    metrics.inc("batch_questions_total", outcome="error")
+                else:
+                    metrics.inc("batch_questions_total", outcome="ok")
+
+                if persist and result.get("persist"):
+                    rows.append({
+                        "request_id": result.get("request_id"),
+                        "session_id": item.session_id,
+                        "question": item.question,
+                        "answer": result["answer"],
+                        "metadata_info": result.get("metadata_info"),
+                    })
+
+                yield json.dumps({
+                    "index": index,
+                    "id": item.id,
+                    "question": item.question,
+                    "answer": result["answer"],
+                    "sources": result.get("sources"),
+                    "request_id": result.get("request_id"),
+                    "usage": result.get("usage"),
+                    "elapsed_ms": result["elapsed_ms"],
+                    "error": result.get("error"),
+                }, ensure_ascii=False) + "\n"
+        finally:
+            # Client went away: don't keep burning upstream calls
+            for task in tasks:
+                task.cancel()
+            if rows:
+                save = streams.track_write(BatchService._save(rows))
+
+        saved = await asyncio.shield(save) if save else 0
+
+        wall_s = time.perf_counter() - start
+        yield json.dumps({
+            "summary": {
+                "questions": len(items),
+                "errors": errors,
+                "saved": saved,
+                "concurrency": concurrency,
+                "wall_s": round(wall_s, 3),
+                "throughput_qps": round(len(items) / wall_s, 3) if wall_s else None,
+                "latency_ms": {
+                    "p50": percentile(latencies, 50),
+                    "p90": percentile(latencies, 90),
+                    "p95": percentile(latencies, 95),
+                    "p99": percentile(latencies, 99),
+                    "max": max(latencies) if latencies else 0,
+                },
+            }
+        }) + "\n"
+
+    @staticmethod
+    async def _save(rows: List[dict]) -> int:
+        try:
+            return await ChatService.save_chat_logs(rows)
+        except Exception as e:
+            logger.error(f"Batch bulk save of {len(rows)} turns failed: {e}")
+            return 0
@@ -1,15 +1,312 @@
+import asyncio
+import json
+import time
 import uuid
+from contextlib import aclosing
+from typing import List
+from sqlalchemy import insert
 from app.services.bailian_service import BailianService
+from app.services.markdown_stream import MarkdownBlockStream, annotate
+from app.services.prewarm import prewarm_pool
+from app.services.faq_index import faq_index
+from app.services.instant_answers import instant_answers
+from app.services.output_filter import output_filter
+from app.core.config import settings
+from app.core.lifecycle import streams
+from app.core.metrics import metrics
+from app.core.profiling import add_stage
+from app.db.session import AsyncSessionLocal
+from app.models.chat_log import ChatLog
+from app.services.history_cache import history_cache
 from loguru import logger
 
+
+def encode_event(event: dict) -> str:
+    """
+    SSE data of one event: compact, and without the fields that are None in
+    this frame (most of them, on text frames). Frames are held in the
+    ReplayBuffer for the whole stream and its replay window, and a paced
+    answer has about one frame per 5 characters.
+    """
+    return json.dumps({k: v for k, v in event.items() if v is not None}, separators=(",", ":"))
+
+
+class TurnAccumulator:
+    """
+    Collects what we persist for one turn from the SSE data frames
+    (text deltas, sources, usage, latency, raw rag/web results, request id).
+    """
+
+    def __init__(self, tenant_id: str|None = None):
+        self.tenant_id = tenant_id
+        self.parts = [] # Text deltas, joined once when the turn is saved
+        self.sources = []
+        self.usage = None
+        self.latency = None
+        self.rag_result = None
+        self.web_result = None
+        self.error = None
+        self.timeout = None # Phase whose deadline ended the turn (connect, first_chunk, stall, total)
+        self.faq_id = None # Set when the turn was answered from the FAQ index
+        self.intent = None # Set when the turn was answered by an instant answer rule
+        # Track effective Request ID (fallback to UUID, prefer Aliyun ID)
+        self.request_id = None
+
+    def feed(self, data_str: str):
+        try:
+            data = json.loads(data_str)
+        except ValueError:
+            return
+        self.feed_event(data)
+
+    def feed_event(self, data: dict):
+        if "text" in data and data["text"]:
+             self.parts.append(data["text"])
+        if "sources" in data and data["sources"]:
+             self.sources = data["sources"]
+        if "usage" in data and data["usage"]:
+             self.usage = data["usage"]
+        if "latency" in data and data["latency"]:
+             self.latency = data["latency"]
+        if "rag_result" in data and data["rag_result"]:
+             self.rag_result = data["rag_result"]
+        if "web_result" in data and data["web_result"]:
+             self.web_result = data["web_result"]
+        if "error" in data and data["error"]:
+             self.error = data["error"]
+        if "faq_id" in data and data["faq_id"]:
+             self.faq_id = data["faq_id"]
+        if "intent" in data and data["intent"]:
+             self.intent = data["intent"]
+        if "timeout" in data and data["timeout"]:
+             self.timeout = data["timeout"]
+
+        # Capture Aliyun Request ID if available
+        if "request_id" in data and data["request_id"] and data["request_id"] not in ("init", "unknown"):
+             self.request_id = data["request_id"]
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    @property
+    def has_content(self) -> bool:
+        return bool(self.parts or self.sources)
+
+    @property
+    def should_persist(self) -> bool:
+        # Timed-out turns are kept even when empty, so they show up in history and stats
+        return self.has_content or self.timeout is not None
+
+    def metadata_info(self) -> dict:
+        info = {
+            "usage": self.usage,
+            "latency": self.latency,
+            "rag_result": self.rag_result,
+            "web_result": self.web_result
+        }
+        if self.faq_id:
+            info["faq_id"] = self.faq_id
+        if self.intent:
+            info["intent"] = self.intent
+        if self.tenant_id:
+            info["tenant_id"] = self.tenant_id
+        if self.error:
+            info["error"] = self.error
+        if self.timeout:
+            info["timeout"] = self.timeout
+        return info
+
+
 class ChatService:
     @staticmethod
-    async def chat_stream_generator(question: str, session_id: str, request_id: str|None = None):
+    async def chat_stream_generator(question: str, session_id: str, request_id: str|None = None, render_markdown: bool = False):
         """
         Just yields chunks from Bailian. 
         DB saving is now handled by the caller (Router) to separate concerns.
+        With render_markdown, completed Markdown blocks are also sent as
+        pre-rendered HTML (`html_blocks` / `md_offset`, see markdown_stream).
         """
         # logger.info(f"Starting chat stream for {request_id}") 自改
         
-        async for chunk_str in BailianService.stream_chat(question, session_id):
-            yield chunk_str
+        async for event in ChatService.chat_stream_events(question, session_id, render_markdown):
+            yield encode_event(event)
+
+    @staticmethod
+    async def chat_stream_events(question: str, session_id: str|None, render_markdown: bool = False,
+                                 stop: asyncio.Event|None = None):
+        """
+        Event dicts of chat_stream_generator, for callers that serialize
+        themselves (stream_hub feeds the TurnAccumulator without re-parsing).
+        Setting `stop` cuts the answer short at the next event (see _events).
+        """
+        blocks = MarkdownBlockStream() if render_markdown else None
+        async for event in ChatService._events(question, session_id, paced=True, stop=stop):
+            if blocks is not None:
+                event = annotate(event, blocks)
+            yield event
+
+    @staticmethod
+    async def _events(question: str, session_id: str|None, paced: bool, stop: asyncio.Event|None = None):
+        """
+        Answer events with the output filter applied to their text (compliance
+        masking), so clients and the saved ChatLog see the same masked answer.
+
+        When the caller sets `stop` (answer too long, drain deadline) the
+        upstream call is closed right after the current event, and the text the
+        filter still holds back is released as a last event, so it isn't lost.
+        """
+        stream = output_filter.stream() if settings.OUTPUT_FILTER_ENABLED else None
+        async with aclosing(ChatService._answer_events(question, session_id, paced)) as events:
+            async for event in events:
+                if stream is not None:
+                    filter_cpu = time.thread_time()
+                    stream.apply(event)
+                    add_stage("filter", filter_cpu)
+                yield event
+                if stop is not None and stop.is_set():
+                    break
+        tail = stream.flush() if stream is not None else ""
+        if tail:
+            # Ended without a finish frame: release what was held back for a possible term
+            yield {"text": tail, "is_finish": False}
+
+    @staticmethod
+    async def _answer_events(question: str, session_id: str|None, paced: bool):
+        """
+        Event dicts for one turn: from an instant answer rule for fixed
+        intents, from the FAQ index when the question matches a canonical
+        answer, otherwise from Bailian.
+        """
+        rule = instant_answers.match(question) if settings.INSTANT_ANSWERS_ENABLED else None
+        if rule is not None:
+            logger.info(f"Answering intent {rule['id']} locally")
+            metrics.inc("upstream_calls_avoided_total", path="instant")
+            metrics.inc("instant_answers_total", intent=rule["id"])
+            yield {"text": "", "is_finish": False, "request_id": "init"}
+            yield {
+                "text": rule["answer"],
+                "is_finish": True,
+                "sources": rule.get("sources") or None,
+                "request_id": None,
+                "usage": {"input_tokens": 0, "output_tokens": 0},
+                "latency": 0,
+                "intent": rule["id"],
+            }
+            return
+
+        entry = faq_index.match(question) if settings.FAQ_ENABLED else None
+        if entry is not None:
+            logger.info(f"Answering from FAQ entry {entry['id']}")
+            metrics.inc("upstream_calls_avoided_total", path="faq")
+            yield {"text": "", "is_finish": False, "request_id": "init"}
+            yield {
+                "text": entry["answer"],
+                "is_finish": True,
+                "sources": entry.get("sources") or None,
+                "request_id": None,
+                "usage": {"input_tokens": 0, "output_tokens": 0},
+                "latency": 0,
+                "rag_result": entry.get("rag_result"),
+                "web_result": entry.get("web_result"),
+                "faq_id": entry["id"],
+            }
+            return
+
+        # Connection pre-opened by /chat/prepare while the user was typing, if any
+        http_session = prewarm_pool.take(session_id)
+        async for event in BailianService.stream_events(question, session_id, paced=paced, http_session=http_session):
+            yield event
+
+    @staticmethod
+    async def answer(question: str, session_id: str|None = None, tenant_id: str|None = None) -> dict:
+        """
+        Run one question to completion and return the aggregated answer
+        (for machine clients: JSON mode of /chat/ask, the batch endpoint).
+        Skips UI pacing and per-frame JSON serialization. Does not persist.
+
+        Registered with the drain like an SSE stream: past the drain deadline
+        the turn is cut short and returned with what it has.
+        """
+        start = time.perf_counter()
+        turn = TurnAccumulator(tenant_id)
+        handle = streams.open_stream(f"answer-{uuid.uuid4()}")
+        stop = asyncio.Event()
+        try:
+            async for event in ChatService._events(question, session_id, paced=False, stop=stop):
+                turn.feed_event(event)
+                if handle.aborted:
+                    stop.set() # Still collects the filter's held-back tail
+        except asyncio.CancelledError:
+            if not handle.aborted:
+                raise
+            # A drain abort stuck on upstream: return the partial answer instead of failing the request
+            asyncio.current_task().uncancel()
+        finally:
+            streams.close_stream(handle)
+        if handle.aborted:
+            turn.feed_event({"error": "Server is restarting, answer was cut short. Please retry."})
+        return {
+            "answer": turn.text,
+            "sources": turn.sources,
+            "request_id": turn.request_id,
+            "usage": turn.usage,
+            "latency": turn.latency,
+            "error": turn.error,
+            "timeout": turn.timeout,
+            "persist": turn.should_persist,
+            "elapsed_ms": int((time.perf_counter() - start) * 1000),
+            "metadata_info": turn.metadata_info(),
+        }
+
+    @staticmethod
+    async def save_chat_log(request_id: str|None, session_id: str|None, question: str, answer: str, metadata_info: dict):
+        """
+        Persist one finished (or partial) turn. Uses its own session so it can run
+        detached from the client connection (see StreamTracker.track_write).
+        """
+        # Upstream may fail before sending a request id; the column is NOT NULL + unique
+        request_id = request_id or str(uuid.uuid4())
+        logger.info(f"Saving chat log for {request_id}...")
+        try:
+            async with AsyncSessionLocal() as session:
+                chat_log = ChatLog(
+                    request_id=request_id,
+                    session_id=session_id,
+                    user_query=question,
+                    ai_response=answer,
+                    # sources=sources, # Removed, using metadata_info property
+                    metadata_info=metadata_info
+                )
+                session.add(chat_log)
+                # usage_rollups are updated out of band (RollupService.rollup_loop)
+                await session.commit()
+                logger.info(f"Successfully saved chat log {request_id}")
+            await history_cache.invalidate()
+        except Exception as e:
+            logger.error(f"Failed to save chat log: {e}")
+
+    @staticmethod
+    async def save_chat_logs(rows: List[dict]) -> int:
+        """
+        Bulk insert of many turns in one statement / one transaction.
+        Each row has the save_chat_log fields. Returns the number of rows written.
+        """
+        if not rows:
+            return 0
+        values = [
+            {
+                "request_id": row.get("request_id") or str(uuid.uuid4()),
+                "session_id": row.get("session_id"),
+                "user_query": row["question"],
+                "ai_response": row.get("answer"),
+                "metadata_info": row.get("metadata_info"),
+            }
+            for row in rows
+        ]
+        async with AsyncSessionLocal() as session:
+            await session.execute(insert(ChatLog), values)
+            await session.commit()
+        await history_cache.invalidate()
+        logger.info(f"Bulk saved {len(values)} chat logs")
+        return len(values)
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+from loguru import logger
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# Shared by scripts/build_faq.py (offline clustering) and the /ask lookup, so
+# both sides vectorize a question exactly the same way.
+
+_NOISE_RE = re.compile(r"[\s\W_]+", re.UNICODE)
+NGRAM_SIZES = (2, 3) # Character n-grams, works for Chinese without a tokenizer
+VECTOR_TERMS = 64 # Terms kept per FAQ entry vector
+
+
+def normalize(text: str) -> str:
+    return _NOISE_RE.sub("", text.lower())
+
+
+def term_counts(text: str) -> Counter:
+    norm = normalize(text)
+    counts = Counter()
+    if len(norm) < min(NGRAM_SIZES):
+        if norm:
+            counts[norm] += 1
+        return counts
+    for n in NGRAM_SIZES:
+        for i in range(len(norm) - n + 1):
+            counts[norm[i:i + n]] += 1
+    return counts
+
+
+def idf(df: int, n_docs: int) -> float:
+    # Smoothed idf, same formula as scikit-learn's TfidfVectorizer(smooth_idf=True)
+    return math.log((1 + n_docs) / (1 + df)) + 1
+
+
+def tfidf(counts: Dict[str, float], idf_of) -> Dict[str, float]:
+    """
+    L2-normalized tf-idf vector as a sparse dict. `idf_of(term)` gives the weight.
+    """
+    vec = {term: (1 + math.log(tf)) * idf_of(term) for term, tf in counts.items() if tf > 0}
+    norm = math.sqrt(sum(w * w for w in vec.values()))
+    if not norm:
+        return {}
+    return {term: w / norm for term, w in vec.items()}
+
+
+def truncate(vec: Dict[str, float], terms: int = VECTOR_TERMS) -> Dict[str, float]:
+    """
+    Keep the heaviest `terms` weights and re-normalize.
+    """
+    top = sorted(vec.items(), key=lambda kv: kv[1], reverse=True)[:terms]
+    norm = math.sqrt(sum(w * w for _, w in top))
+    return {term: w / norm for term, w in top} if norm else {}
+
+
+def cosine(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b.get(term, 0.0) for term, w in a.items())
+
+
+def write_json(path: str, data: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path) # Atomic, workers never read half a file
+
+
+def forget_rows(row_ids: Iterable[int], state_path: str = None, index_path: str = None) -> int:
+    """
+    Drop the canonical answers copied from `row_ids` (a privacy delete) out of
+    the build checkpoint and the index. Their clusters keep only n-gram counts
+    and take a new canonical answer from the rows that join them later.
+    Returns the number of answers dropped.
+    """
+    row_ids = set(row_ids)
+    state_path = state_path or settings.FAQ_STATE_PATH
+    index_path = index_path or settings.FAQ_INDEX_PATH
+    if not row_ids:
+        return 0
+
+    cluster_ids = set()
+    if os.path.exists(state_path):
+        with open(state_path, encoding="utf-8") as f:
+            state = json.load(f)
+        for cluster in state["clusters"]:
+            if cluster["best"] is not None and cluster["best"]["row_id"] in row_ids:
+                cluster["best"] = None
+                cluster_ids.add(cluster["id"])
+        if cluster_ids:
+            write_json(state_path, state)
+
+    dropped = 0
+    if os.path.exists(index_path):
+        with open(index_path, encoding="utf-8") as f:
+            index = json.load(f)
+        # Indexes written before entries carried row_id are matched through the checkpoint's cluster ids
+        entries = [e for e in index["entries"] if e.get("row_id") not in row_ids and e["id"] not in cluster_ids]
+        dropped = len(index["entries"]) - len(entries)
+        if dropped:
+            index["entries"] = entries
+            write_json(index_path, index)
+    return max(dropped, len(cluster_ids))
+
+
+@dataclass
+class FaqData:
+    entries: List[dict] = field(default_factory=list)
+    idf: Dict[str, float] = field(default_factory=dict)
+    default_idf: float = 1.0 # For terms the index has never seen
+    postings: Dict[str, List[int]] = field(default_factory=dict)
+
+
+class FaqIndex:
+    """
+    In-memory index of canonical answers built by scripts/build_faq.py.
+
+    The file holds the entry vectors (top terms only), their idf weights and
+    the document count used for terms the index has never seen. Lookups use an
+    inverted index over n-grams, so only entries sharing a term are scored.
+    The file is re-read when its mtime changes (checked every 30s); inside
+    the server the read and parse run in a worker thread, lookups keep using
+    the previous index until the new one is swapped in.
+    """
+
+    RELOAD_CHECK_SECONDS = 30
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data = FaqData()
+        self._mtime = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+        self._reload_task: Optional[asyncio.Task] = None
+
+    def load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return # No index built yet
+        if mtime == self._mtime:
+            return
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+
+        postings: Dict[str, List[int]] = {}
+        for i, entry in enumerate(data["entries"]):
+            for term in entry["vector"]:
+                postings.setdefault(term, []).append(i)
+
+        # One reference swap, lookups never see half an index (loads run in a thread)
+        self.data = FaqData(data["entries"], data["idf"], idf(0, data.get("n_docs", 0)), postings)
+        self._mtime = mtime
+        logger.info(f"Loaded FAQ index: {len(data['entries'])} entries from {self.path}")
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.RELOAD_CHECK_SECONDS:
+            return
+        with self._lock:
+            if now - self._checked_at < self.RELOAD_CHECK_SECONDS:
+                return
+            self._checked_at = now
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self._load_logged() # Scripts: no event loop to keep free
+                return
+            if self._reload_task is None or self._reload_task.done():
+                self._reload_task = loop.create_task(asyncio.to_thread(self._load_logged))
+
+    def _load_logged(self):
+        try:
+            self.load()
+        except Exception as e:
+            logger.error(f"Failed to load FAQ index {self.path}: {e}")
+
+    def match(self, question: str, threshold: float = None) -> Optional[dict]:
+        """
+        Best entry with cosine similarity >= threshold, or None.
+        """
+        self.maybe_reload()
+        data = self.data
+        if not data.entries:
+            return None
+        threshold = settings.FAQ_MATCH_THRESHOLD if threshold is None else threshold
+
+        query = tfidf(term_counts(question), lambda t: data.idf.get(t, data.default_idf))
+        scores: Dict[int, float] = {}
+        for term, w in query.items():
+            for i in data.postings.get(term, ()):
+                scores[i] = scores.get(i, 0.0) + w * data.entries[i]["vector"][term]
+
+        best = max(scores.items(), key=lambda kv: kv[1], default=None)
+        if best is None or best[1] < threshold:
+            metrics.inc("faq_lookups_total", result="miss")
+            return None
+        metrics.inc("faq_lookups_total", result="hit")
+        return data.entries[best[0]]
+
+
+faq_index = FaqIndex(settings.FAQ_INDEX_PATH)
@@ -0,0 +1,101 @@
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from loguru import logger
+from pydantic import TypeAdapter
+from sqlalchemy import desc, select
+from app.core.cache import get_cache
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.session import AsyncReadSessionLocal
+from app.models.chat_log import ChatLog
+from app.schemas.chat import ChatHistoryItem
+
+# Bumped after every commit that inserts or deletes chat_logs rows. Lives in
+# the shared cache so a write on one worker invalidates the pages of all of them.
+_VERSION_KEY = "chat_history:version"
+
+_items = TypeAdapter(List[ChatHistoryItem])
+
+_MAX_PAGES = 32 # Distinct `limit` values kept; the sidebar uses one or two
+
+
+@dataclass
+class HistoryPage:
+    version: str
+    etag: str
+    body: bytes # Serialized JSON, sources already built
+    expires_at: float
+
+
+class HistoryCache:
+    """
+    Serialized /chat/history pages, per limit, for HISTORY_CACHE_TTL_SECONDS.
+
+    A page is reused only while the history version it was built under is
+    still current, so an insert or delete is visible on the next read. The
+    ETag is derived from that version plus the newest row (id / created_at),
+    which lets a client revalidate with If-None-Match and get a 304 without
+    the page being rebuilt.
+    """
+
+    def __init__(self):
+        self.pages: Dict[int, HistoryPage] = {}
+        metrics.register_gauge("history_cache_pages", lambda: len(self.pages))
+
+    async def version(self) -> str:
+        return await get_cache().get(_VERSION_KEY) or "0"
+
+    async def invalidate(self):
+        """
+        Call after the commit (not before): a reader that slipped in between
+        then built its page under the old version and it is thrown away.
+        """
+        try:
+            await get_cache().incr(_VERSION_KEY)
+        except Exception as e:
+            # Stale pages still expire after HISTORY_CACHE_TTL_SECONDS
+            logger.warning(f"Failed to bump history version: {e}")
+        self.pages.clear()
+
+    async def get(self, limit: int) -> HistoryPage:
+        version = await self.version()
+        page = self.pages.get(limit)
+        if page is not None and page.version == version and page.expires_at > time.monotonic():
+            metrics.inc("history_cache_total", result="hit")
+            return page
+
+        metrics.inc("history_cache_total", result="miss")
+        async with AsyncReadSessionLocal() as session:
+            result = await session.execute(
+                select(ChatLog).order_by(desc(ChatLog.created_at)).limit(limit)
+            )
+            logs = result.scalars().all()
+        body = _items.dump_json(_items.validate_python(logs))
+        newest = f"{logs[0].id}-{logs[0].created_at.timestamp():.6f}" if logs else "empty"
+        page = HistoryPage(
+            version=version,
+            etag=f'W/"h{version}-{newest}-{len(logs)}"',
+            body=body,
+            expires_at=time.monotonic() + settings.HISTORY_CACHE_TTL_SECONDS,
+        )
+        if settings.HISTORY_CACHE_TTL_SECONDS > 0:
+            if limit not in self.pages and len(self.pages) >= _MAX_PAGES:
+                self.pages.pop(next(iter(self.pages)))
+            self.pages[limit] = page
+        return page
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    If-None-Match check with weak comparison (RFC 9110 13.1.2).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+history_cache = HistoryCache()
@@ -0,0 +1,138 @@
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import List, Optional
+from loguru import logger
+from app.core.automaton import Automaton
+from app.core.config import settings
+from app.core.metrics import metrics
+
+_SEPARATORS_RE = re.compile(r"[\W_]+", re.UNICODE)
+# Space between Latin letters/digits and CJK, so "hi你好" still has word boundaries
+_SCRIPT_CHANGE_RE = re.compile(r"(?<=[a-z0-9])(?=[^\x00-\x7f])|(?<=[^\x00-\x7f])(?=[a-z0-9])")
+
+
+def normalize(text: str) -> str:
+    """
+    Full-width to half-width, case folded, punctuation and whitespace runs
+    collapsed to single spaces, padded with a space on both ends.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _SCRIPT_CHANGE_RE.sub(" ", _SEPARATORS_RE.sub(" ", text))
+    return f" {text.strip()} "
+
+
+def _pattern(text: str) -> str:
+    # English words must match whole ("hi" is not in "this"), CJK matches anywhere
+    norm = normalize(text).strip()
+    if norm[:1].isascii() and norm[:1].isalnum():
+        norm = " " + norm
+    if norm[-1:].isascii() and norm[-1:].isalnum():
+        norm = norm + " "
+    return norm
+
+
+class InstantAnswers:
+    """
+    Fixed-intent answers (greetings, "转人工", business hours ...) served
+    locally instead of calling the agent.
+
+    Rules come from INSTANT_RULES_PATH, re-read when its mtime changes
+    (checked every RELOAD_CHECK_SECONDS):
+
+        {"rules": [{"id": "greeting", "patterns": ["你好", "hello"], "answer": "...",
+                    "max_chars": 8, "priority": 1, "sources": [...]}]}
+
+    All patterns of all rules go into one automaton, so a question is scanned
+    once however many rules there are. A rule applies when any of its patterns
+    occurs in the normalized question and the question has at most
+    `max_chars` characters (without spaces; optional, keeps "你好，我想退款"
+    away from the greeting). Highest `priority` wins, then the longest pattern.
+    """
+
+    RELOAD_CHECK_SECONDS = 5
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rules: List[dict] = []
+        self.automaton: Optional[Automaton] = None
+        self.pattern_rules: List[int] = [] # Automaton pattern index -> rule index
+        self._mtime = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+        metrics.register_gauge("instant_answer_rules", lambda: len(self.rules))
+
+    def load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            if self._mtime is not None:
+                logger.warning(f"Instant answer rules {self.path} removed, keeping the last loaded ones")
+            return
+        if mtime == self._mtime:
+            return
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+
+        rules, patterns, pattern_rules = [], [], []
+        for rule in data["rules"]:
+            if not rule.get("id") or not rule.get("answer") or not rule.get("patterns"):
+                raise ValueError(f"Rule {rule.get('id')!r} needs an id, an answer and patterns")
+            for pattern in rule["patterns"]:
+                norm = _pattern(pattern)
+                if norm.strip():
+                    patterns.append(norm)
+                    pattern_rules.append(len(rules))
+            rules.append(rule)
+
+        # Swap everything at once, lookups never see half a rule set
+        self.rules, self.automaton, self.pattern_rules = rules, Automaton(patterns), pattern_rules
+        self._mtime = mtime
+        logger.info(f"Loaded {len(rules)} instant answer rules ({len(patterns)} patterns) from {self.path}")
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.RELOAD_CHECK_SECONDS:
+            return
+        with self._lock:
+            if now - self._checked_at < self.RELOAD_CHECK_SECONDS:
+                return
+            self._checked_at = now
+            try:
+                self.load()
+            except Exception as e:
+                # A broken edit keeps the previous rules in service
+                logger.error(f"Failed to load instant answer rules {self.path}: {e}")
+
+    def match(self, question: str) -> Optional[dict]:
+        """
+        The rule answering `question`, or None.
+        """
+        self.maybe_reload()
+        automaton, rules, pattern_rules = self.automaton, self.rules, self.pattern_rules
+        if automaton is None or not rules:
+            return None
+
+        text = normalize(question)
+        chars = len(text) - text.count(" ")
+        best, best_key = None, None
+        matches, _ = automaton.scan(text)
+        for _, index in matches:
+            rule = rules[pattern_rules[index]]
+            max_chars = rule.get("max_chars")
+            if max_chars is not None and chars > max_chars:
+                continue
+            key = (rule.get("priority", 0), len(automaton.patterns[index]))
+            if best_key is None or key > best_key:
+                best, best_key = rule, key
+        if best is None:
+            metrics.inc("instant_answer_lookups_total", result="miss")
+            return None
+        metrics.inc("instant_answer_lookups_total", result="hit")
+        return best
+
+
+instant_answers = InstantAnswers(settings.INSTANT_RULES_PATH)
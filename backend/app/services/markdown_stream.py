@@ -0,0 +1,169 @@
+import re
+import time
+from typing import List, Optional
+from app.core.metrics import metrics
+
+# Raw HTML in the model output is escaped (html=False) and markdown-it's link
+# validation drops javascript:/vbscript:/data: URLs, so fragments are safe to
+# insert as-is. breaks=True matches the frontend's marked.setOptions({breaks: true}).
+_md = None
+
+_FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+_HEADING_RE = re.compile(r"^ {0,3}#{1,6}(\s|$)")
+_BULLET_RE = re.compile(r"^[-*+]\s")
+_ORDERED_RE = re.compile(r"^(\d{1,9})[.)]\s")
+_TABLE_RE = re.compile(r"^\s*\|")
+
+
+def _renderer():
+    global _md
+    if _md is None:
+        from markdown_it import MarkdownIt
+        _md = MarkdownIt("commonmark", {"html": False, "breaks": True}).enable("table")
+    return _md
+
+
+def _is_list_item(line: str) -> bool:
+    return bool(_BULLET_RE.match(line) or _ORDERED_RE.match(line))
+
+
+def _list_marker(line: str) -> Optional[str]:
+    ordered = _ORDERED_RE.match(line)
+    if ordered:
+        return line[len(ordered.group(1))]
+    return line[0] if _BULLET_RE.match(line) else None
+
+
+def _interrupts_paragraph(line: str) -> bool:
+    # CommonMark: headings, fences, bullets and lists starting at 1 can interrupt a paragraph
+    if _HEADING_RE.match(line) or _FENCE_RE.match(line) or _BULLET_RE.match(line):
+        return True
+    ordered = _ORDERED_RE.match(line)
+    return bool(ordered) and ordered.group(1) == "1"
+
+
+class MarkdownBlockStream:
+    """
+    Incremental Markdown stage for streamed answers.
+
+    Text deltas are fed in as they arrive; whenever a top-level block is
+    complete (paragraph, heading, list item, table, code fence) it is rendered
+    to HTML exactly once. `offset` is how much of the answer is covered by
+    emitted fragments, in UTF-16 code units like the client's
+    String.slice, which only re-renders text after it. A list is one block
+    (all its items in one container, as the client would render it).
+    """
+
+    def __init__(self):
+        self.offset = 0 # UTF-16 code units of the answer covered by emitted blocks
+        self._pending = "" # Text after `offset` that isn't an emitted block yet
+        self._lines: List[str] = [] # Complete lines of the open block
+        self._open_chars = 0 # len("".join(self._lines))
+        self._kind: Optional[str] = None # paragraph | list | table | fence
+        self._fence = None
+        self._marker = None # List marker ("-", "*", "+", "." or ")"), another one starts a new list
+        self._list_gap = False # Blank line seen inside the list, next line decides whether it goes on
+
+    def feed(self, text: str) -> List[str]:
+        self._pending += text
+        blocks = []
+        # Only complete lines can close a block; a partial last line stays pending
+        while True:
+            newline = self._pending.find("\n", self._open_chars)
+            if newline == -1:
+                break
+            blocks.extend(self._add_line(self._pending[self._open_chars:newline + 1]))
+        return blocks
+
+    def flush(self) -> List[str]:
+        """
+        End of answer: whatever is left is the last block.
+        """
+        if not self._pending.strip():
+            return []
+        self._lines = [self._pending]
+        return [self._close()]
+
+    def _append(self, line: str):
+        self._lines.append(line)
+        self._open_chars += len(line)
+
+    def _add_line(self, line: str) -> List[str]:
+        stripped = line.strip()
+        blocks = []
+
+        if self._kind == "fence":
+            self._append(line)
+            closing = _FENCE_RE.match(line)
+            if closing and closing.group(1)[0] == self._fence[0] and len(closing.group(1)) >= len(self._fence) and not line.strip(" `~\n"):
+                blocks.append(self._close())
+            return blocks
+
+        if not stripped:
+            # Blank line closes any open block (the blank line itself belongs to it),
+            # except a list, which goes on if another item or an indented line follows
+            self._append(line)
+            if self._kind == "list":
+                self._list_gap = True
+            elif self._kind is not None:
+                blocks.append(self._close())
+            return blocks
+
+        if self._kind == "list":
+            marker = _list_marker(line)
+            if marker is not None and marker != self._marker:
+                blocks.append(self._close()) # Different marker: a new list
+            elif self._list_gap and marker is None and not line[:1].isspace():
+                blocks.append(self._close()) # Blank line, then something else: the list is done
+            else:
+                self._list_gap = False
+        elif self._kind == "table" and not _TABLE_RE.match(line):
+            blocks.append(self._close())
+        elif self._kind == "paragraph" and _interrupts_paragraph(line):
+            blocks.append(self._close())
+
+        self._append(line)
+        if self._kind is None:
+            fence = _FENCE_RE.match(line)
+            if fence:
+                self._kind, self._fence = "fence", fence.group(1)
+            elif _HEADING_RE.match(line):
+                blocks.append(self._close()) # Single-line block
+            elif _is_list_item(line):
+                self._kind, self._marker = "list", _list_marker(line)
+            elif _TABLE_RE.match(line):
+                self._kind = "table"
+            else:
+                self._kind = "paragraph"
+        return blocks
+
+    def _close(self) -> str:
+        source = "".join(self._lines)
+        self._lines = []
+        self._open_chars = 0
+        self._kind = self._fence = self._marker = None
+        self._list_gap = False
+        self._pending = self._pending[len(source):]
+        self.offset += len(source.encode("utf-16-le")) // 2
+
+        start = time.perf_counter()
+        html = _renderer().render(source)
+        metrics.observe("markdown_block_render_seconds", time.perf_counter() - start)
+        metrics.inc("markdown_blocks_total")
+        return html
+
+
+def annotate(event: dict, stream: MarkdownBlockStream) -> dict:
+    """
+    Add `html_blocks` (fragments completed by this frame) and `md_offset`
+    to one stream event. The last frame (is_finish) also flushes the tail.
+    """
+    start = time.perf_counter()
+    blocks = stream.feed(event["text"]) if event.get("text") else []
+    if event.get("is_finish"):
+        blocks.extend(stream.flush())
+    if blocks:
+        event["html_blocks"] = blocks
+    event["md_offset"] = stream.offset
+    metrics.observe("markdown_frame_seconds", time.perf_counter() - start)
+    return event
@@ -0,0 +1,78 @@
+"""
+Drop-in stand-in for the parts of the DashScope SDK that BailianService uses,
+for load tests and local development without credentials (BAILIAN_MOCK=true).
+
+It streams a Workflow 2.0 style answer: the end node's JSON output
+({"llm_result": ..., "rag_result": ...}) arrives in pieces via
+output.workflow_message, like the real agent with flow_stream_mode="message_format".
+"""
+import json
+import random
+import time
+import uuid
+from http import HTTPStatus
+from types import SimpleNamespace
+from app.core.config import settings
+
+base_http_api_url = "http://mock-upstream.invalid/api/v1"
+
+_ANSWER_SENTENCE = "路觅科技为客户提供一站式智能客服解决方案，支持知识库检索与联网搜索。"
+
+
+class _MockResponse:
+    def __init__(self, request_id, status_code=HTTPStatus.OK, output=None, usage=None, code=None, message=None):
+        self.request_id = request_id
+        self.status_code = status_code
+        self.output = output
+        self.usage = usage
+        self.code = code
+        self.message = message
+
+
+def _build_payload(prompt: str) -> str:
+    repeats = max(1, settings.MOCK_ANSWER_CHARS // len(_ANSWER_SENTENCE))
+    answer = f"关于「{prompt[:50]}」:\n\n" + "\n".join(_ANSWER_SENTENCE for _ in range(repeats))
+    rag_result = {
+        "chunkList": [
+            {"title": f"知识库文档 {i}", "docUrl": f"https://example.com/doc/{i}", "content": _ANSWER_SENTENCE * 4, "score": 0.9 - i * 0.1}
+            for i in range(settings.MOCK_SOURCES)
+        ]
+    }
+    return json.dumps({"llm_result": answer, "rag_result": rag_result}, ensure_ascii=False)
+
+
+class Application:
+    @staticmethod
+    def call(app_id=None, prompt="", session_id=None, stream=True, **kwargs):
+        request_id = str(uuid.uuid4())
+
+        if random.random() < settings.MOCK_ERROR_RATE:
+            raise ConnectionError("Mock upstream: connection reset")
+
+        slow = random.random() < settings.MOCK_SLOW_RATE
+        reset = random.random() < settings.MOCK_MIDSTREAM_ERROR_RATE
+
+        def generate():
+            time.sleep((settings.MOCK_SLOW_TTFT_MS if slow else settings.MOCK_TTFT_MS) / 1000)
+            payload = _build_payload(prompt)
+            step = max(1, settings.MOCK_CHUNK_CHARS)
+            # The real agent emits the opening key in one piece, split the rest evenly
+            head = len('{"llm_result": "')
+            pieces = [payload[:head]] + [payload[i:i + step] for i in range(head, len(payload), step)]
+            usage = SimpleNamespace(input_tokens=len(prompt), output_tokens=len(payload) // 2)
+            reset_at = random.randrange(1, len(pieces)) if reset and len(pieces) > 1 else None
+
+            for seq, piece in enumerate(pieces):
+                if seq == reset_at:
+                    raise ConnectionError("Mock upstream: stream reset mid-answer")
+                is_last = seq == len(pieces) - 1
+                output = SimpleNamespace(
+                    text=None,
+                    finish_reason="stop" if is_last else "null",
+                    workflow_message={"node_msg_seq_id": seq, "message": {"role": "assistant", "content": piece}},
+                )
+                yield _MockResponse(request_id, output=output, usage=usage if is_last else None)
+                if not is_last:
+                    time.sleep(settings.MOCK_CHUNK_INTERVAL_MS / 1000)
+
+        return generate()
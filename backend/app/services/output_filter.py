@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from typing import List, Optional
+from loguru import logger
+from app.core.automaton import Automaton
+from app.core.config import settings
+from app.core.metrics import metrics
+
+
+def _folded(text: str) -> str:
+    # Case-insensitive matching without shifting positions (a few characters change length when lowered)
+    lowered = text.lower()
+    return lowered if len(lowered) == len(text) else text
+
+
+class FilterStream:
+    """
+    Masks the terms of one answer as its text arrives in pieces.
+
+    Only the characters that could still be the start of a term are held back:
+    the automaton state's depth, never more than the longest term minus one
+    character, whatever the chunk sizes. Everything before that is final and
+    released right away; `flush` releases the rest when the answer ends.
+    """
+
+    __slots__ = ("automaton", "state", "pending", "masked", "mask_char")
+
+    def __init__(self, automaton: Automaton, mask_char: str):
+        self.automaton = automaton
+        self.state = 0
+        self.pending = "" # Held back, may still turn out to be part of a term
+        self.masked: List[bool] = []
+        self.mask_char = mask_char
+
+    def feed(self, text: str) -> str:
+        if not text:
+            return ""
+        start = len(self.pending)
+        self.pending += text
+        self.masked += [False] * len(text)
+        matches, self.state = self.automaton.scan(_folded(text), self.state)
+        if matches:
+            patterns = self.automaton.patterns
+            for end, index in matches:
+                end += start
+                self.masked[end - len(patterns[index]):end] = [True] * len(patterns[index])
+            metrics.inc("output_filter_masked_total", len(matches))
+        # A term completed by a later character starts at most longest - 1 characters back
+        keep = min(self.automaton.depth(self.state), self.automaton.longest - 1)
+        return self._release(len(self.pending) - keep)
+
+    def flush(self) -> str:
+        self.state = 0
+        return self._release(len(self.pending))
+
+    def _release(self, count: int) -> str:
+        if count <= 0:
+            return ""
+        out, masked = self.pending[:count], self.masked[:count]
+        self.pending, self.masked = self.pending[count:], self.masked[count:]
+        if any(masked):
+            out = "".join(self.mask_char if m else ch for ch, m in zip(out, masked))
+        return out
+
+    def apply(self, event: dict) -> dict:
+        """
+        Filter the text of one answer event in place; the last event
+        (finish or error) also carries whatever was still held back.
+        """
+        text = self.feed(event.get("text") or "")
+        if event.get("is_finish") or event.get("error"):
+            text += self.flush()
+        if text or "text" in event:
+            event["text"] = text
+        return event
+
+
+class OutputFilter:
+    """
+    Terms to mask in answers (compliance), one per line in
+    OUTPUT_FILTER_TERMS_PATH (`#` starts a comment line), matched
+    case-insensitively. All terms are compiled into one automaton, so the
+    cost per character does not grow with the dictionary. The file is re-read
+    when its mtime changes (checked every RELOAD_CHECK_SECONDS); streams that
+    already started keep the terms they started with.
+    """
+
+    RELOAD_CHECK_SECONDS = 30
+
+    def __init__(self, path: str):
+        self.path = path
+        self.automaton: Optional[Automaton] = None
+        self._mtime = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+        metrics.register_gauge("output_filter_terms", lambda: len(self.automaton) if self.automaton else 0)
+
+    def load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return # No terms configured
+        if mtime == self._mtime:
+            return
+        with open(self.path, encoding="utf-8") as f:
+            terms = {_folded(line.strip()) for line in f if line.strip() and not line.lstrip().startswith("#")}
+        start = time.perf_counter()
+        self.automaton = Automaton(sorted(terms))
+        self._mtime = mtime
+        logger.info(f"Loaded {len(terms)} output filter terms from {self.path} in {int((time.perf_counter() - start) * 1000)}ms")
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.RELOAD_CHECK_SECONDS:
+            return
+        with self._lock:
+            if now - self._checked_at < self.RELOAD_CHECK_SECONDS:
+                return
+            self._checked_at = now
+            try:
+                self.load()
+            except Exception as e:
+                logger.error(f"Failed to load output filter terms {self.path}: {e}")
+
+    def stream(self) -> Optional[FilterStream]:
+        """
+        A filter for one answer, or None when there are no terms.
+        """
+        self.maybe_reload()
+        if not self.automaton:
+            return None
+        return FilterStream(self.automaton, settings.OUTPUT_FILTER_MASK_CHAR)
+
+
+output_filter = OutputFilter(settings.OUTPUT_FILTER_TERMS_PATH)
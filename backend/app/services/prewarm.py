@@ -0,0 +1,159 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from loguru import logger
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.session import engine, warm_up_pool
+from app.services import upstream
+
+
+class WarmSlot:
+    """
+    One pre-opened upstream connection reserved for a session
+    (a dedicated requests.Session holding a keep-alive connection).
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.http_session = upstream.new_http_session()
+        self.created_at = time.monotonic()
+        self.expires_at = self.created_at + settings.PREWARM_TTL_SECONDS
+        self.ready = False
+        self.warming = True # The handshake thread may still be using http_session
+        self.discarded = False
+        self.task = None # Warm-up task, referenced so it isn't garbage collected
+
+
+class PrewarmPool:
+    """
+    Speculative pre-warming while the user is typing.
+
+    /chat/prepare reserves a slot for the session: TCP/TLS to DashScope is done
+    in the background, and the shared DB pool is made to hold at least one open
+    connection (not reserved for the session). The next /chat/ask of that
+    session takes the slot and streams over the already open connection.
+    Slots not taken within PREWARM_TTL_SECONDS (or pushed out by
+    PREWARM_MAX_SLOTS) are closed and counted as wasted.
+
+    Each client may open at most PREWARM_SLOTS_PER_CLIENT_MINUTE new slots per
+    minute (per worker), so random session ids can't flush everyone's slots
+    or fan out upstream handshakes; extending an existing slot is free.
+
+    Slots live in the worker that served /chat/prepare. nginx keeps a session
+    on one replica, but gunicorn workers of a replica share the listening
+    socket, so /chat/ask may land on a worker without the slot. The per-worker
+    hit ratio (prewarm_hit_ratio) shows how often that happens.
+    """
+
+    def __init__(self):
+        self.slots: "OrderedDict[str, WarmSlot]" = OrderedDict()
+        self._created: Dict[str, int] = {} # Client -> slots opened in the current minute
+        self._window = 0
+        self._hits = 0
+        self._lookups = 0
+        metrics.register_gauge("prewarm_slots_active", lambda: len(self.slots))
+        # Live workers only (gauges of a dead worker are dropped), so the pid label doesn't pile up
+        metrics.register_gauge("prewarm_hit_ratio", lambda: self._hits / self._lookups if self._lookups else 0.0, worker=os.getpid())
+
+    def prepare(self, session_id: str, client: str) -> Optional[WarmSlot]:
+        """
+        The session's slot (new or extended), or None when `client` is over
+        its rate of new slots.
+        """
+        self._evict_expired()
+        slot = self.slots.get(session_id)
+        if slot is not None:
+            # Still typing: keep the same connection a little longer
+            slot.expires_at = time.monotonic() + settings.PREWARM_TTL_SECONDS
+            self.slots.move_to_end(session_id)
+            metrics.inc("prewarm_prepare_total", result="extended")
+            return slot
+
+        window = int(time.monotonic() // 60)
+        if window != self._window:
+            self._window, self._created = window, {}
+        if self._created.get(client, 0) >= settings.PREWARM_SLOTS_PER_CLIENT_MINUTE:
+            metrics.inc("prewarm_prepare_total", result="throttled")
+            return None
+        self._created[client] = self._created.get(client, 0) + 1
+
+        while len(self.slots) >= settings.PREWARM_MAX_SLOTS:
+            _, oldest = self.slots.popitem(last=False)
+            self._discard(oldest, "capacity")
+
+        slot = WarmSlot(session_id)
+        self.slots[session_id] = slot
+        slot.task = asyncio.create_task(self._warm(slot))
+        metrics.inc("prewarm_prepare_total", result="created")
+        return slot
+
+    def take(self, session_id: Optional[str]):
+        """
+        Hand the session's warm requests.Session to the caller (who closes it
+        when done), or None if there is no usable slot.
+        """
+        self._evict_expired()
+        if not session_id:
+            return None
+        self._lookups += 1
+        slot = self.slots.pop(session_id, None)
+        if slot is None:
+            # Never prepared, expired, or prepared on another worker
+            metrics.inc("prewarm_take_total", result="miss")
+            return None
+        if not slot.ready:
+            # Handshake still running: use the shared pool rather than wait
+            self._discard(slot, "not_ready")
+            return None
+        self._hits += 1
+        metrics.inc("prewarm_take_total", result="hit")
+        metrics.inc("prewarm_slots_total", outcome="used")
+        metrics.observe("prewarm_slot_age_seconds", time.monotonic() - slot.created_at)
+        return slot.http_session
+
+    async def _warm(self, slot: WarmSlot):
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            self._open(slot),
+            warm_up_pool(engine, 1),
+            return_exceptions=True,
+        )
+        slot.ready = results[0] is True
+        metrics.observe("prewarm_warm_seconds", time.perf_counter() - start)
+        if isinstance(results[1], Exception):
+            logger.warning(f"Pre-warm DB touch failed: {results[1]}")
+
+    async def _open(self, slot: WarmSlot) -> bool:
+        try:
+            return await asyncio.to_thread(upstream.open_connection, slot.http_session)
+        finally:
+            slot.warming = False
+            if slot.discarded:
+                # Discarded mid-handshake: the session was left to us to close
+                slot.http_session.close()
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = [sid for sid, slot in self.slots.items() if slot.expires_at < now]
+        for sid in expired:
+            self._discard(self.slots.pop(sid), "expired")
+
+    def _discard(self, slot: WarmSlot, reason: str):
+        metrics.inc("prewarm_slots_total", outcome=reason)
+        logger.debug(f"Discarding pre-warm slot of {slot.session_id} ({reason}, age {time.monotonic() - slot.created_at:.1f}s)")
+        slot.discarded = True
+        # A still-running handshake (bounded by UPSTREAM_CONNECT_TIMEOUT) is left to finish
+        # and closes the session itself; closing it under the thread could leak the connection
+        if not slot.warming:
+            slot.http_session.close()
+
+    def close(self):
+        for slot in list(self.slots.values()):
+            self._discard(slot, "shutdown")
+        self.slots.clear()
+
+
+prewarm_pool = PrewarmPool()
@@ -0,0 +1,360 @@
+import collections
+import random
+import threading
+import time
+from http import HTTPStatus
+from typing import Any, Callable, Iterable, Optional
+from loguru import logger
+from app.core.config import settings
+from app.core.metrics import metrics, percentile
+
+# Resilience layer for the synchronous DashScope calls made from the producer
+# threads of BailianService.stream_events. Everything here is thread-based and
+# thread-safe: the calls block, so they never run on the event loop.
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised (as an error frame) instead of calling upstream while the circuit is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed:    calls go through; `failure_threshold` failed calls in a row open it.
+    open:      calls are rejected immediately for `cooldown` seconds.
+    half_open: one probe call is let through; its outcome closes or re-opens it.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+    _NAMES = {CLOSED: "closed", HALF_OPEN: "half_open", OPEN: "open"}
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        metrics.register_gauge("upstream_circuit_state", lambda: self.state)
+
+    @property
+    def state_name(self) -> str:
+        return self._NAMES[self.state]
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    return False
+                self._transition(self.HALF_OPEN)
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def release(self):
+        """
+        The call ended without an outcome (consumer went away): free the probe slot.
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._transition(self.OPEN)
+
+    def _transition(self, state: int):
+        logger.warning("Upstream circuit {old} -> {new}", old=self._NAMES[self.state], new=self._NAMES[state])
+        self.state = state
+        metrics.inc("upstream_circuit_transitions_total", to=self._NAMES[state])
+
+
+class HedgePolicy:
+    """
+    Decides when (and whether) to send a second, hedged call.
+
+    The delay is the HEDGE_PERCENTILE of recent upstream TTFTs (clamped to
+    [HEDGE_MIN_DELAY_MS, HEDGE_MAX_DELAY_MS]), so only the slowest ~5% of calls
+    are hedged. A token bucket refilled by HEDGE_BUDGET_RATIO per call caps the
+    extra upstream load regardless of how the latency distribution moves.
+    """
+
+    def __init__(self, window: int = 500):
+        self._ttfts = collections.deque(maxlen=window)
+        self._tokens = 1.0
+        self._lock = threading.Lock()
+        metrics.register_gauge("upstream_hedge_delay_seconds", lambda: self.delay() or 0.0)
+
+    def observe_ttft(self, seconds: float):
+        self._ttfts.append(seconds)
+
+    def delay(self) -> Optional[float]:
+        """
+        Seconds to wait for a first chunk before hedging, None while hedging is off.
+        """
+        if not settings.HEDGE_ENABLED:
+            return None
+        samples = list(self._ttfts)
+        if len(samples) < settings.HEDGE_MIN_SAMPLES:
+            return settings.HEDGE_MAX_DELAY_MS / 1000 # Not enough data, only hedge the obvious hangs
+        delay_ms = percentile(samples, settings.HEDGE_PERCENTILE) * 1000
+        return min(settings.HEDGE_MAX_DELAY_MS, max(settings.HEDGE_MIN_DELAY_MS, delay_ms)) / 1000
+
+    def on_call(self):
+        with self._lock:
+            self._tokens = min(10.0, self._tokens + settings.HEDGE_BUDGET_RATIO)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+
+breaker = CircuitBreaker(settings.UPSTREAM_BREAKER_FAILURES, settings.UPSTREAM_BREAKER_COOLDOWN_SECONDS)
+hedge_policy = HedgePolicy()
+
+
+class _AttemptSession:
+    """
+    One attempt's view of a requests.Session (usually the shared pool): keeps
+    the streaming response, so another thread can abort the attempt by shutting
+    its socket down. That wakes a read blocked on it right away, where closing
+    the iterator would only be noticed at the next chunk (or the read timeout).
+    """
+
+    def __init__(self, session):
+        self._session = session
+        self._lock = threading.Lock()
+        self.response = None
+        self.aborted = False
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def post(self, *args, **kwargs):
+        if self.aborted:
+            raise ConnectionAbortedError("Upstream attempt aborted before sending")
+        response = self._session.post(*args, **kwargs)
+        with self._lock:
+            self.response = response
+            aborted = self.aborted
+        if aborted:
+            _shutdown(response) # Aborted while the request was being sent
+        return response
+
+    def abort(self):
+        with self._lock:
+            self.aborted = True
+            response = self.response
+        if response is not None:
+            _shutdown(response)
+
+
+def _shutdown(response):
+    try:
+        response.raw.shutdown()
+    except Exception:
+        pass # Already finished or released to the pool: nothing left to interrupt
+
+
+class UpstreamCall:
+    """
+    One logical upstream call: retries before the first chunk, an optional hedged
+    attempt, and the circuit breaker around all of it.
+
+    `call(session)` starts a streaming request and returns its iterator of
+    responses; `emit(item)` receives the winning attempt's responses, then None
+    (done) or an Exception. Runs in the caller's (producer) thread, each attempt
+    in its own thread. The first attempt to produce a chunk wins; the others are
+    aborted at the socket, as are all of them when the call is cancelled.
+
+    The breaker sees one outcome per call: the winner's, or a failure once every
+    attempt of the last round failed. A hedge that fails after the other attempt
+    won is not a failure of the upstream call.
+    """
+
+    def __init__(self, call: Callable[[Any], Iterable], emit: Callable[[Any], None], primary_session, fallback_session):
+        self.call = call
+        self.emit = emit
+        self.primary_session = primary_session
+        self.fallback_session = fallback_session # For the hedge and retries
+        self.cancelled = threading.Event() # Set when the consumer goes away
+        self._lock = threading.Lock()
+        self._winner = None
+        self._running = 0
+        self._errors = []
+        self._attempts = {} # attempt no -> _AttemptSession, while it runs
+        self._decided = threading.Event() # First chunk arrived, or every attempt failed
+        self._settled = threading.Event() # The winner finished, or every attempt failed
+
+    def cancel(self):
+        self.cancelled.set()
+        self._abort(except_no=None)
+
+    def run(self):
+        hedge_policy.on_call()
+        attempt_no = 0
+        for retry in range(settings.UPSTREAM_RETRIES + 1):
+            if not breaker.allow():
+                metrics.inc("upstream_calls_total", outcome="rejected")
+                self.emit(CircuitOpenError("Upstream temporarily unavailable (circuit open), please retry later"))
+                return
+
+            self._decided.clear()
+            self._settled.clear()
+            self._errors = []
+            self._start(attempt_no, self.primary_session if retry == 0 else self.fallback_session, hedge=False)
+            attempt_no += 1
+
+            delay = hedge_policy.delay()
+            if delay is not None and not self._decided.wait(delay):
+                if breaker.state == CircuitBreaker.CLOSED and hedge_policy.try_spend():
+                    if self._start(attempt_no, self.fallback_session, hedge=True):
+                        metrics.inc("upstream_hedges_total", outcome="launched")
+                        attempt_no += 1
+                else:
+                    metrics.inc("upstream_hedges_total", outcome="skipped")
+
+            # Backstop: the consumer cancels at its own total deadline, which aborts the attempts
+            if not self._settled.wait(settings.UPSTREAM_TOTAL_TIMEOUT + settings.UPSTREAM_CONNECT_TIMEOUT):
+                logger.error("Bailian API call did not settle in time, aborting its attempts")
+                self.cancel()
+                breaker.release()
+                return
+            if self._winner is not None:
+                return
+            if self.cancelled.is_set():
+                breaker.release()
+                return
+
+            # Every attempt of this round failed before its first chunk
+            breaker.record_failure()
+            error = self._errors[-1]
+            if retry < settings.UPSTREAM_RETRIES:
+                backoff = 0.2 * (2 ** retry) * (0.5 + random.random()) # Jittered, so retries don't synchronize
+                logger.warning("Bailian API attempt {attempt} failed: {error}. Retrying in {backoff_ms}ms",
+                               attempt=retry + 1, error=error, backoff_ms=int(backoff * 1000))
+                if self.cancelled.wait(backoff):
+                    return
+                continue
+            logger.error("Bailian API failed after {attempts} attempts: {error}", attempts=retry + 1, error=error)
+            self.emit(error)
+
+    def _start(self, attempt_no: int, session, hedge: bool) -> bool:
+        attempt_session = _AttemptSession(session)
+        with self._lock:
+            if hedge and self._settled.is_set():
+                return False # The round ended while the hedge was being decided
+            self._running += 1
+            self._attempts[attempt_no] = attempt_session
+        threading.Thread(target=self._attempt, args=(attempt_no, attempt_session, hedge), daemon=True).start()
+        return True
+
+    def _abort(self, except_no: Optional[int]):
+        with self._lock:
+            attempts = [a for no, a in self._attempts.items() if no != except_no]
+        for attempt in attempts:
+            attempt.abort()
+
+    def _attempt(self, attempt_no: int, session: _AttemptSession, hedge: bool):
+        started = time.monotonic()
+        responses = None
+        ok = True
+        try:
+            responses = self.call(session)
+            for response in responses:
+                if self._winner != attempt_no:
+                    with self._lock:
+                        if self._winner is None and not self.cancelled.is_set():
+                            self._winner = attempt_no
+                            self._decided.set()
+                    if self._winner != attempt_no:
+                        # Lost the race (or nobody is listening anymore): stop reading, close the stream
+                        if self.cancelled.is_set():
+                            metrics.inc("upstream_attempts_cancelled_total", reason="cancelled")
+                        else:
+                            metrics.inc("upstream_attempts_cancelled_total", reason="lost")
+                            if hedge:
+                                metrics.inc("upstream_hedges_total", outcome="lost")
+                        return
+                    self._abort(except_no=attempt_no) # The others are still waiting for a first chunk
+                    hedge_policy.observe_ttft(time.monotonic() - started)
+                    if hedge:
+                        metrics.inc("upstream_hedges_total", outcome="won")
+                    # A non-OK status (throttling, 5xx) is still streamed to the client as an error frame
+                    ok = response.status_code == HTTPStatus.OK
+                if self.cancelled.is_set():
+                    metrics.inc("upstream_attempts_cancelled_total", reason="cancelled")
+                    if ok:
+                        breaker.release()
+                    return
+                self.emit(response)
+
+            if self.cancelled.is_set() or session.aborted:
+                # The stream ended because it was shut down, not because the answer was complete
+                metrics.inc("upstream_attempts_cancelled_total", reason="cancelled" if self.cancelled.is_set() else "lost")
+                if self._winner == attempt_no:
+                    breaker.release()
+                return
+            if self._winner is None:
+                raise RuntimeError("Upstream stream ended without a response")
+            if self._winner == attempt_no:
+                if ok:
+                    breaker.record_success()
+                    metrics.inc("upstream_calls_total", outcome="success")
+                else:
+                    breaker.record_failure()
+                    metrics.inc("upstream_calls_total", outcome="error")
+                self.emit(None)
+        except Exception as e:
+            if self._winner == attempt_no:
+                if self.cancelled.is_set():
+                    # Aborted by cancel(): the consumer is gone, not an upstream failure
+                    metrics.inc("upstream_attempts_cancelled_total", reason="cancelled")
+                    breaker.release()
+                else:
+                    # Failed mid-stream: the text so far was already sent, no retry
+                    breaker.record_failure()
+                    metrics.inc("upstream_calls_total", outcome="error")
+                    logger.error("Bailian API failed mid-stream: {error}", error=e)
+                    self.emit(e)
+            elif session.aborted:
+                reason = "cancelled" if self.cancelled.is_set() else "lost"
+                metrics.inc("upstream_attempts_cancelled_total", reason=reason)
+                if hedge and reason == "lost":
+                    metrics.inc("upstream_hedges_total", outcome="lost")
+            else:
+                self._errors.append(e)
+                metrics.inc("upstream_attempts_failed_total", kind="hedge" if hedge else "primary")
+        finally:
+            if responses is not None and hasattr(responses, "close"):
+                try:
+                    responses.close() # Releases the HTTP connection of an abandoned stream
+                except Exception:
+                    pass
+            with self._lock:
+                self._attempts.pop(attempt_no, None)
+                self._running -= 1
+                # Set under the lock, so _start can't add a hedge to a round that already ended
+                if self._winner == attempt_no or (self._winner is None and self._running == 0):
+                    self._decided.set()
+                    self._settled.set()
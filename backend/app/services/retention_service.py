@@ -0,0 +1,224 @@
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from loguru import logger
+from sqlalchemy import delete, select, text
+from app.core.cache import get_cache
+from app.core.config import settings
+from app.core.lifecycle import streams
+from app.core.metrics import metrics
+from app.db.session import AsyncSessionLocal, engine
+from app.models.chat_log import ChatLog
+from app.models.usage_rollup import UsageRollup
+from app.services.faq_index import forget_rows
+from app.services.history_cache import history_cache
+
+
+_CREATED_AT_INDEX = "ix_chat_logs_created_at"
+_INDEX_LOCK_KEY = 0x6c756d69 # pg advisory lock for the index build, any constant unique to this app
+
+
+def _job_key(job_id: str) -> str:
+    return f"retention:job:{job_id}"
+
+
+class DeletionJob:
+    """
+    Progress of one bulk delete. Published to the shared cache every
+    RETENTION_PROGRESS_EVERY batches, so GET /chat/history/jobs/{id} works
+    from any worker.
+    """
+
+    def __init__(self, kind: str, criteria: dict):
+        self.id = str(uuid.uuid4())
+        self.kind = kind # session | before | retention
+        self.criteria = criteria
+        self.status = "running"
+        self.deleted = 0
+        self.batches = 0
+        self.max_batch_ms = 0 # Longest single statement, i.e. the longest time locks were held
+        self.error = None
+        self.started = time.monotonic()
+        self.finished = None
+        self.started_at = datetime.now(timezone.utc)
+        self.finished_at = None
+        self.task = None # Referenced so it isn't garbage collected
+
+    def to_dict(self) -> dict:
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "criteria": self.criteria,
+            "status": self.status,
+            "deleted": self.deleted,
+            "batches": self.batches,
+            "max_batch_ms": self.max_batch_ms,
+            "elapsed_s": round(elapsed, 2),
+            "rows_per_second": round(self.deleted / elapsed) if elapsed > 0 else None,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error,
+        }
+
+    async def publish(self):
+        try:
+            await get_cache().set(_job_key(self.id), json.dumps(self.to_dict()), ttl=settings.RETENTION_JOB_TTL_SECONDS)
+        except Exception as e:
+            logger.warning(f"Failed to publish deletion job {self.id}: {e}")
+
+
+class RetentionService:
+    @staticmethod
+    def start(kind: str, criteria: dict, session_id: Optional[str] = None, before: Optional[datetime] = None) -> DeletionJob:
+        """
+        Run a bulk delete in the background (see run) and return its job.
+        """
+        job = DeletionJob(kind, criteria)
+        job.task = streams.track_write(RetentionService.run(job, session_id, before))
+        return job
+
+    @staticmethod
+    async def run(job: DeletionJob, session_id: Optional[str] = None, before: Optional[datetime] = None) -> DeletionJob:
+        """
+        Delete the chat_logs rows of a session and/or created before a date,
+        RETENTION_BATCH_SIZE rows per statement, each batch its own short
+        transaction (DELETE ... WHERE id IN (SELECT id ... ORDER BY id LIMIT n)),
+        with RETENTION_BATCH_PAUSE_SECONDS between batches so other writers
+        are not starved. A session delete also drops its per-session rollups
+        and the FAQ canonical answers copied from its rows.
+        """
+        criteria = []
+        if session_id is not None:
+            criteria.append(ChatLog.session_id == session_id)
+        if before is not None:
+            criteria.append(ChatLog.created_at < before)
+        if not criteria:
+            raise ValueError("Refusing to delete without a session or a date bound")
+
+        privacy = session_id is not None and before is None
+        if privacy:
+            # Ids first, the FAQ files only know the rows they copied answers from
+            async with AsyncSessionLocal() as session:
+                row_ids = set((await session.execute(select(ChatLog.id).where(*criteria))).scalars())
+
+        batch_ids = select(ChatLog.id).where(*criteria).order_by(ChatLog.id).limit(settings.RETENTION_BATCH_SIZE)
+        statement = delete(ChatLog).where(ChatLog.id.in_(batch_ids)).execution_options(synchronize_session=False)
+        await job.publish()
+        logger.info(f"Deletion job {job.id} started: {job.kind} {job.criteria}")
+        try:
+            while True:
+                batch_start = time.perf_counter()
+                async with AsyncSessionLocal() as session:
+                    result = await session.execute(statement)
+                    await session.commit()
+                batch_ms = int((time.perf_counter() - batch_start) * 1000)
+                deleted = result.rowcount or 0
+                job.batches += 1
+                job.deleted += deleted
+                job.max_batch_ms = max(job.max_batch_ms, batch_ms)
+                metrics.inc("chat_logs_deleted_total", deleted, kind=job.kind)
+                metrics.observe("chat_logs_delete_batch_seconds", batch_ms / 1000)
+                if deleted:
+                    await history_cache.invalidate()
+                if job.batches % settings.RETENTION_PROGRESS_EVERY == 0:
+                    progress = job.to_dict()
+                    logger.info(f"Deletion job {job.id}: {job.deleted} rows in {job.batches} batches, {progress['rows_per_second']} rows/s")
+                    await job.publish()
+                if deleted < settings.RETENTION_BATCH_SIZE:
+                    break
+                await asyncio.sleep(settings.RETENTION_BATCH_PAUSE_SECONDS)
+
+            if privacy:
+                # Privacy delete: the per-session aggregates go too (tenant aggregates carry no session)
+                async with AsyncSessionLocal() as session:
+                    await session.execute(delete(UsageRollup).where(
+                        UsageRollup.dimension == "session", UsageRollup.dim_key == session_id))
+                    await session.commit()
+                dropped = await asyncio.to_thread(forget_rows, row_ids)
+                if dropped:
+                    logger.info(f"Deletion job {job.id}: dropped {dropped} FAQ answers taken from the session")
+            job.status = "done"
+        except asyncio.CancelledError:
+            # Abandoned at shutdown (drain write timeout): don't leave the job "running" forever
+            logger.warning(f"Deletion job {job.id} interrupted after {job.deleted} rows")
+            job.status = "interrupted"
+            job.error = "Interrupted by a shutdown, start it again to finish"
+            await RetentionService._finish(job)
+            raise
+        except Exception as e:
+            logger.exception(f"Deletion job {job.id} failed after {job.deleted} rows")
+            job.status = "failed"
+            job.error = str(e)
+        await RetentionService._finish(job)
+        return job
+
+    @staticmethod
+    async def _finish(job: DeletionJob):
+        job.finished = time.monotonic()
+        job.finished_at = datetime.now(timezone.utc)
+        await job.publish()
+        logger.info(f"Deletion job {job.id} {job.status}: {job.to_dict()}")
+
+    @staticmethod
+    async def ensure_index():
+        """
+        Create the chat_logs.created_at index on databases that predate it
+        (create_all only adds missing tables). Idempotent; on PostgreSQL the
+        build is CONCURRENTLY, so writes go on meanwhile, and an advisory
+        lock keeps several workers from building it at once.
+        """
+        if engine.dialect.name != "postgresql":
+            async with engine.begin() as conn:
+                await conn.execute(text(f"CREATE INDEX IF NOT EXISTS {_CREATED_AT_INDEX} ON chat_logs (created_at)"))
+            return
+
+        # CONCURRENTLY can't run inside a transaction
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            if not await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": _INDEX_LOCK_KEY}):
+                return # Another worker is on it
+            try:
+                valid = await conn.scalar(text(
+                    "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+                ), {"name": _CREATED_AT_INDEX})
+                if valid:
+                    return
+                if valid is not None:
+                    # Left invalid by an interrupted build; IF NOT EXISTS would keep it as is
+                    await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {_CREATED_AT_INDEX}"))
+                start = time.perf_counter()
+                logger.info(f"Building index {_CREATED_AT_INDEX} on chat_logs, writes continue meanwhile")
+                await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {_CREATED_AT_INDEX} ON chat_logs (created_at)"))
+                logger.info(f"Built index {_CREATED_AT_INDEX} in {time.perf_counter() - start:.1f}s")
+            finally:
+                await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _INDEX_LOCK_KEY})
+
+    @staticmethod
+    async def get_job(job_id: str) -> Optional[dict]:
+        value = await get_cache().get(_job_key(job_id))
+        return json.loads(value) if value else None
+
+    @staticmethod
+    async def retention_loop():
+        """
+        Scheduled cleanup: every RETENTION_INTERVAL_SECONDS, delete chat_logs
+        older than RETENTION_DAYS. With several workers only the one that wins
+        the per-interval lock in the shared cache runs it.
+        """
+        while True:
+            await asyncio.sleep(settings.RETENTION_INTERVAL_SECONDS)
+            try:
+                slot = int(time.time() // settings.RETENTION_INTERVAL_SECONDS)
+                cache = get_cache()
+                lock_key = f"retention:lock:{slot}"
+                if await cache.incr(lock_key) != 1:
+                    continue
+                await cache.expire(lock_key, settings.RETENTION_INTERVAL_SECONDS * 2)
+                before = datetime.now(timezone.utc) - timedelta(days=settings.RETENTION_DAYS)
+                await RetentionService.run(DeletionJob("retention", {"before": before.isoformat()}), before=before)
+            except Exception as e:
+                logger.error(f"Retention run failed: {e}")
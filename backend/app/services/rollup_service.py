@@ -0,0 +1,264 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+from loguru import logger
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.session import AsyncSessionLocal
+from app.models.chat_log import ChatLog
+from app.models.usage_rollup import RollupCheckpoint, UsageRollup, LATENCY_BUCKETS_MS, LATENCY_COLUMNS
+
+GRAINS = ("hour", "day")
+DIMENSIONS = ("tenant", "session")
+DEFAULT_TENANT = "default"
+COUNTER_COLUMNS = ["turns", "errors", "input_tokens", "output_tokens", "latency_count", "latency_sum_ms"] + LATENCY_COLUMNS
+
+BucketKey = Tuple[str, datetime, str, str]
+
+LIVE_CHECKPOINT = "live" # rollup_checkpoints row of the background roll-up (the backfill has its own)
+
+
+def bucket_start(at: datetime, grain: str) -> datetime:
+    at = at.astimezone(timezone.utc)
+    if grain == "hour":
+        return at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _latency_column(latency_ms: float) -> str:
+    for bound, column in zip(LATENCY_BUCKETS_MS, LATENCY_COLUMNS):
+        if latency_ms <= bound:
+            return column
+    return LATENCY_COLUMNS[-1]
+
+
+def turn_counters(metadata_info: Optional[dict]) -> Dict[str, int]:
+    """
+    Counter increments for one turn, from the ChatLog metadata_info.
+    """
+    meta = metadata_info or {}
+    usage = meta.get("usage") or {}
+    counters = {
+        "turns": 1,
+        "errors": 1 if meta.get("error") else 0,
+        "input_tokens": int(usage.get("input_tokens") or 0),
+        "output_tokens": int(usage.get("output_tokens") or 0),
+    }
+    latency = meta.get("latency")
+    if latency is not None:
+        counters["latency_count"] = 1
+        counters["latency_sum_ms"] = int(latency)
+        counters[_latency_column(latency)] = 1
+    return counters
+
+
+class RollupService:
+    @staticmethod
+    def deltas(turns: Iterable[Tuple[Optional[str], Optional[dict], datetime]]) -> Dict[BucketKey, Dict[str, int]]:
+        """
+        Aggregate (session_id, metadata_info, created_at) turns into one increment
+        per rollup row. Merging first keeps a bulk write to one upsert per row
+        (Postgres refuses to update the same row twice in one INSERT .. ON CONFLICT).
+        """
+        merged: Dict[BucketKey, Dict[str, int]] = {}
+        for session_id, metadata_info, at in turns:
+            counters = turn_counters(metadata_info)
+            keys = {"tenant": (metadata_info or {}).get("tenant_id") or DEFAULT_TENANT}
+            if session_id:
+                keys["session"] = session_id
+            for grain in GRAINS:
+                start = bucket_start(at, grain)
+                for dimension, dim_key in keys.items():
+                    row = merged.setdefault((grain, start, dimension, dim_key), {})
+                    for column, value in counters.items():
+                        row[column] = row.get(column, 0) + value
+        return merged
+
+    @staticmethod
+    async def apply(session: AsyncSession, merged: Dict[BucketKey, Dict[str, int]]):
+        """
+        Add the increments with one INSERT .. ON CONFLICT DO UPDATE, inside the
+        caller's transaction (so they commit together with its checkpoint).
+        """
+        if not merged:
+            return
+        dialect = session.bind.dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            raise RuntimeError(f"Rollup upsert not supported on {dialect}")
+
+        values = []
+        for (grain, start, dimension, dim_key), counters in merged.items():
+            row = {column: 0 for column in COUNTER_COLUMNS}
+            row.update(counters)
+            row.update(grain=grain, bucket_start=start, dimension=dimension, dim_key=dim_key)
+            values.append(row)
+
+        stmt = insert(UsageRollup).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["grain", "dimension", "dim_key", "bucket_start"],
+            set_={column: getattr(UsageRollup, column) + getattr(stmt.excluded, column) for column in COUNTER_COLUMNS},
+        )
+        await session.execute(stmt)
+
+    @staticmethod
+    async def ensure_checkpoint():
+        """
+        Create the live checkpoint on first start, at the current highest
+        chat_logs.id: older rows were rolled up when saved (versions that did it
+        in the insert transaction) or are covered by scripts/backfill_rollups.py.
+        """
+        async with AsyncSessionLocal() as session:
+            if await session.get(RollupCheckpoint, LIVE_CHECKPOINT) is not None:
+                return
+            last_id = await session.scalar(select(func.max(ChatLog.id))) or 0
+            session.add(RollupCheckpoint(name=LIVE_CHECKPOINT, last_id=last_id, until_id=0))
+            try:
+                await session.commit()
+                logger.info(f"Usage roll-up starts after chat_logs.id {last_id}")
+            except IntegrityError:
+                pass # Another worker created it first
+
+    @staticmethod
+    async def roll_up_new(batch_size: int, lag_seconds: float) -> int:
+        """
+        Fold the next chat_logs rows (by id, after the live checkpoint) into
+        usage_rollups; increments and checkpoint commit together, so every row
+        is counted exactly once. Rows younger than `lag_seconds` wait for the
+        next run, so a concurrent insert that got a lower id can commit first.
+
+        Workers race for the same rows: the checkpoint is advanced with a
+        compare-and-set, and the loser rolls back. Returns the rows rolled up.
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=lag_seconds)
+        async with AsyncSessionLocal() as session:
+            last_id = await session.scalar(select(RollupCheckpoint.last_id).where(RollupCheckpoint.name == LIVE_CHECKPOINT))
+            if last_id is None:
+                return 0
+            result = await session.execute(
+                select(ChatLog.id, ChatLog.session_id, ChatLog.metadata_info, ChatLog.created_at)
+                .where(ChatLog.id > last_id)
+                .order_by(ChatLog.id)
+                .limit(batch_size)
+            )
+            batch = []
+            for row in result.all():
+                created_at = row.created_at
+                if created_at.tzinfo is None:
+                    created_at = created_at.replace(tzinfo=timezone.utc) # SQLite drops the offset
+                if created_at >= cutoff:
+                    break
+                batch.append((row.id, row.session_id, row.metadata_info, created_at))
+            if not batch:
+                return 0
+
+            # Claim first: a concurrent run blocks here (or finds last_id moved) before touching rollup rows
+            claimed = await session.execute(
+                update(RollupCheckpoint)
+                .where(RollupCheckpoint.name == LIVE_CHECKPOINT, RollupCheckpoint.last_id == last_id)
+                .values(last_id=batch[-1][0])
+            )
+            if claimed.rowcount != 1:
+                await session.rollback()
+                return 0
+            await RollupService.apply(session, RollupService.deltas(row[1:] for row in batch))
+            await session.commit()
+        metrics.inc("usage_rollup_rows_total", len(batch))
+        return len(batch)
+
+    @staticmethod
+    async def rollup_loop():
+        """
+        Background roll-up, every ROLLUP_INTERVAL_SECONDS (right away again
+        after a full batch). Keeps the chat_logs inserts free of the upserts on
+        hot rollup rows (every turn of an hour hits the same tenant row).
+        """
+        while True:
+            try:
+                rows = await RollupService.roll_up_new(settings.ROLLUP_BATCH_SIZE, settings.ROLLUP_LAG_SECONDS)
+            except Exception as e:
+                logger.warning(f"Usage roll-up failed: {e}")
+                rows = 0
+            if rows < settings.ROLLUP_BATCH_SIZE:
+                await asyncio.sleep(settings.ROLLUP_INTERVAL_SECONDS)
+
+    @staticmethod
+    async def query(session: AsyncSession, grain: str, dimension: str, dim_key: Optional[str],
+                    since: datetime, until: datetime) -> dict:
+        """
+        Per-bucket and total figures for [since, until). Without dim_key all keys
+        of the dimension are summed (each turn is counted once per dimension).
+        """
+        sums = [func.sum(getattr(UsageRollup, column)).label(column) for column in COUNTER_COLUMNS]
+        stmt = (
+            select(UsageRollup.bucket_start, *sums)
+            .where(
+                UsageRollup.grain == grain,
+                UsageRollup.dimension == dimension,
+                UsageRollup.bucket_start >= bucket_start(since, grain),
+                UsageRollup.bucket_start < until,
+            )
+            .group_by(UsageRollup.bucket_start)
+            .order_by(UsageRollup.bucket_start)
+        )
+        if dim_key is not None:
+            stmt = stmt.where(UsageRollup.dim_key == dim_key)
+
+        rows = (await session.execute(stmt)).all()
+        buckets = []
+        total = {column: 0 for column in COUNTER_COLUMNS}
+        for row in rows:
+            counters = {column: int(getattr(row, column) or 0) for column in COUNTER_COLUMNS}
+            for column, value in counters.items():
+                total[column] += value
+            start = row.bucket_start
+            if start.tzinfo is None:
+                start = start.replace(tzinfo=timezone.utc) # SQLite drops the offset
+            buckets.append({"bucket_start": start.isoformat(), **_summary(counters)})
+        return {"grain": grain, "dimension": dimension, "key": dim_key, "buckets": buckets, "total": _summary(total)}
+
+
+def _percentile_ms(counters: Dict[str, int], p: float) -> Optional[int]:
+    """
+    Upper bound of the histogram bucket holding the p-th percentile
+    (capped at the last bound, 30000, for the overflow bucket).
+    """
+    count = counters["latency_count"]
+    if not count:
+        return None
+    rank = p / 100 * count
+    cumulative = 0
+    for bound, column in zip(LATENCY_BUCKETS_MS, LATENCY_COLUMNS):
+        cumulative += counters[column]
+        if cumulative >= rank:
+            return bound
+    return LATENCY_BUCKETS_MS[-1]
+
+
+def _summary(counters: Dict[str, int]) -> dict:
+    return {
+        "turns": counters["turns"],
+        "errors": counters["errors"],
+        "input_tokens": counters["input_tokens"],
+        "output_tokens": counters["output_tokens"],
+        "avg_latency_ms": round(counters["latency_sum_ms"] / counters["latency_count"]) if counters["latency_count"] else None,
+        "p50_latency_ms": _percentile_ms(counters, 50),
+        "p95_latency_ms": _percentile_ms(counters, 95),
+        "p99_latency_ms": _percentile_ms(counters, 99),
+    }
+
+
+def default_range(grain: str, since: Optional[datetime], until: Optional[datetime]) -> Tuple[datetime, datetime]:
+    until = until or datetime.now(timezone.utc)
+    since = since or until - (timedelta(days=2) if grain == "hour" else timedelta(days=30))
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    if until.tzinfo is None:
+        until = until.replace(tzinfo=timezone.utc)
+    return since, until
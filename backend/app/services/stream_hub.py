@@ -0,0 +1,277 @@
+import asyncio
+import json
+import sys
+import time
+import uuid
+from contextlib import aclosing
+from typing import AsyncGenerator, Dict, List, Optional
+from loguru import logger
+from app.core.cache import get_cache
+from app.core.config import settings
+from app.core.lifecycle import streams
+from app.core.metrics import metrics
+from app.core.profiling import add_stage, begin_stages, flush_stages, profiler
+from app.services.chat_service import ChatService, TurnAccumulator, encode_event
+
+DONE_FRAME = "[DONE]"
+# Paced delivery of live frames to the UI (was in the router's event loop)
+UI_THROTTLE_SECONDS = 0.02
+
+
+def _cache_key(stream_id: str) -> str:
+    return f"lumi:stream:{stream_id}"
+
+
+def format_event(stream_id: str, seq: int, data: str) -> str:
+    return f"id: {stream_id}:{seq}\ndata: {data}\n\n"
+
+
+def parse_last_event_id(value: Optional[str]):
+    """
+    "<stream_id>:<seq>" -> (stream_id, seq), or None if absent/malformed.
+    """
+    if not value or ":" not in value:
+        return None
+    stream_id, _, seq = value.rpartition(":")
+    try:
+        return stream_id, int(seq)
+    except ValueError:
+        return None
+
+
+class ReplayBuffer:
+    """
+    Every frame of one /chat/ask answer, kept for STREAM_REPLAY_TTL_SECONDS
+    after it finishes so a dropped client can resume with Last-Event-ID.
+    `size` is what the frames take in memory (bytes, object overhead included).
+    """
+
+    def __init__(self, stream_id: str):
+        self.id = stream_id
+        self.frames: List[str] = []
+        self.size = 0
+        self.done = False
+        self.expires_at = None
+        self.task = None # Producer task, referenced so it isn't garbage collected
+        self._changed = asyncio.Event()
+
+    def append(self, data: str):
+        self.frames.append(data)
+        self.size += sys.getsizeof(data)
+        self._notify()
+
+    def finish(self):
+        self.done = True
+        self.expires_at = time.monotonic() + settings.STREAM_REPLAY_TTL_SECONDS
+        self._notify()
+
+    def _notify(self):
+        # Wake every waiter, then arm a fresh event for the next frame
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self, offset: int):
+        """
+        Wait until there is a frame at `offset` or the stream is done.
+        """
+        while len(self.frames) <= offset and not self.done:
+            await self._changed.wait()
+
+
+class StreamHub:
+    """
+    Decouples upstream production from client connections.
+
+    Each /chat/ask starts a producer task that runs ChatService, records frames
+    in a ReplayBuffer (mirrored to Redis when REDIS_URL is set, so any worker can
+    serve a reconnect) and saves the ChatLog when done. Client connections only
+    subscribe to the buffer; a disconnect no longer stops the answer.
+    """
+
+    def __init__(self):
+        self.buffers: Dict[str, ReplayBuffer] = {}
+        metrics.register_gauge("stream_buffer_bytes", lambda: sum(b.size for b in list(self.buffers.values())))
+        metrics.register_gauge("stream_buffers", lambda: len(self.buffers))
+
+    def start(self, question: str, session_id: Optional[str], render_markdown: bool = False, tenant_id: Optional[str] = None) -> ReplayBuffer:
+        self._evict_expired()
+        buffer = ReplayBuffer(str(uuid.uuid4()))
+        self.buffers[buffer.id] = buffer
+        buffer.task = asyncio.create_task(self._produce(buffer, question, session_id, render_markdown, tenant_id))
+        return buffer
+
+    def cancel(self, stream_id: str) -> bool:
+        """
+        Stop a running local stream (upstream call included); the partial answer is saved.
+        """
+        buffer = self.buffers.get(stream_id)
+        if buffer is None or buffer.done or buffer.task is None:
+            return False
+        buffer.task.cancel()
+        return True
+
+    def get(self, stream_id: str) -> Optional[ReplayBuffer]:
+        self._evict_expired()
+        return self.buffers.get(stream_id)
+
+    async def exists_shared(self, stream_id: str) -> bool:
+        if not settings.REDIS_URL:
+            return False
+        return await get_cache().get(f"{_cache_key(stream_id)}:state") is not None
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = [sid for sid, b in self.buffers.items() if b.expires_at is not None and b.expires_at < now]
+        for sid in expired:
+            del self.buffers[sid]
+
+    def _expire(self, buffer: ReplayBuffer):
+        if self.buffers.get(buffer.id) is buffer:
+            del self.buffers[buffer.id]
+
+    async def _mirror(self, buffer: ReplayBuffer, data: str):
+        if not settings.REDIS_URL:
+            return
+        key = _cache_key(buffer.id)
+        try:
+            cache = get_cache()
+            await cache.rpush(key, data)
+            if len(buffer.frames) == 1:
+                await cache.set(f"{key}:state", "running", ttl=settings.STREAM_REPLAY_TTL_SECONDS * 10)
+                await cache.expire(key, settings.STREAM_REPLAY_TTL_SECONDS * 10)
+        except Exception as e:
+            logger.warning(f"Failed to mirror frame of stream {buffer.id}: {e}")
+
+    async def _emit(self, buffer: ReplayBuffer, data: str):
+        buffer.append(data)
+        await self._mirror(buffer, data)
+
+    async def _produce(self, buffer: ReplayBuffer, question: str, session_id: Optional[str], render_markdown: bool = False,
+                       tenant_id: Optional[str] = None):
+        handle = streams.open_stream(buffer.id)
+        turn = TurnAccumulator(tenant_id)
+        stages = begin_stages()
+        capture = profiler.begin(buffer.id)
+
+        # Set to cut the answer short: the upstream call is closed and the filter's held-back tail still comes through
+        stop = asyncio.Event()
+        truncated = False
+        try:
+            # 1. Stream from Bailian
+            events = ChatService.chat_stream_events(question, session_id, render_markdown, stop=stop)
+            async with aclosing(events):
+                async for event in events:
+                    # Capture data for DB
+                    turn.feed_event(event)
+                    serialize_cpu = time.thread_time()
+                    data = encode_event(event)
+                    add_stage("serialize", serialize_cpu)
+                    await self._emit(buffer, data)
+
+                    if stop.is_set():
+                        continue
+                    if buffer.size > settings.STREAM_MAX_BYTES:
+                        # Runaway answer: stop holding more of it, keep (and save) what we have
+                        metrics.inc("chat_streams_truncated_total")
+                        logger.warning(f"Stream {buffer.id} reached {buffer.size} bytes, cutting it short")
+                        truncated = True
+                        stop.set()
+                    elif handle.aborted:
+                        stop.set()
+
+            if truncated:
+                event = {"error": "The answer is too long and was cut short.", "truncated": True}
+                turn.feed_event(event)
+                await self._emit(buffer, encode_event(event))
+            elif handle.aborted:
+                # Drain deadline passed; tell the client, keep what we have
+                await self._emit(buffer, json.dumps({"error": "Server is restarting, answer was cut short. Please retry."}))
+        except asyncio.CancelledError:
+            # Client cancel (WebSocket) or a drain abort stuck on upstream: end the stream cleanly
+            if handle.aborted:
+                await self._emit(buffer, json.dumps({"error": "Server is restarting, answer was cut short. Please retry."}))
+            else:
+                await self._emit(buffer, json.dumps({"error": "Cancelled", "cancelled": True}))
+            raise
+        except Exception as e:
+            logger.exception(f"Stream {buffer.id} failed")
+            await self._emit(buffer, json.dumps({"error": str(e)}))
+        finally:
+            streams.close_stream(handle)
+            buffer.append(DONE_FRAME)
+            buffer.finish()
+            # Dropped when its replay window ends, even if no later request comes to evict it
+            asyncio.get_running_loop().call_later(settings.STREAM_REPLAY_TTL_SECONDS, self._expire, buffer)
+            streams.track_write(self._finish_shared(buffer))
+
+            # 2. Save to DB after stream finishes (or is cut off by drain).
+            streams.track_write(self._persist(turn, session_id, question, stages, capture))
+
+    async def _persist(self, turn: TurnAccumulator, session_id: Optional[str], question: str, stages: dict, capture=None):
+        if turn.should_persist:
+            save_start = time.perf_counter()
+            await ChatService.save_chat_log(
+                request_id=turn.request_id,
+                session_id=session_id,
+                question=question,
+                answer=turn.text,
+                metadata_info=turn.metadata_info()
+            )
+            # Wall time: the save is mostly waiting on the database
+            add_stage("db_save", save_start, clock=time.perf_counter)
+        flush_stages(stages)
+        if capture is not None:
+            await profiler.end(capture, stages, upstream_request_id=turn.request_id)
+
+    async def _finish_shared(self, buffer: ReplayBuffer):
+        if not settings.REDIS_URL:
+            return
+        key = _cache_key(buffer.id)
+        try:
+            cache = get_cache()
+            await cache.rpush(key, DONE_FRAME)
+            await cache.set(f"{key}:state", "done", ttl=settings.STREAM_REPLAY_TTL_SECONDS)
+            await cache.expire(key, settings.STREAM_REPLAY_TTL_SECONDS)
+        except Exception as e:
+            # Local clients are unaffected; followers on other workers poll until the "running" state expires
+            logger.warning(f"Failed to mark stream {buffer.id} finished in the shared cache: {e}")
+
+    async def subscribe(self, buffer: ReplayBuffer, start: int = 0) -> AsyncGenerator[str, None]:
+        """
+        SSE frames of a local stream from `start`. Frames that were already
+        buffered when a client resumes are replayed without UI throttling.
+        """
+        replay_until = len(buffer.frames) if start > 0 else 0
+        seq = start
+        while True:
+            await buffer.wait(seq)
+            if seq >= len(buffer.frames):
+                return # Done and fully delivered
+            data = buffer.frames[seq]
+            yield format_event(buffer.id, seq, data)
+            if data == DONE_FRAME:
+                return
+            if seq >= replay_until:
+                await asyncio.sleep(UI_THROTTLE_SECONDS) # Throttling for UI
+            seq += 1
+
+    async def subscribe_shared(self, stream_id: str, start: int) -> AsyncGenerator[str, None]:
+        """
+        Follow a stream produced by another worker through the shared cache.
+        """
+        cache = get_cache()
+        key = _cache_key(stream_id)
+        seq = start
+        while True:
+            frames = await cache.lrange(key, seq, -1)
+            for data in frames:
+                yield format_event(stream_id, seq, data)
+                if data == DONE_FRAME:
+                    return
+                seq += 1
+            if not frames and await cache.get(f"{key}:state") is None:
+                return # Expired under us
+            await asyncio.sleep(settings.STREAM_POLL_INTERVAL_SECONDS)
+
+
+stream_hub = StreamHub()
@@ -0,0 +1,94 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from app.core.config import settings
+
+# The DashScope SDK (and requests under it) is only imported on first use.
+# Importing it at module load made every worker pay for it before serving "/".
+_dashscope = None
+_http_session = None
+_lock = threading.Lock()
+
+
+def get_dashscope():
+    """
+    Import and configure the DashScope SDK once, on first use.
+    """
+    global _dashscope
+    if _dashscope is None:
+        with _lock:
+            if _dashscope is None:
+                if settings.BAILIAN_MOCK:
+                    from app.services import mock_upstream
+                    _dashscope = mock_upstream
+                    return _dashscope
+                import dashscope
+                dashscope.api_key = settings.DASHSCOPE_API_KEY
+                _dashscope = dashscope
+    return _dashscope
+
+
+def get_http_session():
+    """
+    Shared requests.Session passed to Application.call(session=...),
+    so streaming calls reuse pooled keep-alive connections to DashScope.
+    """
+    global _http_session
+    if _http_session is None:
+        with _lock:
+            if _http_session is None:
+                _http_session = new_http_session(settings.UPSTREAM_POOL_SIZE)
+    return _http_session
+
+
+def new_http_session(pool_maxsize: int = 1):
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def open_connection(session) -> bool:
+    """
+    Blocking: one HEAD to the DashScope host so `session` holds a
+    keep-alive connection (TCP + TLS done). Any HTTP status is fine.
+    """
+    if settings.BAILIAN_MOCK:
+        return True
+    try:
+        session.head(get_dashscope().base_http_api_url, timeout=settings.UPSTREAM_CONNECT_TIMEOUT)
+        return True
+    except Exception as e:
+        logger.warning(f"Upstream pre-connect failed: {e}")
+        return False
+
+
+def warm_up() -> bool:
+    """
+    Blocking: import the SDK and open UPSTREAM_WARM_CONNECTIONS keep-alive
+    connections to the DashScope host. Run it in a thread.
+    Any HTTP status counts as success, we only care that TCP + TLS are done.
+    """
+    if settings.BAILIAN_MOCK:
+        get_dashscope()
+        return True
+    dashscope = get_dashscope()
+    session = get_http_session()
+    url = dashscope.base_http_api_url
+
+    def touch(_):
+        session.head(url, timeout=settings.UPSTREAM_CONNECT_TIMEOUT)
+
+    count = max(1, settings.UPSTREAM_WARM_CONNECTIONS)
+    try:
+        # Concurrent requests so each one checks out (and keeps) its own connection
+        with ThreadPoolExecutor(max_workers=count) as pool:
+            list(pool.map(touch, range(count)))
+        return True
+    except Exception as e:
+        logger.warning(f"Upstream warm-up failed: {e}")
+        return False
@@ -0,0 +1,180 @@
+import asyncio
+import json
+from typing import Dict, Optional
+from fastapi import WebSocket, WebSocketDisconnect
+from loguru import logger
+from pydantic import ValidationError
+from app.core.config import settings
+from app.core.lifecycle import streams
+from app.core.metrics import metrics
+from app.schemas.chat import ChatRequest
+from app.services.stream_hub import DONE_FRAME, ReplayBuffer, stream_hub
+
+# Protocol of /chat/ws, JSON text messages. `id` is chosen by the client and
+# names one conversation turn on this connection.
+#
+# client -> server
+#   {"type": "ask", "id": "q1", "question": ..., "session_id"?: ..., "render_markdown"?: bool, "credit"?: n}
+#   {"type": "credit", "id": "q1", "n": 32}      allow 32 more frames of q1 (credit and n: integers, credit >= 1)
+#   {"type": "cancel", "id": "q1"}                stop q1 (upstream call included)
+#
+# server -> client
+#   {"id": "q1", "stream_id": ..., "seq": 0, "data": {...}}    data = the SSE frame of /chat/ask
+#   {"id": "q1", "stream_id": ..., "seq": n, "done": true}     end of q1 (the SSE [DONE])
+#   {"id": "q1", "error": ...}                                 request refused, or bad message
+#
+# stream_id can be used with /chat/ask + Last-Event-ID to resume after a reconnect:
+# streams keep running (and are saved) when the socket drops, like SSE.
+
+
+def _integer(value) -> Optional[int]:
+    # JSON integers only: true/false, strings and fractions are refused
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return None
+
+
+class _Stream:
+    __slots__ = ("id", "buffer", "credit", "credit_changed", "pump")
+
+    def __init__(self, request_id: str, buffer: ReplayBuffer, credit: int):
+        self.id = request_id
+        self.buffer = buffer
+        self.credit = credit
+        self.credit_changed = asyncio.Event()
+        self.pump: Optional[asyncio.Task] = None
+
+
+class WsConnection:
+    """
+    One /chat/ws connection carrying many concurrent turns.
+
+    Each turn is a regular stream_hub stream (same producer, ReplayBuffer and
+    ChatLog save as SSE); a pump task per turn forwards its frames. Flow
+    control is per turn: a pump only sends while the client has granted it
+    credit, and all pumps share one bounded outbox, so a slow socket pauses
+    the pumps instead of buffering without limit. Upstream production is not
+    paused (the frames stay in the ReplayBuffer).
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.ws = websocket
+        self.streams: Dict[str, _Stream] = {}
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_OUTBOX_SIZE)
+
+    async def serve(self):
+        await self.ws.accept()
+        metrics.inc("ws_connections_total")
+        writer = asyncio.create_task(self._write())
+        try:
+            while True:
+                try:
+                    message = json.loads(await self.ws.receive_text())
+                except ValueError:
+                    await self._send_error(None, "Message is not valid JSON")
+                    continue
+                if not isinstance(message, dict):
+                    await self._send_error(None, "Message must be a JSON object")
+                    continue
+                await self._handle(message)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            writer.cancel()
+            for stream in self.streams.values():
+                if stream.pump is not None:
+                    stream.pump.cancel() # The producers keep running and save their answers
+            if self.streams:
+                logger.info(f"WebSocket closed with {len(self.streams)} open streams, they continue detached")
+
+    async def _handle(self, message: dict):
+        kind = message.get("type")
+        request_id = message.get("id")
+        if not isinstance(request_id, str) or not request_id:
+            await self._send_error(None, "Missing id")
+            return
+
+        if kind == "ask":
+            await self._ask(request_id, message)
+        elif kind == "credit":
+            n = _integer(message.get("n"))
+            if n is None:
+                await self._send_error(request_id, "n must be an integer")
+                return
+            stream = self.streams.get(request_id)
+            if stream is not None:
+                stream.credit += max(0, n)
+                stream.credit_changed.set()
+        elif kind == "cancel":
+            stream = self.streams.get(request_id)
+            if stream is not None and stream_hub.cancel(stream.buffer.id):
+                metrics.inc("ws_streams_total", outcome="cancelled")
+        else:
+            await self._send_error(request_id, f"Unknown message type: {kind}")
+
+    async def _ask(self, request_id: str, message: dict):
+        if request_id in self.streams:
+            await self._send_error(request_id, "Duplicate id on this connection")
+            return
+        try:
+            request = ChatRequest(**{k: v for k, v in message.items() if k in ChatRequest.model_fields})
+        except (ValidationError, TypeError) as e:
+            await self._send_error(request_id, str(e))
+            return
+        if not request.question.strip():
+            await self._send_error(request_id, "Question cannot be empty")
+            return
+        credit = message.get("credit")
+        if credit is None:
+            credit = settings.WS_INITIAL_CREDIT
+        elif _integer(credit) is None:
+            await self._send_error(request_id, "credit must be an integer")
+            return
+        if streams.draining:
+            await self._send_error(request_id, "Server is restarting, please retry")
+            return
+        if len(self.streams) >= settings.WS_MAX_STREAMS:
+            await self._send_error(request_id, f"At most {settings.WS_MAX_STREAMS} open streams per connection")
+            return
+
+        tenant_id = self.ws.headers.get("x-tenant-id")
+        buffer = stream_hub.start(request.question, request.session_id, request.render_markdown, tenant_id)
+        # At least one frame, or the turn would wait for a credit message before its first frame
+        stream = self.streams[request_id] = _Stream(request_id, buffer, max(1, credit))
+        stream.pump = asyncio.create_task(self._pump(stream))
+        metrics.inc("ws_streams_total", outcome="started")
+
+    async def _pump(self, stream: _Stream):
+        buffer = stream.buffer
+        prefix = f'{{"id":{json.dumps(stream.id)},"stream_id":"{buffer.id}","seq":'
+        seq = 0
+        try:
+            while True:
+                await buffer.wait(seq)
+                if seq >= len(buffer.frames):
+                    break
+                while stream.credit <= 0:
+                    stream.credit_changed.clear()
+                    await stream.credit_changed.wait()
+                data = buffer.frames[seq]
+                # Frames are already JSON, wrap them without a parse/dump round trip
+                if data == DONE_FRAME:
+                    await self.outbox.put(f'{prefix}{seq},"done":true}}')
+                    break
+                stream.credit -= 1
+                await self.outbox.put(f'{prefix}{seq},"data":{data}}}')
+                seq += 1
+        finally:
+            self.streams.pop(stream.id, None)
+
+    async def _write(self):
+        try:
+            while True:
+                text = await self.outbox.get()
+                await self.ws.send_text(text)
+                metrics.inc("ws_frames_sent_total")
+        except (WebSocketDisconnect, RuntimeError):
+            pass # Socket gone, serve() cleans up
+
+    async def _send_error(self, request_id: Optional[str], error: str):
+        await self.outbox.put(json.dumps({"id": request_id, "error": error}))
@@ -0,0 +1,61 @@
+"""
+Gunicorn profile for multi-worker deployments:
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+Tuned for long-lived SSE streams from /chat/ask. Every worker owns its own DB and
+upstream pools; metrics are aggregated through METRICS_MULTIPROC_DIR and shared
+state goes through REDIS_URL (see app/core/cache.py).
+"""
+import multiprocessing
+import os
+import shutil
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Async workers heartbeat independently of request duration, so a long SSE stream
+# doesn't trip this; it only catches a blocked event loop.
+timeout = int(os.getenv("WORKER_TIMEOUT", 60))
+# SIGTERM -> drain (DRAIN_TIMEOUT_SECONDS + DRAIN_WRITE_TIMEOUT_SECONDS) -> SIGKILL after this
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 35))
+# Longer than the proxy's upstream keepalive, so the proxy closes idle connections first
+keepalive = int(os.getenv("KEEPALIVE", 75))
+
+# Pools must be created after fork, never share them between workers
+preload_app = False
+
+# Recycle workers now and then to bound slow leaks; jitter avoids synchronized restarts.
+# Restarts go through drain mode, so in-flight streams are not cut.
+max_requests = int(os.getenv("MAX_REQUESTS", 0))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", 0))
+
+accesslog = "-"
+
+
+def on_starting(server):
+    metrics_dir = os.getenv("METRICS_MULTIPROC_DIR")
+    if metrics_dir:
+        # Stale snapshots from a previous run would be summed in otherwise
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+
+def when_ready(server):
+    from app.core.config import settings
+
+    per_worker = settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+    budget = server.cfg.workers * per_worker
+    if budget > settings.DB_MAX_CONNECTIONS:
+        server.log.warning(
+            f"DB pool budget {server.cfg.workers} workers x {per_worker} = {budget} connections "
+            f"exceeds DB_MAX_CONNECTIONS={settings.DB_MAX_CONNECTIONS}; lower DB_POOL_SIZE/DB_MAX_OVERFLOW"
+        )
+
+
+def child_exit(server, worker):
+    metrics_dir = os.getenv("METRICS_MULTIPROC_DIR")
+    if metrics_dir:
+        from app.core.metrics import mark_process_dead
+        mark_process_dead(metrics_dir, worker.pid)
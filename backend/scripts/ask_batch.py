@@ -0,0 +1,75 @@
+"""
+Run a JSONL file of questions through POST /api/v1/chat/ask_batch.
+
+Input: one JSON object per line. The question is read from --field
+(default "question"); optional "session_id" and "id" are passed through.
+Results are written as NDJSON (one line per question, completion order,
+then a summary line) to --output or stdout.
+
+Usage (from backend/):
+    python scripts/ask_batch.py questions.jsonl --concurrency 16 --output answers.jsonl
+    python scripts/ask_batch.py questions.jsonl --url http://localhost:8080 --no-persist
+"""
+import argparse
+import json
+import sys
+
+import httpx
+
+
+def build_body(path: str, field: str) -> str:
+    lines = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            if field not in row:
+                raise SystemExit(f"{path}:{line_no}: missing field '{field}'")
+            item = {"question": row[field]}
+            for key in ("session_id", "id"):
+                if row.get(key) is not None:
+                    item[key] = str(row[key])
+            lines.append(json.dumps(item, ensure_ascii=False))
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL file with one question per line")
+    parser.add_argument("--url", default="http://localhost:8000", help="Backend base URL")
+    parser.add_argument("--concurrency", type=int, default=8, help="Upstream calls in flight (capped server side)")
+    parser.add_argument("--field", default="question", help="Name of the question field in the input")
+    parser.add_argument("--no-persist", action="store_true", help="Don't write the answers to chat_logs")
+    parser.add_argument("--output", help="Write NDJSON results here instead of stdout")
+    args = parser.parse_args()
+
+    body = build_body(args.input, args.field)
+    params = {"concurrency": args.concurrency, "persist": str(not args.no_persist).lower()}
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    done = 0
+
+    try:
+        with httpx.stream("POST", f"{args.url.rstrip('/')}/api/v1/chat/ask_batch", params=params, content=body.encode("utf-8"),
+                          headers={"Content-Type": "application/x-ndjson"}, timeout=httpx.Timeout(30.0, read=None)) as resp:
+            if resp.status_code != 200:
+                resp.read()
+                raise SystemExit(f"HTTP {resp.status_code}: {resp.text}")
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                out.write(line + "\n")
+                result = json.loads(line)
+                if "summary" in result:
+                    print(json.dumps(result["summary"], indent=2), file=sys.stderr)
+                else:
+                    done += 1
+                    if args.output:
+                        print(f"\r{done} answered", end="", file=sys.stderr, flush=True)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Backfill usage_rollups from chat_logs rows written before rollups existed.
+
+New turns are rolled up by the server in the background, starting after the
+highest id present when it first started ("Usage roll-up starts after
+chat_logs.id N" in its log). This script covers the history: it reads
+chat_logs by id in batches up to --until-id (that N) and commits each batch
+together with its checkpoint, so it can be interrupted and re-run safely.
+
+Usage (from backend/):
+    python scripts/backfill_rollups.py --until-id 1234567
+    python scripts/backfill_rollups.py              # resume a started backfill
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select  # noqa: E402
+from app.db.base_class import Base  # noqa: E402
+from app.db.session import AsyncSessionLocal, engine  # noqa: E402
+from app.models.chat_log import ChatLog  # noqa: E402
+from app.models.usage_rollup import RollupCheckpoint  # noqa: E402
+from app.services.rollup_service import RollupService  # noqa: E402
+
+CHECKPOINT_NAME = "backfill"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--until-id", type=int, help="Last chat_logs.id to include (required on the first run)")
+    parser.add_argument("--batch", type=int, default=5000)
+    args = parser.parse_args()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with AsyncSessionLocal() as session:
+        checkpoint = await session.get(RollupCheckpoint, CHECKPOINT_NAME)
+        if checkpoint is None:
+            if args.until_id is None:
+                raise SystemExit("First run: pass --until-id (highest chat_logs.id written before rollups were enabled)")
+            checkpoint = RollupCheckpoint(name=CHECKPOINT_NAME, last_id=0, until_id=args.until_id)
+            session.add(checkpoint)
+            await session.commit()
+        elif args.until_id is not None and args.until_id != checkpoint.until_id:
+            raise SystemExit(f"Backfill already started with --until-id {checkpoint.until_id}")
+
+        start = time.perf_counter()
+        rows = 0
+        while checkpoint.last_id < checkpoint.until_id:
+            result = await session.execute(
+                select(ChatLog.id, ChatLog.session_id, ChatLog.metadata_info, ChatLog.created_at)
+                .where(ChatLog.id > checkpoint.last_id, ChatLog.id <= checkpoint.until_id)
+                .order_by(ChatLog.id)
+                .limit(args.batch)
+            )
+            batch = result.all()
+            if not batch:
+                checkpoint.last_id = checkpoint.until_id
+                await session.commit()
+                break
+
+            await RollupService.apply(session, RollupService.deltas((r.session_id, r.metadata_info, r.created_at) for r in batch))
+            checkpoint.last_id = batch[-1].id
+            await session.commit() # Increments and checkpoint together
+            rows += len(batch)
+            print(f"Rolled up to id {checkpoint.last_id} / {checkpoint.until_id} ({rows} rows)", file=sys.stderr)
+
+    print(f"Backfill done: {rows} rows in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+"""
+Bandwidth vs CPU of response compression, on mock upstream answers.
+
+history: a /chat/history?limit=N body (rows with full metadata_info, RAG chunks)
+         compressed in one go, per encoding / level.
+sse:     the SSE frames of one /chat/ask answer, compressed with one context
+         flushed per frame (what ?compress=true does) and, for reference, each
+         frame compressed on its own. Every flushed chunk is checked to decode
+         to its complete frame, i.e. streaming is not held back.
+
+Usage (from backend/):
+    BAILIAN_MOCK=true MOCK_CHUNK_INTERVAL_MS=0 python scripts/bench_compression.py --rows 30
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+import time
+import zlib
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.compression import StreamCompressor, get_brotli  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.logging import setup_logging  # noqa: E402
+from app.services.chat_service import ChatService  # noqa: E402
+from app.services.stream_hub import format_event  # noqa: E402
+
+
+async def history_body(rows: int) -> bytes:
+    items = []
+    for i in range(rows):
+        result = await ChatService.answer(f"历史问题 {i}", "bench")
+        items.append({
+            "id": i + 1,
+            "session_id": "bench",
+            "request_id": result["request_id"],
+            "user_query": f"历史问题 {i}",
+            "ai_response": result["answer"],
+            "sources": result["sources"],
+            "metadata_info": result["metadata_info"],
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        })
+    return json.dumps(items, ensure_ascii=False).encode("utf-8")
+
+
+async def sse_frames() -> list:
+    frames = []
+    async for data in ChatService.chat_stream_generator("压缩基准问题", "bench"):
+        frames.append(format_event("bench", len(frames), data))
+    frames.append(format_event("bench", len(frames), "[DONE]"))
+    return frames
+
+
+def timed(fn, repeat: int = 20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        out = fn()
+    return out, (time.perf_counter() - start) / repeat
+
+
+def bench_history(body: bytes) -> dict:
+    brotli = get_brotli()
+    codecs = {f"gzip-{level}": (lambda level=level: gzip.compress(body, compresslevel=level)) for level in (1, 6, 9)}
+    if brotli is not None:
+        codecs.update({f"br-{q}": (lambda q=q: brotli.compress(body, quality=q)) for q in (1, 5, 11)})
+    report = {"identity": {"bytes": len(body)}}
+    for name, fn in codecs.items():
+        out, seconds = timed(fn, repeat=5 if name == "br-11" else 20)
+        report[name] = {"bytes": len(out), "ratio": round(len(body) / len(out), 1), "cpu_ms": round(seconds * 1000, 2)}
+    return report
+
+
+def bench_sse(frames: list) -> dict:
+    raw = [f.encode("utf-8") for f in frames]
+    report = {"identity": {"bytes": sum(map(len, raw)), "frames": len(raw)}}
+    encodings = ["gzip"] + (["br"] if get_brotli() is not None else [])
+
+    for encoding in encodings:
+        def shared():
+            compressor = StreamCompressor(encoding)
+            return [compressor.compress(data) for data in raw] + [compressor.finish()]
+
+        chunks, seconds = timed(shared)
+        # Each flushed chunk must decode to exactly its frame
+        if encoding == "gzip":
+            decoder = zlib.decompressobj(31)
+            decoded = [decoder.decompress(c) for c in chunks[:-1]]
+        else:
+            decoder = get_brotli().Decompressor()
+            decoded = [decoder.process(c) for c in chunks[:-1]]
+        assert decoded == raw, "a frame was held back by the compressor"
+        report[f"{encoding}-per-frame-flush"] = {
+            "bytes": sum(map(len, chunks)),
+            "ratio": round(report["identity"]["bytes"] / sum(map(len, chunks)), 1),
+            "cpu_us_per_frame": round(seconds / len(raw) * 1e6, 1),
+        }
+
+    independent, seconds = timed(lambda: [gzip.compress(data, compresslevel=settings.COMPRESSION_GZIP_LEVEL) for data in raw])
+    report["gzip-independent-frames"] = {
+        "bytes": sum(map(len, independent)),
+        "ratio": round(report["identity"]["bytes"] / sum(map(len, independent)), 1),
+        "cpu_us_per_frame": round(seconds / len(raw) * 1e6, 1),
+    }
+    return report
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=30)
+    args = parser.parse_args()
+    setup_logging()
+    if not settings.BAILIAN_MOCK:
+        raise SystemExit("Run with BAILIAN_MOCK=true")
+
+    body = await history_body(args.rows)
+    frames = await sse_frames()
+    print(json.dumps({"history": bench_history(body), "sse": bench_sse(frames)}, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
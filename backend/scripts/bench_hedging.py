@@ -0,0 +1,90 @@
+"""
+Tail TTFT with and without hedged upstream calls, against the mock upstream.
+
+A share of mock calls (--slow-rate) takes --slow-ms to their first chunk. Each
+run sends --requests calls through BailianService.stream_events with
+--concurrency in flight and reports TTFT percentiles plus how many extra
+upstream calls hedging cost.
+
+Usage (from backend/):
+    BAILIAN_MOCK=true python scripts/bench_hedging.py --requests 400 --slow-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings  # noqa: E402
+from app.core.logging import setup_logging  # noqa: E402
+from app.core.metrics import metrics, percentile  # noqa: E402
+from app.services.bailian_service import BailianService  # noqa: E402
+
+
+def counter(name: str, **labels) -> float:
+    key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+    return metrics.snapshot()["counters"].get(name, {}).get(key, 0.0)
+
+
+async def one_call(i: int) -> float:
+    start = time.perf_counter()
+    ttft = None
+    async for event in BailianService.stream_events(f"question {i}", paced=False):
+        if ttft is None and event.get("request_id") != "init":
+            ttft = time.perf_counter() - start
+    return ttft if ttft is not None else time.perf_counter() - start
+
+
+async def run(requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    launched_before = counter("upstream_hedges_total", outcome="launched")
+    won_before = counter("upstream_hedges_total", outcome="won")
+
+    async def bounded(i):
+        async with semaphore:
+            return await one_call(i)
+
+    start = time.perf_counter()
+    ttfts = await asyncio.gather(*(bounded(i) for i in range(requests)))
+    hedges = counter("upstream_hedges_total", outcome="launched") - launched_before
+    return {
+        "ttft_p50_ms": round(percentile(ttfts, 50) * 1000),
+        "ttft_p95_ms": round(percentile(ttfts, 95) * 1000),
+        "ttft_p99_ms": round(percentile(ttfts, 99) * 1000),
+        "ttft_max_ms": round(max(ttfts) * 1000),
+        "hedges": int(hedges),
+        "hedges_won": int(counter("upstream_hedges_total", outcome="won") - won_before),
+        "extra_calls_share": round(hedges / requests, 4),
+        "elapsed_s": round(time.perf_counter() - start, 2),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=int, default=3000)
+    args = parser.parse_args()
+
+    setup_logging()
+    if not settings.BAILIAN_MOCK:
+        raise SystemExit("Run with BAILIAN_MOCK=true")
+    settings.MOCK_SLOW_RATE = args.slow_rate
+    settings.MOCK_SLOW_TTFT_MS = args.slow_ms
+    settings.HEDGE_MIN_SAMPLES = min(settings.HEDGE_MIN_SAMPLES, args.requests // 4)
+
+    results = {}
+    for name, enabled in (("no_hedging", False), ("hedging", True)):
+        settings.HEDGE_ENABLED = enabled
+        if enabled:
+            await run(args.requests // 4, args.concurrency) # Warm the TTFT window so the p95 delay applies
+        results[name] = await run(args.requests, args.concurrency)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+"""
+Lookup cost of the instant answer rules (app/services/instant_answers.py).
+
+Writes a rules file with the built-in intents plus --rules synthetic ones
+(--patterns-per-rule patterns each), then times InstantAnswers.match over a
+mix of questions that hit a rule and questions that go on to the agent.
+
+Usage (from backend/):
+    python scripts/bench_instant.py --rules 1000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.metrics import percentile  # noqa: E402
+from app.services.instant_answers import InstantAnswers  # noqa: E402
+
+INTENTS = [
+    {"id": "greeting", "patterns": ["你好", "您好", "hello", "hi", "在吗"], "max_chars": 8, "answer": "您好，请问有什么可以帮您？"},
+    {"id": "human_agent", "patterns": ["人工客服", "转人工", "人工服务", "human agent", "real person"], "priority": 1,
+     "answer": "正在为您转接人工客服，请稍候。"},
+    {"id": "business_hours", "patterns": ["营业时间", "工作时间", "几点上班", "business hours", "opening hours"],
+     "answer": "我们的服务时间为工作日 9:00-18:00。"},
+]
+
+QUESTIONS = [
+    "你好", "Hello!", "在吗？", "我要转人工", "请帮我转人工客服", "Can I talk to a real person?",
+    "你们的营业时间是？", "What are your business hours", "路觅科技的智能客服支持哪些渠道接入？",
+    "知识库检索和联网搜索有什么区别？", "如何配置工作流的输出节点", "This is a long question about pricing plans and invoices",
+]
+
+
+def synthetic_rules(count: int, patterns_per_rule: int) -> list:
+    alphabet = "产品价格订单退款发票物流账户密码登录注册会员优惠活动配送售后维修安装"
+    rng = random.Random(42)
+    return [
+        {
+            "id": f"rule-{i}",
+            "patterns": ["".join(rng.choice(alphabet) for _ in range(rng.randint(3, 6))) for _ in range(patterns_per_rule)],
+            "answer": f"规则 {i} 的答案",
+        }
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rules", type=int, default=1000)
+    parser.add_argument("--patterns-per-rule", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    rules = INTENTS + synthetic_rules(args.rules, args.patterns_per_rule)
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+        json.dump({"rules": rules}, f, ensure_ascii=False)
+    try:
+        index = InstantAnswers(f.name)
+        start = time.perf_counter()
+        index.load()
+        load_ms = (time.perf_counter() - start) * 1000
+
+        hits = {q: (index.match(q) or {}).get("id") for q in QUESTIONS}
+        latencies = []
+        for i in range(args.iterations):
+            question = QUESTIONS[i % len(QUESTIONS)]
+            start = time.perf_counter()
+            index.match(question)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        os.remove(f.name)
+
+    print(json.dumps({
+        "rules": len(rules),
+        "patterns": len(index.automaton),
+        "load_ms": round(load_ms, 1),
+        "match_p50_us": round(percentile(latencies, 50) * 1e6, 1),
+        "match_p99_us": round(percentile(latencies, 99) * 1e6, 1),
+        "answers": hits,
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
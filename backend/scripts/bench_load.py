@@ -0,0 +1,139 @@
+"""
+Load harness for /chat/ask against the mock upstream.
+
+Starts gunicorn (gunicorn.conf.py) with 1, 2, 4 ... workers, drives it with
+concurrent SSE clients for a fixed duration and reports throughput, latency
+percentiles and scaling efficiency relative to one worker.
+
+Usage (from backend/, Postgres from docker-compose running):
+    python scripts/bench_load.py --workers 1 2 4 --concurrency 200 --duration 30
+
+Mock upstream pacing can be tuned with MOCK_* env vars (see app/core/config.py).
+Use --url to drive an already running deployment (e.g. nginx on :8080) instead.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[idx]
+
+
+async def one_stream(client: httpx.AsyncClient, url: str, question: str, session_id: str):
+    start = time.perf_counter()
+    ttfb = None
+    async with client.stream("POST", url, json={"question": question, "session_id": session_id},
+                             headers={"X-Session-Id": session_id}) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if ttfb is None and line.startswith("data: "):
+                ttfb = time.perf_counter() - start
+            if line == "data: [DONE]":
+                break
+    return time.perf_counter() - start, ttfb or 0.0
+
+
+async def drive(base_url: str, concurrency: int, duration: float):
+    url = f"{base_url}/api/v1/chat/ask"
+    latencies, ttfbs, errors = [], [], 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        async def client_loop(i):
+            nonlocal errors
+            n = 0
+            while time.perf_counter() < deadline:
+                try:
+                    latency, ttfb = await one_stream(client, url, f"压测问题 {i}-{n}", f"bench-{i}")
+                    latencies.append(latency)
+                    ttfbs.append(ttfb)
+                except Exception:
+                    errors += 1
+                n += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "completed": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "ttfb_p50": percentile(ttfbs, 50),
+        "mean": statistics.mean(latencies) if latencies else 0.0,
+    }
+
+
+def wait_ready(base_url: str, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/readyz", timeout=2).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def start_server(workers: int, port: int):
+    env = dict(os.environ, BAILIAN_MOCK="true", WEB_CONCURRENCY=str(workers), BIND=f"127.0.0.1:{port}")
+    env.setdefault("METRICS_MULTIPROC_DIR", f"/tmp/lumi_bench_metrics_{port}")
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--access-logfile", "/dev/null", "app.main:app"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--url", help="Drive an existing deployment instead of spawning gunicorn")
+    args = parser.parse_args()
+
+    if args.url:
+        result = asyncio.run(drive(args.url, args.concurrency, args.duration))
+        print(result)
+        return
+
+    print(f"{'workers':>7} {'req/s':>8} {'eff.':>6} {'p50 s':>7} {'p95 s':>7} {'ttfb p50':>9} {'errors':>7}")
+    baseline = None
+    for workers in args.workers:
+        proc = start_server(workers, args.port)
+        try:
+            base_url = f"http://127.0.0.1:{args.port}"
+            if not wait_ready(base_url):
+                print(f"{workers:>7} server did not become ready")
+                continue
+            r = asyncio.run(drive(base_url, args.concurrency, args.duration))
+        finally:
+            proc.terminate()
+            proc.wait(timeout=60)
+
+        baseline = baseline or r["throughput"] / workers
+        efficiency = r["throughput"] / (baseline * workers) if baseline else 0.0
+        print(f"{workers:>7} {r['throughput']:>8.1f} {efficiency:>6.0%} {r['p50']:>7.2f} {r['p95']:>7.2f} "
+              f"{r['ttfb_p50']:>9.3f} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
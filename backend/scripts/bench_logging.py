@@ -0,0 +1,86 @@
+"""
+Logging overhead per streamed frame, old vs new style.
+
+"before": loguru's default synchronous handler, f-string messages, per-chunk
+debug every 42 chunks and a warning on every slow chunk.
+"after":  app.core.logging setup (queue-backed sink), brace-style lazy messages,
+per-chunk lines sampled by LogSampler.
+
+Both write to a temp file so the numbers include the sink. The time is what the
+calling thread (the event loop in production) spends, per frame.
+
+Usage (from backend/):
+    python scripts/bench_logging.py --frames 20000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.logging import LogSampler, debug_enabled  # noqa: E402
+import app.core.logging as app_logging  # noqa: E402
+
+
+def before(frames: int, slow: bool):
+    for chunk_count in range(1, frames + 1):
+        delta_text = "路觅科技为客户提供一站式"
+        if slow:
+            logger.warning(f"[Perf] Slow API Detected! Waited {1500}ms for chunk #{chunk_count} from Bailian")
+        if chunk_count % 42 == 0:
+            logger.debug(f"[Perf] Chunk #{chunk_count} Delta: {len(delta_text)} chars")
+
+
+def after(frames: int, slow: bool, sampler: LogSampler):
+    for chunk_count in range(1, frames + 1):
+        delta_text = "路觅科技为客户提供一站式"
+        if slow:
+            dropped = sampler.sample("slow_chunk")
+            if dropped is not None:
+                logger.warning("[Perf] Slow API Detected! Waited {wait_ms}ms for chunk #{chunk} from Bailian",
+                               wait_ms=1500, chunk=chunk_count, suppressed=dropped)
+        if debug_enabled():
+            dropped = sampler.sample("chunk_delta")
+            if dropped is not None:
+                logger.debug("[Perf] Chunk #{chunk} Delta: {delta_chars} chars", chunk=chunk_count, delta_chars=len(delta_text), suppressed=dropped)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=20000)
+    args = parser.parse_args()
+
+    log_path = os.path.join(tempfile.mkdtemp(), "bench.log")
+    print(f"{'scenario':<28} {'before us/frame':>16} {'after us/frame':>15}")
+    for level in ("INFO", "DEBUG"):
+        for slow in (False, True):
+            # before: synchronous handler, everything on the calling thread
+            logger.remove()
+            logger.add(log_path, level=level)
+            t_before = timed(before, args.frames, slow)
+
+            # after: the app's setup, pointed at the same file
+            settings.LOG_LEVEL = level
+            app_logging.setup_logging()
+            logger.remove()
+            logger.add(log_path, level=level, enqueue=True, serialize=settings.LOG_JSON)
+            t_after = timed(after, args.frames, slow, LogSampler(settings.LOG_SAMPLE_PER_SECOND))
+            logger.complete()
+
+            name = f"{level}, {'slow upstream' if slow else 'healthy upstream'}"
+            print(f"{name:<28} {t_before / args.frames * 1e6:>16.2f} {t_after / args.frames * 1e6:>15.2f}")
+    logger.remove()
+
+
+if __name__ == "__main__":
+    main()
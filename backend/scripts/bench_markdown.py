@@ -0,0 +1,93 @@
+"""
+Cost of rendering a streamed answer: full re-render per frame (what the
+frontend did with marked.parse(accumulatedText)) vs the incremental stage in
+app/services/markdown_stream.py (server renders each completed block once,
+client re-renders only the open tail).
+
+markdown-it-py stands in for marked.js on both sides, so the numbers compare
+work done rather than browser timings.
+
+Usage (from backend/):
+    python scripts/bench_markdown.py --chars 1000 4000 16000 --delta 12
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.markdown_stream import MarkdownBlockStream, annotate, _renderer  # noqa: E402
+
+_SECTION = """## 产品说明
+路觅科技为客户提供一站式智能客服解决方案，支持知识库检索与联网搜索。
+接入方式包括网页插件、小程序与 API。
+
+- 知识库问答：基于企业文档自动回答
+- 联网搜索：实时补充外部信息
+- 工单流转：复杂问题转人工
+
+| 套餐 | 并发 | 价格 |
+|---|---|---|
+| 基础版 | 10 | 999 |
+| 企业版 | 100 | 9999 |
+
+```python
+client = Lumi(api_key="...")
+print(client.ask("你好"))
+```
+
+"""
+
+
+def build_answer(chars: int) -> str:
+    return (_SECTION * (chars // len(_SECTION) + 1))[:chars]
+
+
+def run_full(answer: str, delta: int):
+    md = _renderer()
+    total = 0.0
+    text = ""
+    for i in range(0, len(answer), delta):
+        text += answer[i:i + delta]
+        start = time.perf_counter()
+        md.render(text)
+        total += time.perf_counter() - start
+    return total
+
+
+def run_incremental(answer: str, delta: int):
+    md = _renderer()
+    stream = MarkdownBlockStream()
+    server = client = 0.0
+    text = ""
+    for i in range(0, len(answer), delta):
+        piece = answer[i:i + delta]
+        text += piece
+        start = time.perf_counter()
+        event = annotate({"text": piece, "is_finish": i + delta >= len(answer)}, stream)
+        server += time.perf_counter() - start
+        start = time.perf_counter()
+        md.render(text[event["md_offset"]:])
+        client += time.perf_counter() - start
+    return server, client
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chars", type=int, nargs="+", default=[1000, 4000, 16000])
+    parser.add_argument("--delta", type=int, default=12, help="Characters per SSE frame")
+    args = parser.parse_args()
+
+    _renderer().render("warm up")
+    print(f"{'chars':>7} {'frames':>7} {'full ms':>9} {'server ms':>10} {'tail ms':>9} {'server us/frame':>16}")
+    for chars in args.chars:
+        answer = build_answer(chars)
+        frames = (len(answer) + args.delta - 1) // args.delta
+        full = run_full(answer, args.delta)
+        server, client = run_incremental(answer, args.delta)
+        print(f"{chars:>7} {frames:>7} {full * 1000:>9.1f} {server * 1000:>10.1f} {client * 1000:>9.1f} {server / frames * 1e6:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Throughput of the streaming output filter (app/services/output_filter.py).
+
+Builds a dictionary of --terms random terms, plants some of them in a long
+answer and feeds it in --chunk-chars pieces, as the stream pipeline does.
+Compared with the naive approach of re-masking the whole text so far with
+one big regex at every frame (--naive-chars caps how much of the answer the
+naive run gets, it is quadratic).
+
+Usage (from backend/):
+    python scripts/bench_output_filter.py --terms 10000
+    python scripts/bench_output_filter.py --terms 50000 --answer-chars 20000
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.automaton import Automaton  # noqa: E402
+from app.core.metrics import percentile  # noqa: E402
+from app.services.output_filter import FilterStream  # noqa: E402
+
+FILLER = "路觅科技为客户提供一站式智能客服解决方案，支持知识库检索与联网搜索。We support retrieval and web search. "
+CJK = "敏感违规词汇测试示例内容风险广告诈骗赌博虚假宣传政治暴力色情"
+
+
+def make_terms(count: int, rng: random.Random) -> list:
+    terms = set()
+    while len(terms) < count:
+        if rng.random() < 0.7:
+            terms.add("".join(rng.choice(CJK) for _ in range(rng.randint(2, 6))))
+        else:
+            terms.add("".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 10))))
+    return sorted(terms)
+
+
+def make_answer(chars: int, terms: list, rng: random.Random) -> str:
+    parts, size = [], 0
+    while size < chars:
+        piece = FILLER[rng.randrange(len(FILLER)):] + (rng.choice(terms) if rng.random() < 0.5 else "")
+        parts.append(piece)
+        size += len(piece)
+    return "".join(parts)[:chars]
+
+
+def chunks(text: str, size: int):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def run_stream(automaton: Automaton, pieces: list):
+    stream = FilterStream(automaton, "*")
+    out, latencies, held = [], [], 0
+    start = time.perf_counter()
+    for piece in pieces:
+        t = time.perf_counter()
+        out.append(stream.feed(piece))
+        latencies.append(time.perf_counter() - t)
+        held = max(held, len(stream.pending))
+    out.append(stream.flush())
+    return "".join(out), time.perf_counter() - start, latencies, held
+
+
+def reference_mask(text: str, terms: list) -> str:
+    # Every occurrence of every term, overlaps included, on the whole text at once
+    lowered, mask = text.lower(), [False] * len(text)
+    for term in terms:
+        i = lowered.find(term)
+        while i != -1:
+            mask[i:i + len(term)] = [True] * len(term)
+            i = lowered.find(term, i + 1)
+    return "".join("*" if m else ch for ch, m in zip(text, mask))
+
+
+def run_naive(pattern, pieces: list):
+    # Mask the whole text so far at every frame (then send the new part)
+    full = ""
+    start = time.perf_counter()
+    for piece in pieces:
+        full += piece
+        pattern.sub(lambda m: "*" * len(m.group()), full.lower())
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--terms", type=int, default=10000)
+    parser.add_argument("--answer-chars", type=int, default=6000)
+    parser.add_argument("--chunk-chars", type=int, default=12)
+    parser.add_argument("--naive-chars", type=int, default=2000)
+    args = parser.parse_args()
+    rng = random.Random(7)
+
+    terms = make_terms(args.terms, rng)
+    answer = make_answer(args.answer_chars, terms, rng)
+    start = time.perf_counter()
+    automaton = Automaton(terms)
+    build_s = time.perf_counter() - start
+
+    masked, elapsed, latencies, held = run_stream(automaton, chunks(answer, args.chunk_chars))
+
+    # Naive baseline on a prefix (longest terms first, like an alternation would need)
+    pattern = re.compile("|".join(re.escape(t) for t in sorted(terms, key=len, reverse=True)))
+    prefix = answer[:args.naive_chars]
+    naive_s = run_naive(pattern, chunks(prefix, args.chunk_chars))
+    _, stream_prefix_s, _, _ = run_stream(automaton, chunks(prefix, args.chunk_chars))
+
+    print(json.dumps({
+        "terms": len(terms),
+        "longest_term": automaton.longest,
+        "build_s": round(build_s, 2),
+        "answer_chars": len(answer),
+        "masked_chars": masked.count("*"),
+        "stream_chars_per_s": round(len(answer) / elapsed),
+        "stream_feed_p50_us": round(percentile(latencies, 50) * 1e6, 1),
+        "stream_feed_p99_us": round(percentile(latencies, 99) * 1e6, 1),
+        "max_held_chars": held,
+        "naive_prefix_chars": len(prefix),
+        "naive_prefix_s": round(naive_s, 3),
+        "stream_prefix_s": round(stream_prefix_s, 4),
+        "matches_whole_text_masking": masked == reference_mask(answer, terms),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Bulk delete throughput on a large chat_logs table.
+
+Seeds --rows chat logs (created_at spread over --days, ids in time order like
+production) into the configured database, then runs the retention delete
+(RetentionService.run, RETENTION_BATCH_SIZE rows per statement) for rows older
+than --older-than-days. A writer inserts one chat log every 50ms meanwhile;
+its latency shows how long other transactions wait behind the delete batches.
+
+Usage (from backend/):
+    SQLALCHEMY_DATABASE_URI=sqlite+aiosqlite:////tmp/lumi_retention.db python scripts/bench_retention.py --rows 10000000
+    SQLALCHEMY_DATABASE_URI=... python scripts/bench_retention.py --skip-seed --older-than-days 90
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, insert, select  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.logging import setup_logging  # noqa: E402
+from app.core.metrics import percentile  # noqa: E402
+from app.db.base_class import Base  # noqa: E402
+from app.db.session import AsyncSessionLocal, engine  # noqa: E402
+from app.models.chat_log import ChatLog  # noqa: E402
+from app.models import usage_rollup  # noqa: E402,F401 (registers the table)
+from app.services.retention_service import DeletionJob, RetentionService  # noqa: E402
+
+ANSWER = "路觅科技为客户提供一站式智能客服解决方案，支持知识库检索与联网搜索。" * 3
+METADATA = {"usage": {"input_tokens": 12, "output_tokens": 240}, "latency": 1800, "rag_result": None, "web_result": None}
+
+
+async def seed(rows: int, days: int, batch: int = 10000):
+    start_ts = datetime.now(timezone.utc) - timedelta(days=days)
+    step = timedelta(days=days) / rows
+    prefix = uuid.uuid4().hex[:8]
+    started = time.perf_counter()
+    for offset in range(0, rows, batch):
+        values = [
+            {
+                "request_id": f"{prefix}-{i}",
+                "session_id": f"seed-{i // 20}",
+                "user_query": f"问题 {i}",
+                "ai_response": ANSWER,
+                "metadata_info": METADATA,
+                "created_at": start_ts + step * i,
+            }
+            for i in range(offset, min(rows, offset + batch))
+        ]
+        async with AsyncSessionLocal() as session:
+            await session.execute(insert(ChatLog), values)
+            await session.commit()
+        if (offset // batch) % 50 == 0:
+            done = offset + len(values)
+            print(f"seeded {done}/{rows} ({done / (time.perf_counter() - started):.0f} rows/s)", flush=True)
+    return time.perf_counter() - started
+
+
+async def count_rows() -> int:
+    async with AsyncSessionLocal() as session:
+        return (await session.execute(select(func.count()).select_from(ChatLog))).scalar()
+
+
+async def writer(stop: asyncio.Event, latencies: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        async with AsyncSessionLocal() as session:
+            session.add(ChatLog(request_id=str(uuid.uuid4()), session_id="live", user_query="live", ai_response="ok"))
+            await session.commit()
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.05)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--older-than-days", type=int, default=180)
+    parser.add_argument("--batch", type=int, default=settings.RETENTION_BATCH_SIZE)
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse the rows already in the database")
+    args = parser.parse_args()
+    setup_logging()
+    settings.RETENTION_BATCH_SIZE = args.batch
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    seed_seconds = None
+    if not args.skip_seed:
+        seed_seconds = await seed(args.rows, args.days)
+    rows_before = await count_rows()
+
+    before = datetime.now(timezone.utc) - timedelta(days=args.older_than_days)
+    stop, latencies = asyncio.Event(), []
+    writer_task = asyncio.create_task(writer(stop, latencies))
+    job = await RetentionService.run(DeletionJob("retention", {"before": before.isoformat()}), before=before)
+    stop.set()
+    await writer_task
+
+    print(json.dumps({
+        "database": engine.url.get_backend_name(),
+        "rows_before": rows_before,
+        "rows_after": await count_rows(),
+        "seed_s": round(seed_seconds, 1) if seed_seconds is not None else None,
+        "batch_size": args.batch,
+        "job": job.to_dict(),
+        "concurrent_insert_p50_ms": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        "concurrent_insert_p99_ms": round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+        "concurrent_insert_max_ms": round(max(latencies) * 1000, 1) if latencies else None,
+    }, indent=2))
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
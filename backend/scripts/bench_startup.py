@@ -0,0 +1,97 @@
+"""
+Startup benchmark.
+
+1. Import-time report for `app.main` (python -X importtime), top modules by cumulative time.
+2. Spawns uvicorn and measures time-to-first-request (GET / returns 200)
+   and time-to-ready (GET /readyz returns 200, i.e. DB + upstream pools warm).
+
+Usage (from backend/):
+    python scripts/bench_startup.py [--top 15] [--port 8765] [--runs 3]
+"""
+import argparse
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_time_report(top: int):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = IMPORT_LINE.match(line)
+        if m:
+            self_us, cumulative_us, indent, name = m.groups()
+            rows.append((int(cumulative_us), int(self_us), len(indent) // 2, name))
+
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:])
+        return
+
+    # Top-level imports (depth 0) sum to the total import cost
+    total_us = sum(r[0] for r in rows if r[2] == 0)
+    print(f"Import of app.main: {total_us / 1000:.1f}ms total, {len(rows)} modules")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, _, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+
+def wait_for(url: str, deadline: float):
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as resp:
+                if resp.status == 200:
+                    return time.time()
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def startup_run(port: int, timeout: float):
+    start = time.time()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+    )
+    try:
+        deadline = start + timeout
+        first = wait_for(f"http://127.0.0.1:{port}/", deadline)
+        ready = wait_for(f"http://127.0.0.1:{port}/readyz", deadline) if first else None
+        return (
+            (first - start) * 1000 if first else None,
+            (ready - start) * 1000 if ready else None,
+        )
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    import_time_report(args.top)
+    print("-" * 50)
+    for i in range(args.runs):
+        first_ms, ready_ms = startup_run(args.port, args.timeout)
+        fmt = lambda v: f"{v:.0f}ms" if v is not None else "timeout"
+        print(f"Run {i + 1}: time-to-first-request {fmt(first_ms)}, time-to-ready {fmt(ready_ms)}")
+
+
+if __name__ == "__main__":
+    main()
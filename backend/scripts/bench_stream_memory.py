@@ -0,0 +1,156 @@
+"""
+Server memory at N concurrent long answers, against the mock upstream.
+
+Starts uvicorn on --backend-dir (default: this checkout; point it at another
+checkout to compare revisions), opens --streams concurrent /chat/ask SSE
+streams of --answer-chars characters each and reports peak RSS over the idle
+baseline, per stream, plus the server's own accounting (stream_buffer_bytes)
+when it has it.
+
+Usage (from backend/):
+    python scripts/bench_stream_memory.py --streams 500 --answer-chars 6000
+    git worktree add /tmp/before HEAD~1 && python scripts/bench_stream_memory.py --backend-dir /tmp/before/backend
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.core.metrics import percentile  # noqa: E402
+
+
+def rss_kb(pid: int, field: str = "VmRSS") -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def start_server(args, db_path: str):
+    env = dict(
+        os.environ,
+        BAILIAN_MOCK="true",
+        LOG_LEVEL="WARNING",
+        SQLALCHEMY_DATABASE_URI=os.environ.get("SQLALCHEMY_DATABASE_URI", f"sqlite+aiosqlite:///{db_path}"),
+        MOCK_ANSWER_CHARS=str(args.answer_chars),
+        MOCK_CHUNK_CHARS=str(args.chunk_chars),
+        MOCK_CHUNK_INTERVAL_MS=str(args.chunk_interval_ms),
+        MOCK_TTFT_MS="100",
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--no-access-log", "--log-level", "warning"],
+        cwd=args.backend_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def wait_ready(base_url: str, timeout: float = 60) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/readyz", timeout=2).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+async def sample_peak(pid: int, stop: asyncio.Event, peak: list):
+    while not stop.is_set():
+        peak[0] = max(peak[0], rss_kb(pid))
+        await asyncio.sleep(0.05)
+
+
+async def run_streams(base_url: str, streams: int):
+    limits = httpx.Limits(max_connections=streams, max_keepalive_connections=streams)
+    async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+        async def one(i):
+            start = time.perf_counter()
+            received = 0
+            try:
+                async with client.stream("POST", f"{base_url}/api/v1/chat/ask", json={"question": f"长回答 {i}", "session_id": f"mem-{i}"}) as resp:
+                    async for line in resp.aiter_lines():
+                        received += len(line)
+                        if line == "data: [DONE]":
+                            break
+            except httpx.HTTPError:
+                return None
+            return time.perf_counter() - start, received
+
+        return await asyncio.gather(*(one(i) for i in range(streams)))
+
+
+def buffer_bytes(base_url: str):
+    try:
+        text = httpx.get(f"{base_url}/metrics", timeout=5).text
+    except httpx.HTTPError:
+        return None
+    for line in text.splitlines():
+        if line.startswith("stream_buffer_bytes"):
+            return float(line.split()[-1])
+    return None
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--streams", type=int, default=500)
+    parser.add_argument("--answer-chars", type=int, default=6000)
+    parser.add_argument("--chunk-chars", type=int, default=60)
+    parser.add_argument("--chunk-interval-ms", type=int, default=30)
+    parser.add_argument("--port", type=int, default=8792)
+    parser.add_argument("--backend-dir", default=BACKEND_DIR)
+    args = parser.parse_args()
+
+    db_path = "/tmp/lumi_bench_stream_memory.db"
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    proc = start_server(args, db_path)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        if not wait_ready(base_url):
+            raise SystemExit("Server did not become ready")
+        rss_base = rss_kb(proc.pid)
+        peak, stop = [rss_base], asyncio.Event()
+        sampler = asyncio.create_task(sample_peak(proc.pid, stop, peak))
+        start = time.perf_counter()
+        results = await run_streams(base_url, args.streams)
+        elapsed = time.perf_counter() - start
+        # Finished streams stay resumable (STREAM_REPLAY_TTL_SECONDS): what they hold is still resident
+        retained = buffer_bytes(base_url)
+        stop.set()
+        await sampler
+        rss_after = rss_kb(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=60)
+
+    ok = [r for r in results if r is not None]
+    growth_kb = peak[0] - rss_base
+    print(json.dumps({
+        "backend_dir": args.backend_dir,
+        "streams": args.streams,
+        "answer_chars": args.answer_chars,
+        "errors": len(results) - len(ok),
+        "server_rss_base_mb": round(rss_base / 1024, 1),
+        "server_rss_peak_growth_mb": round(growth_kb / 1024, 1),
+        "server_rss_after_growth_mb": round((rss_after - rss_base) / 1024, 1),
+        "peak_growth_kb_per_stream": round(growth_kb / args.streams, 1),
+        "sse_bytes_per_stream": round(sum(r[1] for r in ok) / max(1, len(ok))),
+        "stream_buffer_bytes_retained": retained,
+        "total_p50_s": round(percentile([r[0] for r in ok], 50), 2) if ok else None,
+        "total_p95_s": round(percentile([r[0] for r in ok], 95), 2) if ok else None,
+        "elapsed_s": round(elapsed, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,175 @@
+"""
+SSE vs WebSocket transport at N concurrent streams, against the mock upstream.
+
+Starts a fresh uvicorn server per transport and opens --streams concurrent
+answers at once: over SSE that is one HTTP connection per answer, over
+/chat/ws they are multiplexed on --ws-connections sockets. Reports client
+connections, server memory (peak RSS over the idle baseline) and
+time-to-first-frame / total latency percentiles.
+
+Usage (from backend/):
+    python scripts/bench_ws.py --streams 1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+import websockets
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.core.metrics import percentile  # noqa: E402
+
+
+def rss_kb(pid: int, field: str = "VmRSS") -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def start_server(port: int, db_path: str):
+    env = dict(os.environ, BAILIAN_MOCK="true", LOG_LEVEL="WARNING",
+               SQLALCHEMY_DATABASE_URI=os.environ.get("SQLALCHEMY_DATABASE_URI", f"sqlite+aiosqlite:///{db_path}"))
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--no-access-log", "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def wait_ready(base_url: str, timeout: float = 60) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/readyz", timeout=2).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+async def run_sse(base_url: str, streams: int):
+    limits = httpx.Limits(max_connections=streams, max_keepalive_connections=streams)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        async def one(i):
+            start = time.perf_counter()
+            first = None
+            try:
+                async with client.stream("POST", f"{base_url}/api/v1/chat/ask", json={"question": f"问题 {i}", "session_id": f"sse-{i}"}) as resp:
+                    async for line in resp.aiter_lines():
+                        if first is None and line.startswith("data: {") and '"init"' not in line:
+                            first = time.perf_counter() - start
+                        if line == "data: [DONE]":
+                            break
+            except httpx.HTTPError:
+                return None
+            return first or 0.0, time.perf_counter() - start
+
+        results = await asyncio.gather(*(one(i) for i in range(streams)))
+    return results, streams
+
+
+async def run_ws(base_url: str, streams: int, connections: int):
+    ws_url = base_url.replace("http://", "ws://") + "/api/v1/chat/ws"
+    results = []
+
+    async def connection(ids):
+        async with websockets.connect(ws_url, max_size=None, ping_interval=None) as ws:
+            started, first, consumed = {}, {}, {}
+            for i in ids:
+                started[f"q{i}"] = time.perf_counter()
+                await ws.send(json.dumps({"type": "ask", "id": f"q{i}", "question": f"问题 {i}", "session_id": f"ws-{i}"}))
+            pending = set(started)
+            while pending:
+                message = json.loads(await ws.recv())
+                rid = message["id"]
+                if message.get("done") or ("error" in message and "data" not in message):
+                    pending.discard(rid)
+                    results.append((first.get(rid, 0.0), time.perf_counter() - started[rid]))
+                    continue
+                if rid not in first and message["data"].get("request_id") != "init":
+                    first[rid] = time.perf_counter() - started[rid]
+                consumed[rid] = consumed.get(rid, 0) + 1
+                if consumed[rid] % 32 == 0:
+                    await ws.send(json.dumps({"type": "credit", "id": rid, "n": 32}))
+
+    groups = [list(range(streams))[c::connections] for c in range(connections)]
+    await asyncio.gather(*(connection(ids) for ids in groups if ids))
+    return results, connections
+
+
+def summarize(results, connections, elapsed, rss_base, rss_peak):
+    errors = sum(1 for r in results if r is None)
+    results = [r for r in results if r is not None]
+    firsts = [r[0] for r in results]
+    totals = [r[1] for r in results]
+    return {
+        "streams": len(results),
+        "errors": errors,
+        "client_connections": connections,
+        "server_rss_base_mb": round(rss_base / 1024, 1),
+        "server_rss_growth_mb": round((rss_peak - rss_base) / 1024, 1),
+        "first_frame_p50_ms": round(percentile(firsts, 50) * 1000),
+        "first_frame_p95_ms": round(percentile(firsts, 95) * 1000),
+        "total_p50_s": round(percentile(totals, 50), 2),
+        "total_p95_s": round(percentile(totals, 95), 2),
+        "total_p99_s": round(percentile(totals, 99), 2),
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+async def sample_peak(pid: int, stop: asyncio.Event, peak: list):
+    while not stop.is_set():
+        peak[0] = max(peak[0], rss_kb(pid))
+        await asyncio.sleep(0.05)
+
+
+async def bench(transport: str, args) -> dict:
+    db_path = f"/tmp/lumi_bench_ws_{transport}.db"
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    proc = start_server(args.port, db_path)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        if not wait_ready(base_url):
+            raise SystemExit("Server did not become ready")
+        rss_base = rss_kb(proc.pid)
+        peak, stop = [rss_base], asyncio.Event()
+        sampler = asyncio.create_task(sample_peak(proc.pid, stop, peak))
+        start = time.perf_counter()
+        if transport == "sse":
+            results, connections = await run_sse(base_url, args.streams)
+        else:
+            results, connections = await run_ws(base_url, args.streams, args.ws_connections)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await sampler
+        return summarize(results, connections, elapsed, rss_base, peak[0])
+    finally:
+        proc.terminate()
+        proc.wait(timeout=60)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--streams", type=int, default=1000)
+    parser.add_argument("--ws-connections", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8791)
+    args = parser.parse_args()
+
+    report = {}
+    for transport in ("sse", "ws"):
+        report[transport] = await bench(transport, args)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,281 @@
+"""
+Mine FAQ entries from chat_logs and write the index used by the /ask fast path.
+
+Questions are clustered with character n-gram TF-IDF cosine similarity
+(leader clustering over an inverted index, CPU only). For each cluster the
+answered question closest to its leader is kept as the canonical answer with
+its sources. The top --top clusters by size are written to FAQ_INDEX_PATH,
+which running workers pick up on their own (mtime check).
+
+Runs are incremental: the clustering state and the last processed chat_logs.id
+are checkpointed in FAQ_STATE_PATH (every --checkpoint-every batches), so a
+nightly run only reads new rows. Leader vectors are only rebuilt for the
+clusters that grew, and the oldest one-question clusters beyond
+--max-singletons are dropped so the state stops growing with the traffic.
+The newest --holdout share of the unprocessed rows is left out of the
+clustering and used to measure how much unseen traffic the new index would
+have answered without calling upstream (absorbed_heldout_share). Those rows
+stay after the checkpoint, so the next run clusters them.
+
+Usage (from backend/):
+    python scripts/build_faq.py --top 200
+    python scripts/build_faq.py --full          # ignore the checkpoint, start over
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, select  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.db.session import AsyncReadSessionLocal  # noqa: E402
+from app.models.chat_log import ChatLog  # noqa: E402
+from app.services.faq_index import FaqIndex, cosine, idf, term_counts, tfidf, truncate, write_json  # noqa: E402
+
+CENTROID_TERMS = 256 # Term counts kept per cluster in the checkpoint
+MIN_ANSWER_CHARS = 10
+CANDIDATE_TERMS = 8 # Heaviest query terms used to look up candidate clusters
+
+
+def load_state(path: str, full: bool) -> dict:
+    if full or not os.path.exists(path):
+        return {"last_id": 0, "n_docs": 0, "df": {}, "clusters": [], "next_cluster": 0}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def candidate_of(log: ChatLog, sim: float):
+    """
+    Canonical answer candidate from one row, or None if it can't serve as one.
+    """
+    meta = log.metadata_info or {}
+    if meta.get("faq_id") or not log.ai_response or len(log.ai_response) < MIN_ANSWER_CHARS:
+        return None # Already served from the FAQ, or no usable answer
+    return {
+        "row_id": log.id,
+        "question": log.user_query,
+        "answer": log.ai_response,
+        "sources": log.sources,
+        "rag_result": meta.get("rag_result"),
+        "web_result": meta.get("web_result"),
+        "sim": sim,
+    }
+
+
+class Leaders:
+    """
+    Leader vectors of the clusters and an inverted index over their terms,
+    kept for the whole run. A leader is recomputed only after its cluster
+    grew; the others keep the idf they were built with (a batch moves the
+    document frequencies very little).
+    """
+
+    def __init__(self):
+        self.vectors = {} # cluster id -> truncated tf-idf vector
+        self.postings = {} # term -> ids of the clusters whose leader has it
+        self.stale = set() # Clusters that grew since their leader was built
+
+    def set(self, cluster_id: str, vec: dict):
+        self.drop(cluster_id)
+        self.vectors[cluster_id] = vec
+        for term in vec:
+            self.postings.setdefault(term, set()).add(cluster_id)
+
+    def drop(self, cluster_id: str):
+        for term in self.vectors.pop(cluster_id, None) or ():
+            ids = self.postings[term]
+            ids.discard(cluster_id)
+            if not ids:
+                del self.postings[term]
+        self.stale.discard(cluster_id)
+
+
+def cluster_batch(state: dict, leaders: Leaders, logs, threshold: float):
+    n_docs = state["n_docs"]
+    df = state["df"]
+    for log in logs:
+        n_docs += 1
+        for term in term_counts(log.user_query):
+            df[term] = df.get(term, 0) + 1
+    state["n_docs"] = n_docs
+    idf_of = lambda term: idf(df.get(term, 0), n_docs)
+
+    # Leaders with the current idf for the clusters that grew (or were just loaded), fixed for the rest of the batch
+    clusters = {cluster["id"]: cluster for cluster in state["clusters"]}
+    for cluster_id, cluster in clusters.items():
+        if cluster_id in leaders.stale or cluster_id not in leaders.vectors:
+            leaders.set(cluster_id, truncate(tfidf(cluster["counts"], idf_of)))
+
+    for log in logs:
+        counts = term_counts(log.user_query)
+        vec = tfidf(counts, idf_of)
+        # Candidates only via the query's most distinctive terms: low-idf n-grams
+        # ("请问") have posting lists covering most clusters
+        candidates = set()
+        for term, _ in sorted(vec.items(), key=lambda kv: kv[1], reverse=True)[:CANDIDATE_TERMS]:
+            candidates.update(leaders.postings.get(term, ()))
+        best = max(((i, cosine(vec, leaders.vectors[i])) for i in candidates), key=lambda kv: kv[1], default=None)
+
+        if best is not None and best[1] >= threshold:
+            cluster = clusters[best[0]]
+            cluster["size"] += 1
+            merged = Counter(cluster["counts"])
+            merged.update(counts)
+            cluster["counts"] = dict(merged)
+            leaders.stale.add(cluster["id"])
+            candidate = candidate_of(log, best[1])
+            if candidate and (cluster["best"] is None or candidate["sim"] >= cluster["best"]["sim"]):
+                cluster["best"] = candidate
+        else:
+            cluster = {
+                "id": f"faq-{state['next_cluster']}",
+                "size": 1,
+                "counts": dict(counts),
+                "best": candidate_of(log, 1.0),
+            }
+            state["next_cluster"] += 1
+            state["clusters"].append(cluster)
+            clusters[cluster["id"]] = cluster
+            leaders.set(cluster["id"], truncate(vec))
+            if len(counts) > CENTROID_TERMS:
+                leaders.stale.add(cluster["id"]) # Only to get its counts trimmed below
+
+    for cluster_id in leaders.stale:
+        cluster = clusters[cluster_id]
+        if len(cluster["counts"]) > CENTROID_TERMS:
+            top = sorted(cluster["counts"].items(), key=lambda kv: kv[1], reverse=True)[:CENTROID_TERMS]
+            cluster["counts"] = dict(top)
+
+
+def prune_singletons(state: dict, leaders: Leaders, keep: int) -> int:
+    """
+    Drop the oldest one-question clusters beyond `keep`: questions nobody
+    asked again, that will never reach the index but make up most of the
+    state. Returns how many were dropped.
+    """
+    singletons = [cluster["id"] for cluster in state["clusters"] if cluster["size"] == 1]
+    if len(singletons) <= keep:
+        return 0
+    # Clusters are in creation order, the first singletons are the oldest
+    dropped = set(singletons[:len(singletons) - keep])
+    state["clusters"] = [cluster for cluster in state["clusters"] if cluster["id"] not in dropped]
+    for cluster_id in dropped:
+        leaders.drop(cluster_id)
+    return len(dropped)
+
+
+def build_index(state: dict, top: int) -> dict:
+    n_docs = state["n_docs"]
+    idf_of = lambda term: idf(state["df"].get(term, 0), n_docs)
+    answered = [c for c in state["clusters"] if c["best"] is not None and c["size"] > 1]
+    answered.sort(key=lambda c: c["size"], reverse=True)
+
+    entries = []
+    idf_table = {}
+    for cluster in answered[:top]:
+        vec = truncate(tfidf(cluster["counts"], idf_of))
+        for term in vec:
+            idf_table[term] = idf_of(term)
+        best = cluster["best"]
+        entries.append({
+            "id": cluster["id"],
+            "row_id": best["row_id"], # Lets a privacy delete find it (see faq_index.forget_rows)
+            "question": best["question"],
+            "answer": best["answer"],
+            "sources": best["sources"],
+            "rag_result": best["rag_result"],
+            "web_result": best["web_result"],
+            "cluster_size": cluster["size"],
+            "vector": vec,
+        })
+    return {"n_docs": n_docs, "idf": idf_table, "entries": entries}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=200, help="Clusters to keep in the index")
+    parser.add_argument("--threshold", type=float, default=0.6, help="Cosine similarity to join a cluster")
+    parser.add_argument("--batch", type=int, default=5000, help="Rows read per query")
+    parser.add_argument("--checkpoint-every", type=int, default=10, help="Batches between state checkpoints")
+    parser.add_argument("--max-singletons", type=int, default=50000, help="One-question clusters kept in the state")
+    parser.add_argument("--state", default=settings.FAQ_STATE_PATH)
+    parser.add_argument("--output", default=settings.FAQ_INDEX_PATH)
+    parser.add_argument("--full", action="store_true", help="Ignore the checkpoint and re-cluster everything")
+    parser.add_argument("--holdout", type=float, default=0.1,
+                        help="Share of the newest unprocessed rows kept out of this run to measure the index on")
+    args = parser.parse_args()
+
+    state = load_state(args.state, args.full)
+    leaders = Leaders()
+    start = time.perf_counter()
+    questions = [] # Held-out questions
+    processed = 0
+    batches = 0
+    pruned = 0
+
+    async with AsyncReadSessionLocal() as session:
+        # First held-out id: rows from there on are only used for the measurement
+        unprocessed = await session.scalar(select(func.count()).where(ChatLog.id > state["last_id"]))
+        held_out = int(unprocessed * args.holdout)
+        holdout_from = None
+        if held_out:
+            holdout_from = await session.scalar(
+                select(ChatLog.id).where(ChatLog.id > state["last_id"]).order_by(ChatLog.id.desc()).offset(held_out - 1).limit(1)
+            )
+
+        while True:
+            stmt = select(ChatLog).where(ChatLog.id > state["last_id"]).order_by(ChatLog.id).limit(args.batch)
+            if holdout_from is not None:
+                stmt = stmt.where(ChatLog.id < holdout_from)
+            result = await session.execute(stmt)
+            logs = result.scalars().all()
+            if not logs:
+                break
+            cluster_batch(state, leaders, logs, args.threshold)
+            pruned += prune_singletons(state, leaders, args.max_singletons)
+            state["last_id"] = logs[-1].id
+            processed += len(logs)
+            session.expunge_all() # Don't keep every ORM row of the run in the identity map
+            batches += 1
+            if batches % args.checkpoint_every == 0:
+                write_json(args.state, state)
+            print(f"Processed up to id {state['last_id']} ({processed} rows, {len(state['clusters'])} clusters)", file=sys.stderr)
+
+        if holdout_from is not None:
+            result = await session.execute(select(ChatLog.user_query).where(ChatLog.id >= holdout_from).order_by(ChatLog.id))
+            questions = list(result.scalars())
+
+    if batches % args.checkpoint_every:
+        write_json(args.state, state) # Checkpoint of the last batches
+
+    index = build_index(state, args.top)
+    write_json(args.output, index)
+
+    # How much unseen traffic (the held-out rows, newer than everything clustered) the new index would have absorbed
+    faq = FaqIndex(args.output)
+    faq.load()
+    hits = sum(1 for q in questions if faq.match(q) is not None)
+    covered = sum(e["cluster_size"] for e in index["entries"])
+
+    print(json.dumps({
+        "new_rows": processed,
+        "total_rows": state["n_docs"],
+        "clusters": len(state["clusters"]),
+        "pruned_singletons": pruned,
+        "index_entries": len(index["entries"]),
+        "top_clusters_share_of_all_rows": round(covered / state["n_docs"], 4) if state["n_docs"] else 0,
+        "heldout_rows": len(questions),
+        "absorbed_heldout_rows": hits,
+        "absorbed_heldout_share": round(hits / len(questions), 4) if questions else None,
+        "match_threshold": settings.FAQ_MATCH_THRESHOLD,
+        "elapsed_s": round(time.perf_counter() - start, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+"""
+Delete chat logs in bounded batches, outside the API (cron, privacy requests).
+
+Same code path as DELETE /api/v1/chat/history and /chat/sessions/{id} and the
+scheduled cleanup (RETENTION_DAYS): one DELETE of RETENTION_BATCH_SIZE rows per
+transaction, progress logged every RETENTION_PROGRESS_EVERY batches.
+
+Usage (from backend/):
+    python scripts/retention.py --older-than-days 180
+    python scripts/retention.py --before 2025-01-01
+    python scripts/retention.py --session 3f2c...          # also drops its per-session rollups and FAQ answers
+    python scripts/retention.py --create-index             # created_at index on an existing database, then exit
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings  # noqa: E402
+from app.core.logging import setup_logging  # noqa: E402
+from app.db.session import engine  # noqa: E402
+from app.services.retention_service import DeletionJob, RetentionService  # noqa: E402
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--older-than-days", type=int)
+    parser.add_argument("--before", type=datetime.fromisoformat, help="ISO date/time, UTC when no offset is given")
+    parser.add_argument("--session", help="Delete one session's chat logs")
+    parser.add_argument("--batch", type=int, default=settings.RETENTION_BATCH_SIZE)
+    parser.add_argument("--create-index", action="store_true", help="Only create the chat_logs.created_at index if missing")
+    args = parser.parse_args()
+    setup_logging()
+    settings.RETENTION_BATCH_SIZE = args.batch
+
+    if args.create_index:
+        await RetentionService.ensure_index()
+        await engine.dispose()
+        return
+
+    before = args.before
+    if args.older_than_days is not None:
+        before = datetime.now(timezone.utc) - timedelta(days=args.older_than_days)
+    if before is not None and before.tzinfo is None:
+        before = before.replace(tzinfo=timezone.utc)
+    if before is None and args.session is None:
+        raise SystemExit("Pass --older-than-days, --before and/or --session")
+
+    criteria = {}
+    if args.session is not None:
+        criteria["session_id"] = args.session
+    if before is not None:
+        criteria["before"] = before.isoformat()
+    kind = "session" if args.session is not None and before is None else "before"
+
+    job = await RetentionService.run(DeletionJob(kind, criteria), session_id=args.session, before=before)
+    print(json.dumps(job.to_dict(), indent=2))
+    await engine.dispose()
+    if job.status != "done":
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
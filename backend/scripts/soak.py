@@ -0,0 +1,304 @@
+"""
+Soak test: hours of mixed traffic against the mock upstream, failing on leaks.
+
+Starts uvicorn on --backend-dir with the mock upstream (upstream errors before
+and during the stream, slow first chunks) and drives it with --concurrency
+clients that finish normally, disconnect mid-answer (half of them resume with
+Last-Event-ID), read slowly, ask for JSON answers or list history.
+
+Every --sample-seconds it records the worker's threads, asyncio tasks, DB
+connections checked out, open fds, live streams and RSS (GET
+/api/v1/admin/runtime) into --report (JSON lines). The run fails when
+
+- after --warmup-seconds, the low-water mark of a resource rises in every one
+  of --windows consecutive windows by more than its tolerance in total
+  (load makes the samples noisy, a leak raises the floor), or
+- once traffic stops and replay buffers expire, streams, pending writes,
+  checked-out connections or upstream threads are not back to zero, or
+  threads/tasks are above the idle level measured after warm-up.
+
+Usage (from backend/):
+    python scripts/soak.py --duration 7200 --concurrency 20
+    python scripts/soak.py --duration 600 --sample-seconds 10 --warmup-seconds 60   # quick check
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REPLAY_TTL_SECONDS = 10 # Short, so the idle check doesn't wait minutes for buffers to expire
+
+# Resource -> (absolute, relative) growth tolerated across the measured part of the run
+TOLERANCES = {
+    "rss_mb": (20.0, 0.10),
+    "threads": (2, 0.0),
+    "tasks": (5, 0.0),
+    "db_checked_out": (1, 0.0),
+    "open_fds": (5, 0.0),
+}
+# Threads that only exist while an upstream call runs
+UPSTREAM_THREADS = ("Thread (run_producer)", "Thread (_attempt)")
+
+
+def start_server(args, db_path: str, token: str):
+    env = dict(
+        os.environ,
+        BAILIAN_MOCK="true",
+        ADMIN_TOKEN=token,
+        LOG_LEVEL="WARNING",
+        SQLALCHEMY_DATABASE_URI=os.environ.get("SQLALCHEMY_DATABASE_URI", f"sqlite+aiosqlite:///{db_path}"),
+        STREAM_REPLAY_TTL_SECONDS=str(REPLAY_TTL_SECONDS),
+        MOCK_TTFT_MS=os.environ.get("MOCK_TTFT_MS", "100"),
+        MOCK_CHUNK_INTERVAL_MS=os.environ.get("MOCK_CHUNK_INTERVAL_MS", "20"),
+        MOCK_ERROR_RATE=str(args.error_rate),
+        MOCK_MIDSTREAM_ERROR_RATE=str(args.midstream_error_rate),
+        MOCK_SLOW_RATE=str(args.slow_upstream_rate),
+        MOCK_SLOW_TTFT_MS="2000",
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--no-access-log", "--log-level", "warning"],
+        cwd=args.backend_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def wait_ready(base_url: str, timeout: float = 60) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/readyz", timeout=2).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+class Traffic:
+    """
+    One client loop per --concurrency, each request picking a behaviour at random.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, base_url: str, args):
+        self.client = client
+        self.base_url = base_url
+        self.args = args
+        self.counts = {"complete": 0, "disconnect": 0, "resume": 0, "slow": 0, "json": 0, "history": 0, "error": 0}
+        self.stop = asyncio.Event()
+
+    async def run(self):
+        await asyncio.gather(*(self._loop(i) for i in range(self.args.concurrency)))
+
+    async def _loop(self, i: int):
+        n = 0
+        while not self.stop.is_set():
+            n += 1
+            try:
+                await self._one(f"soak-{i}-{n % 20}", f"soak question {i}-{n}")
+            except (httpx.HTTPError, ValueError):
+                self.counts["error"] += 1
+                await asyncio.sleep(0.5)
+
+    async def _one(self, session_id: str, question: str):
+        r = random.random()
+        args = self.args
+        if r < args.history_rate:
+            resp = await self.client.get(f"{self.base_url}/api/v1/chat/history", params={"limit": 30})
+            resp.raise_for_status()
+            self.counts["history"] += 1
+            return
+        r -= args.history_rate
+        if r < args.json_rate:
+            resp = await self.client.post(f"{self.base_url}/api/v1/chat/ask", params={"stream": "false"},
+                                          json={"question": question, "session_id": session_id})
+            if resp.status_code >= 500:
+                self.counts["error"] += 1 # Injected upstream errors come back as 502
+            self.counts["json"] += 1
+            return
+        r -= args.json_rate
+        if r < args.disconnect_rate:
+            last_id = await self._sse(question, session_id, stop_after=random.randint(1, 30))
+            self.counts["disconnect"] += 1
+            if last_id and random.random() < 0.5:
+                await self._sse(question, session_id, last_event_id=last_id)
+                self.counts["resume"] += 1
+            return
+        r -= args.disconnect_rate
+        if r < args.slow_client_rate:
+            await self._sse(question, session_id, delay=random.uniform(0.05, 0.3))
+            self.counts["slow"] += 1
+            return
+        await self._sse(question, session_id)
+        self.counts["complete"] += 1
+
+    async def _sse(self, question: str, session_id: str, stop_after: int = None, delay: float = 0.0,
+                   last_event_id: str = None):
+        headers = {"Last-Event-ID": last_event_id} if last_event_id else {}
+        last_id, frames = None, 0
+        async with self.client.stream("POST", f"{self.base_url}/api/v1/chat/ask", headers=headers,
+                                      json={"question": question, "session_id": session_id}) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if line.startswith("id: "):
+                    last_id = line[4:]
+                elif line.startswith("data: "):
+                    frames += 1
+                    if line == "data: [DONE]":
+                        break
+                    if stop_after is not None and frames >= stop_after:
+                        break # Leaving the block closes the connection mid-stream
+                    if delay:
+                        await asyncio.sleep(delay)
+        return last_id
+
+
+async def sample(client: httpx.AsyncClient, base_url: str, token: str, started: float) -> dict:
+    resp = await client.get(f"{base_url}/api/v1/admin/runtime", headers={"X-Admin-Token": token})
+    resp.raise_for_status()
+    data = resp.json()
+    return {
+        "t": round(time.monotonic() - started, 1),
+        "rss_mb": round(data["rss_bytes"] / 1024 / 1024, 1),
+        "threads": data["threads"],
+        "tasks": data["tasks"],
+        "db_checked_out": sum(data["db_checked_out"].values()),
+        "open_fds": data["open_fds"],
+        "streams_active": data["streams_active"],
+        "pending_writes": data["pending_writes"],
+        "stream_buffers": data["stream_buffers"],
+        "threads_by_name": data["threads_by_name"],
+        "tasks_by_coro": data["tasks_by_coro"],
+    }
+
+
+def rising_floor(values, windows: int, tolerance) -> dict:
+    """
+    Split `values` into `windows` slices and take each slice's minimum; a leak
+    shows as a floor that never goes down and rises by more than the tolerance.
+    """
+    size = len(values) // windows
+    if size < 1:
+        return {"leak": False, "floors": [], "note": "not enough samples"}
+    floors = [min(values[i * size:(i + 1) * size]) for i in range(windows)]
+    absolute, relative = tolerance
+    growth = floors[-1] - floors[0]
+    monotonic = all(b >= a for a, b in zip(floors, floors[1:]))
+    return {"leak": monotonic and growth > max(absolute, relative * floors[0]), "floors": floors, "growth": round(growth, 1)}
+
+
+async def quiesce(client, base_url: str, token: str, started: float, timeout: float) -> dict:
+    """
+    Wait (bounded) for streams, writes and replay buffers to drain after traffic stops.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        snap = await sample(client, base_url, token, started)
+        drained = not (snap["streams_active"] or snap["pending_writes"] or snap["stream_buffers"] or snap["db_checked_out"])
+        if drained or time.monotonic() > deadline:
+            return snap
+        await asyncio.sleep(1)
+
+
+def check_idle(idle: dict, baseline: dict) -> list:
+    problems = []
+    for key in ("streams_active", "pending_writes", "stream_buffers", "db_checked_out"):
+        if idle[key]:
+            problems.append(f"{key}={idle[key]} after traffic stopped")
+    for name in UPSTREAM_THREADS:
+        if idle["threads_by_name"].get(name):
+            problems.append(f"{idle['threads_by_name'][name]} '{name}' threads still alive")
+    for key, slack in (("threads", TOLERANCES["threads"][0]), ("tasks", TOLERANCES["tasks"][0])):
+        if idle[key] > baseline[key] + slack:
+            problems.append(f"{key}: {idle[key]} idle at the end vs {baseline[key]} after warm-up")
+    return problems
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=7200, help="Seconds of traffic")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--sample-seconds", type=float, default=30)
+    parser.add_argument("--warmup-seconds", type=float, default=300, help="Excluded from growth detection")
+    parser.add_argument("--windows", type=int, default=6)
+    parser.add_argument("--disconnect-rate", type=float, default=0.2)
+    parser.add_argument("--slow-client-rate", type=float, default=0.1)
+    parser.add_argument("--json-rate", type=float, default=0.1)
+    parser.add_argument("--history-rate", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.03, help="Upstream fails before the first chunk")
+    parser.add_argument("--midstream-error-rate", type=float, default=0.03, help="Upstream stream breaks mid-answer")
+    parser.add_argument("--slow-upstream-rate", type=float, default=0.05)
+    parser.add_argument("--port", type=int, default=8793)
+    parser.add_argument("--backend-dir", default=BACKEND_DIR)
+    parser.add_argument("--report", default="/tmp/lumi_soak.jsonl")
+    args = parser.parse_args()
+
+    db_path = "/tmp/lumi_soak.db"
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    token = secrets.token_hex(16)
+    proc = start_server(args, db_path, token)
+    base_url = f"http://127.0.0.1:{args.port}"
+    samples, problems = [], []
+    limits = httpx.Limits(max_connections=args.concurrency + 5, max_keepalive_connections=args.concurrency + 5)
+    try:
+        if not wait_ready(base_url):
+            raise SystemExit("Server did not become ready")
+        async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+            started = time.monotonic()
+            traffic = Traffic(client, base_url, args)
+            runner = asyncio.create_task(traffic.run())
+
+            # Warm-up, then the idle level everything has to return to at the end
+            await asyncio.sleep(args.warmup_seconds)
+            traffic.stop.set()
+            await runner
+            baseline = await quiesce(client, base_url, token, started, REPLAY_TTL_SECONDS * 3)
+            print(f"idle after warm-up: threads={baseline['threads']} tasks={baseline['tasks']} rss={baseline['rss_mb']}MB", flush=True)
+
+            traffic.stop = asyncio.Event()
+            runner = asyncio.create_task(traffic.run())
+            with open(args.report, "w") as report:
+                deadline = time.monotonic() + args.duration
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(args.sample_seconds)
+                    snap = await sample(client, base_url, token, started)
+                    samples.append(snap)
+                    report.write(json.dumps(snap) + "\n")
+                    report.flush()
+                    print(f"t={snap['t']:.0f}s rss={snap['rss_mb']}MB threads={snap['threads']} tasks={snap['tasks']} "
+                          f"db={snap['db_checked_out']} fds={snap['open_fds']} streams={snap['streams_active']} "
+                          f"buffers={snap['stream_buffers']} {traffic.counts}", flush=True)
+            traffic.stop.set()
+            await runner
+            idle = await quiesce(client, base_url, token, started, REPLAY_TTL_SECONDS * 3)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=60)
+
+    growth = {key: rising_floor([s[key] for s in samples], args.windows, tol) for key, tol in TOLERANCES.items()}
+    problems += [f"{key} keeps growing: floors {result['floors']}" for key, result in growth.items() if result["leak"]]
+    problems += check_idle(idle, baseline)
+    print(json.dumps({
+        "duration_s": args.duration,
+        "requests": traffic.counts,
+        "samples": len(samples),
+        "growth": growth,
+        "idle_after_warmup": {k: baseline[k] for k in ("threads", "tasks", "rss_mb", "open_fds")},
+        "idle_at_end": {k: idle[k] for k in ("threads", "tasks", "rss_mb", "open_fds", "threads_by_name", "tasks_by_coro")},
+        "problems": problems,
+        "result": "FAIL" if problems else "PASS",
+    }, indent=2, ensure_ascii=False))
+    if problems:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
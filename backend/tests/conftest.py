@@ -0,0 +1,31 @@
+import os
+import sys
+
+# Settings are read at import: point the app at the mock upstream and a throwaway database first
+os.environ.setdefault("BAILIAN_MOCK", "true")
+os.environ.setdefault("MOCK_TTFT_MS", "5")
+os.environ.setdefault("MOCK_CHUNK_INTERVAL_MS", "0")
+os.environ.setdefault("SQLALCHEMY_DATABASE_URI", f"sqlite+aiosqlite:////tmp/lumi_tests_{os.getpid()}.db")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio" # The app is asyncio only
+
+
+@pytest.fixture(autouse=True)
+def undrained():
+    """
+    Leaving a TestClient runs the shutdown hook, which puts the process-wide
+    StreamTracker in drain mode; start every test with a fresh one.
+    """
+    from app.core import lifecycle
+    from app.core.lifecycle import StreamTracker
+
+    tracker = StreamTracker()
+    for name in ("draining", "active", "pending_writes", "drained", "aborted", "_idle", "_drain_task"):
+        setattr(lifecycle.streams, name, getattr(tracker, name))
@@ -0,0 +1,51 @@
+import random
+
+from app.core.automaton import Automaton
+
+PATTERNS = ["he", "she", "his", "hers", "敏感", "敏感词", "感词汇", "a", "aa"]
+
+
+def brute_force(text: str, patterns: list) -> list:
+    return sorted(
+        (i + len(p), index)
+        for index, p in enumerate(patterns) if p
+        for i in range(len(text) - len(p) + 1)
+        if text.startswith(p, i)
+    )
+
+
+def test_finds_every_overlapping_match():
+    automaton = Automaton(PATTERNS)
+    for text in ["ushers", "hishers", "这是敏感词汇", "aaaa", "", "nothing here"]:
+        matches, _ = automaton.scan(text)
+        assert sorted(matches) == brute_force(text, PATTERNS), text
+
+
+def test_matches_across_seams_like_one_pass():
+    automaton = Automaton(PATTERNS)
+    rng = random.Random(7)
+    alphabet = "hesira敏感词汇 "
+    for _ in range(300):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, rng.randint(0, 6))))
+        state, matches = 0, []
+        for start, end in zip([0] + cuts, cuts + [len(text)]):
+            found, state = automaton.scan(text[start:end], state)
+            matches += [(e + start, index) for e, index in found]
+        assert sorted(matches) == brute_force(text, PATTERNS)
+
+
+def test_depth_is_the_pattern_prefix_in_progress():
+    automaton = Automaton(["secret", "cretin"])
+    assert automaton.longest == 6
+    _, state = automaton.scan("a sec")
+    assert automaton.depth(state) == 3 # "sec"
+    _, state = automaton.scan("xyz", state)
+    assert automaton.depth(state) == 0
+
+
+def test_empty_patterns_are_ignored():
+    automaton = Automaton(["", "ab"])
+    assert len(automaton) == 2
+    assert automaton.scan("xab")[0] == [(3, 1)]
+    assert Automaton([]).scan("anything") == ([], 0)
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+import requests
+
+from app.core.config import settings
+from app.services import upstream
+from app.services.bailian_service import BailianService
+
+
+class RecordingSession(requests.Session):
+    """
+    Stands in for the pooled session: records what requests would have been
+    asked to send, then fails the way an unreachable host does.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.posts = []
+
+    def post(self, url, **kwargs):
+        self.posts.append(kwargs)
+        raise requests.exceptions.ConnectTimeout("connect timed out")
+
+
+@pytest.fixture
+def real_sdk(monkeypatch):
+    # The real SDK request path, with the network replaced by RecordingSession
+    import dashscope
+    monkeypatch.setattr(dashscope, "api_key", "sk-test")
+    monkeypatch.setattr(settings, "BAILIAN_APP_ID", "app-test")
+    monkeypatch.setattr(upstream, "_dashscope", dashscope)
+    monkeypatch.setattr(settings, "UPSTREAM_RETRIES", 0)
+    monkeypatch.setattr(settings, "HEDGE_ENABLED", False)
+
+
+@pytest.mark.anyio
+async def test_timeouts_reach_requests_not_the_body(real_sdk):
+    session = RecordingSession()
+    events = [event async for event in BailianService.stream_events("hello", paced=False, http_session=session)]
+
+    assert session.posts, "the SDK never posted"
+    post = session.posts[0]
+    assert post["timeout"] == (settings.UPSTREAM_CONNECT_TIMEOUT,
+                               max(settings.UPSTREAM_FIRST_CHUNK_TIMEOUT, settings.UPSTREAM_STALL_TIMEOUT))
+    body = json.loads(post["data"])
+    assert "timeout" not in body.get("parameters", {})
+    assert "request_timeout" not in body.get("parameters", {})
+    # A socket-level connect timeout is reported as such
+    assert events[-1].get("timeout") == "connect"
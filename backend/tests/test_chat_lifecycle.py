@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.lifecycle import streams
+from app.main import app
+from app.services.chat_service import ChatService
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+def test_ask_batch_refuses_a_body_over_the_cap(client, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_MAX_BODY_BYTES", 100)
+    line = b'{"question": "hello there"}\n'
+
+    response = client.post("/api/v1/chat/ask_batch", content=line * 10)
+    assert response.status_code == 413
+
+    # Chunked, no Content-Length: refused while reading
+    def chunks():
+        for _ in range(10):
+            yield line
+    response = client.post("/api/v1/chat/ask_batch", content=chunks())
+    assert response.status_code == 413
+
+    response = client.post("/api/v1/chat/ask_batch?persist=false", content=line)
+    assert response.status_code == 200
+    assert '"summary"' in response.text.splitlines()[-1]
+
+
+@pytest.mark.anyio
+async def test_json_answers_are_registered_and_cut_short_by_the_drain(monkeypatch):
+    started = asyncio.Event()
+
+    async def slow_events(question, session_id, paced, stop=None):
+        yield {"text": "partial ", "is_finish": False, "request_id": "r1"}
+        started.set()
+        await asyncio.sleep(30) # Stuck on upstream
+
+    monkeypatch.setattr(ChatService, "_events", staticmethod(slow_events))
+    task = asyncio.create_task(ChatService.answer("q"))
+    await started.wait()
+    assert len(streams.active) == 1
+    handle = next(iter(streams.active.values()))
+    assert handle.task is task
+
+    # What the drain deadline does to a stream that never reaches its next frame
+    handle.aborted = True
+    task.cancel()
+    result = await task
+    assert result["answer"] == "partial "
+    assert "restarting" in result["error"]
+    assert streams.active == {}
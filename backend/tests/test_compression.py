@@ -0,0 +1,96 @@
+import zlib
+
+import brotli
+import pytest
+
+from app.core import compression
+from app.core.compression import StreamCompressor, compress_stream, negotiate
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("gzip, deflate, br", "br"),
+    ("GZIP;q=0.5, BR", "br"),
+    ("br;q=0, gzip", "gzip"),
+    ("br; q=0.0, gzip;q=0", None),
+    ("br;q=0.1", "br"),
+    ("*", None), # Only explicit codings are negotiated
+])
+def test_negotiate(header, expected):
+    assert negotiate(header) == expected
+
+
+def test_negotiate_falls_back_to_gzip_without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "get_brotli", lambda: None)
+    assert negotiate("br, gzip") == "gzip"
+    assert negotiate("br") is None
+
+
+def frames(count: int) -> list:
+    return [f'id: s:{i}\ndata: {{"text":"第{i}段","sources":[{{"title":"知识库文档","url":"#"}}]}}\n\n' for i in range(count)]
+
+
+def test_gzip_stream_frames_decode_as_soon_as_they_arrive():
+    compressor = StreamCompressor("gzip")
+    decoder = zlib.decompressobj(31)
+    for frame in frames(20):
+        assert decoder.decompress(compressor.compress(frame.encode())) == frame.encode()
+    assert decoder.decompress(compressor.finish()) == b""
+    assert decoder.eof
+
+
+def test_brotli_stream_frames_decode_as_soon_as_they_arrive():
+    compressor = StreamCompressor("br")
+    decoder = brotli.Decompressor()
+    for frame in frames(20):
+        assert decoder.process(compressor.compress(frame.encode())) == frame.encode()
+    decoder.process(compressor.finish())
+    assert decoder.is_finished()
+
+
+@pytest.mark.anyio
+async def test_compress_stream_shares_one_context_across_frames():
+    async def source():
+        for frame in frames(50):
+            yield frame
+
+    chunks = [chunk async for chunk in compress_stream(source(), "gzip")]
+    raw = "".join(frames(50)).encode()
+    assert zlib.decompress(b"".join(chunks), 31) == raw
+    # Later frames back-reference earlier ones: much smaller than compressing frames one by one
+    assert len(b"".join(chunks)) < sum(len(zlib.compress(f.encode())) for f in frames(50)) / 2
+
+
+def test_middleware_compresses_large_complete_responses_only():
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse, StreamingResponse
+    from starlette.routing import Route
+    from starlette.testclient import TestClient
+
+    from app.core.compression import CompressionMiddleware
+
+    async def streamed():
+        yield "x" * 4096
+
+    app = Starlette(routes=[
+        Route("/api/big", lambda request: PlainTextResponse("a" * 4096)),
+        Route("/api/small", lambda request: PlainTextResponse("a" * 10)),
+        Route("/api/stream", lambda request: StreamingResponse(streamed())),
+        Route("/other", lambda request: PlainTextResponse("a" * 4096)),
+    ])
+    app.add_middleware(CompressionMiddleware, paths=["/api"], minimum_size=1024)
+    client = TestClient(app)
+    headers = {"Accept-Encoding": "gzip"}
+
+    big = client.get("/api/big", headers=headers)
+    assert big.headers["content-encoding"] == "gzip"
+    assert big.headers["vary"] == "Accept-Encoding"
+    assert big.text == "a" * 4096 # httpx decodes it
+    assert int(big.headers["content-length"]) < 100
+    assert "content-encoding" not in client.get("/api/small", headers=headers).headers
+    assert "content-encoding" not in client.get("/api/stream", headers=headers).headers
+    assert "content-encoding" not in client.get("/other", headers=headers).headers
+    assert "content-encoding" not in client.get("/api/big", headers={"Accept-Encoding": "identity"}).headers
@@ -0,0 +1,49 @@
+import os
+
+import pytest
+from sqlalchemy import text
+
+from app.core.metrics import metrics
+from app.db import session as db_session
+from app.db.session import _create_engine, warm_up_pool
+
+ROLE = (("role", "pooltest"),)
+
+
+def gauge(name: str) -> float:
+    return metrics.snapshot()["gauges"][name][ROLE]
+
+
+def waits() -> int:
+    return metrics.snapshot()["histograms"].get("db_pool_wait_seconds", {}).get(ROLE, {}).get("count", 0)
+
+
+@pytest.fixture
+async def engine(tmp_path):
+    engine = _create_engine(f"sqlite+aiosqlite:///{os.path.join(tmp_path, 'pool.db')}", "pooltest")
+    yield engine
+    await engine.dispose()
+
+
+@pytest.mark.anyio
+async def test_pool_is_instrumented(engine):
+    before = waits()
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+        assert gauge("db_pool_checked_out") == 1
+    assert gauge("db_pool_checked_out") == 0
+    assert waits() == before + 1
+
+    await warm_up_pool(engine, 3)
+    assert engine.sync_engine.pool.checkedin() == 3
+    assert gauge("db_pool_overflow") == 0
+
+    # The label is carried by the pool class, so it survives dispose()/recreate()
+    await engine.dispose()
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+    assert engine.sync_engine.pool.role == "pooltest"
+
+
+def test_reads_fall_back_to_the_primary_without_a_replica():
+    assert db_session.read_engine is db_session.engine
@@ -0,0 +1,23 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import upstream
+
+
+def test_readyz_does_not_probe_upstream(monkeypatch):
+    with TestClient(app) as client:
+        for _ in range(50):
+            if client.get("/readyz").status_code == 200:
+                break
+            time.sleep(0.05)
+        calls = []
+        monkeypatch.setattr(upstream, "get_http_session", lambda: calls.append(1))
+        monkeypatch.setattr(upstream, "new_http_session", lambda: calls.append(1))
+
+        response = client.get("/readyz")
+        assert response.status_code == 200
+        assert response.json()["checks"] == {"db": True, "upstream": "closed"}
+        assert client.get("/healthz").json() == {"status": "ok", "upstream": "closed"}
+        assert calls == []
@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.chat_service import ChatService
+from app.services.history_cache import etag_matches
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ("", False),
+    ("*", True),
+    ('W/"h1-5"', True),
+    ('"h1-5"', True), # Weak comparison ignores W/
+    ('"other", W/"h1-5"', True),
+    ('"h1-6"', False),
+    ('W/"h1-5-extra"', False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, 'W/"h1-5"') is expected
+
+
+def test_history_revalidates_with_304_until_a_write():
+    with TestClient(app) as client:
+        first = client.get("/api/v1/chat/history?limit=5")
+        assert first.status_code == 200
+        etag = first.headers["etag"]
+        assert first.headers["cache-control"] == "no-cache"
+
+        again = client.get("/api/v1/chat/history?limit=5", headers={"If-None-Match": etag})
+        assert again.status_code == 304
+        assert again.content == b""
+        assert again.headers["etag"] == etag
+
+
+        client.portal.call(ChatService.save_chat_log, "r-etag", "s1", "question", "answer", {})
+        changed = client.get("/api/v1/chat/history?limit=5", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["etag"] != etag
+        assert changed.json()[0]["user_query"] == "question"
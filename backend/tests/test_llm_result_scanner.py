@@ -0,0 +1,53 @@
+import json
+import random
+
+import pytest
+
+from app.services.bailian_service import LlmResultScanner
+
+SAMPLES = [
+    "路觅科技 😀 智能客服",
+    "😀😃🎉",
+    "a\\ud83d\\ude00b", # Literal backslashes, not escapes
+    'quote " backslash \\ tab \t newline \n',
+    "emoji at the end 👍",
+    "👍 at the start, then 中文 and \\ and 🧑‍💻 (ZWJ sequence)",
+]
+
+
+def payload(answer: str) -> str:
+    # As the workflow sends it: ASCII escapes, so emoji become \uXXXX surrogate pairs
+    return json.dumps({"output": {"workflow_message": {"llm_result": answer, "rag": []}}})
+
+
+def decode(pieces) -> list:
+    scanner, text, deltas = LlmResultScanner(), "", []
+    for piece in pieces:
+        text += piece
+        delta = scanner.scan(text)
+        if delta:
+            deltas.append(delta)
+    return deltas
+
+
+def assert_decodes(answer: str, pieces):
+    deltas = decode(pieces)
+    assert "".join(deltas) == answer
+    # save_chat_log could not encode a lone surrogate
+    assert not [d for d in deltas if any(0xD800 <= ord(ch) <= 0xDFFF for ch in d)]
+
+
+@pytest.mark.parametrize("answer", SAMPLES)
+def test_every_single_cut(answer):
+    text = payload(answer)
+    for cut in range(len(text) + 1):
+        assert_decodes(answer, [text[:cut], text[cut:]])
+
+
+@pytest.mark.parametrize("answer", SAMPLES)
+def test_random_multi_cuts(answer):
+    rng = random.Random(43)
+    text = payload(answer)
+    for _ in range(500):
+        cuts = sorted(rng.sample(range(1, len(text)), rng.randint(1, min(12, len(text) - 1))))
+        assert_decodes(answer, [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])])
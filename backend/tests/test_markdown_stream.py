@@ -0,0 +1,84 @@
+import random
+
+from app.services.markdown_stream import MarkdownBlockStream, _renderer, annotate
+
+DOC = """# 退货流程 😀
+
+请按以下步骤操作：
+第二行同一段落
+
+1. 登录账户
+2. 打开订单
+
+   订单详情里有“申请退货”
+3. 提交申请
+
+- 另一种列表
+- 第二项
+
+| 字段 | 说明 |
+| --- | --- |
+| a | b |
+
+```python
+def f():
+
+    return "```"
+```
+最后一段，没有换行结尾"""
+
+
+def utf16(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def run(pieces) -> tuple:
+    stream = MarkdownBlockStream()
+    blocks, offsets = [], []
+    for piece in pieces:
+        blocks += stream.feed(piece)
+        offsets.append(stream.offset)
+    blocks += stream.flush()
+    return blocks, offsets, stream.offset
+
+
+def test_blocks_do_not_depend_on_chunking_and_match_the_full_render():
+    whole, _, _ = run([DOC])
+    assert "".join(whole) == _renderer().render(DOC)
+    assert len(whole) == 7 # heading, paragraph, ordered list, bullet list, table, fence, last paragraph
+
+    rng = random.Random(33)
+    for _ in range(200):
+        cuts = sorted(rng.sample(range(1, len(DOC)), rng.randint(1, 30)))
+        pieces = [DOC[a:b] for a, b in zip([0] + cuts, cuts + [len(DOC)])]
+        blocks, offsets, final = run(pieces)
+        assert blocks == whole
+        assert offsets == sorted(offsets) # Only moves forward
+        assert final == utf16(DOC)
+
+
+def test_offset_counts_utf16_code_units_of_emitted_blocks():
+    stream = MarkdownBlockStream()
+    assert stream.feed("😀 表情\n") == []
+    assert stream.offset == 0 # Paragraph still open
+    blocks = stream.feed("\n")
+    assert blocks == ["<p>😀 表情</p>\n"]
+    assert stream.offset == utf16("😀 表情\n\n") == 7
+
+
+def test_partial_lines_and_open_fences_are_held_back():
+    stream = MarkdownBlockStream()
+    assert stream.feed("## Head") == [] # No newline yet
+    assert stream.feed("ing\n") == ["<h2>Heading</h2>\n"]
+    assert stream.feed("```\ncode\n\nmore\n") == [] # Blank line inside a fence doesn't close it
+    assert stream.feed("```\n") == ["<pre><code>code\n\nmore\n</code></pre>\n"]
+
+
+def test_annotate_adds_blocks_and_flushes_on_finish():
+    stream = MarkdownBlockStream()
+    event = annotate({"text": "第一段\n\n第二", "is_finish": False}, stream)
+    assert event["html_blocks"] == ["<p>第一段</p>\n"] and event["md_offset"] == 5
+    event = annotate({"text": "段", "is_finish": True}, stream)
+    assert event["html_blocks"] == ["<p>第二段</p>\n"] and event["md_offset"] == 8
+    event = annotate({"text": "", "is_finish": False, "sources": []}, MarkdownBlockStream())
+    assert "html_blocks" not in event and event["md_offset"] == 0
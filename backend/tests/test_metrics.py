@@ -0,0 +1,60 @@
+import os
+
+from app.core import metrics as metrics_module
+from app.core.metrics import DEAD_FILE, MetricsRegistry, aggregate, mark_process_dead, write_snapshot
+
+
+def registry(requests: float, in_flight: float, latency: float) -> dict:
+    registry = MetricsRegistry()
+    registry.inc("requests_total", requests, route="/ask")
+    registry.set_gauge("in_flight", in_flight)
+    registry.observe("latency_seconds", latency)
+    return registry.snapshot()
+
+
+def totals(snapshot: dict):
+    counter = snapshot["counters"]["requests_total"][(("route", "/ask"),)]
+    gauge = snapshot["gauges"].get("in_flight", {}).get((), 0)
+    histogram = snapshot["histograms"]["latency_seconds"][()]["count"]
+    return counter, gauge, histogram
+
+
+def test_dead_workers_are_folded_into_one_file(tmp_path):
+    directory = str(tmp_path)
+    for pid in (101, 102, 103):
+        write_snapshot(directory, pid, registry(10, 1, 0.2))
+
+    mark_process_dead(directory, 101)
+    mark_process_dead(directory, 102)
+    mark_process_dead(directory, 999) # Never wrote a snapshot
+
+    assert sorted(os.listdir(directory)) == ["103.json", DEAD_FILE]
+    own = registry(5, 2, 0.1)
+    # Counters and histograms of dead workers stay, their gauges don't
+    assert totals(aggregate(directory, 104, own)) == (35, 3, 4)
+
+
+def test_worker_folded_during_a_scrape_is_not_counted_twice(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    write_snapshot(directory, 101, registry(10, 1, 0.2))
+    read_json = metrics_module._read_json
+    folded = []
+
+    def folding_after_the_worker_files(path):
+        # The master folds 101 after the scrape read 101.json but before it reads dead.json
+        if path.endswith(DEAD_FILE) and not folded:
+            folded.append(True)
+            mark_process_dead(directory, 101)
+        return read_json(path)
+
+    monkeypatch.setattr(metrics_module, "_read_json", folding_after_the_worker_files)
+    assert totals(aggregate(directory, 104, registry(0, 0, 0.1)))[0] == 10
+
+
+def test_restarted_pid_is_not_mistaken_for_the_folded_worker(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    write_snapshot(directory, 101, registry(10, 1, 0.2))
+    mark_process_dead(directory, 101)
+    monkeypatch.setattr(metrics_module, "_PROCESS_STARTED", 12345.0) # A new worker got pid 101
+    write_snapshot(directory, 101, registry(7, 1, 0.2))
+    assert totals(aggregate(directory, 104, registry(0, 0, 0.1)))[:2] == (17, 1)
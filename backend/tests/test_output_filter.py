@@ -0,0 +1,78 @@
+import random
+
+from app.core.automaton import Automaton
+from app.services.output_filter import FilterStream, OutputFilter
+
+TERMS = ["secret", "机密文件", "内部", "abc", "bcd"]
+
+
+def masked_whole(text: str, terms: list, mask: str = "*") -> str:
+    """
+    Reference: every (overlapping, case-insensitive) occurrence masked in the complete text.
+    """
+    folded = text.lower()
+    hidden = [False] * len(text)
+    for term in terms:
+        for i in range(len(text) - len(term) + 1):
+            if folded.startswith(term, i):
+                hidden[i:i + len(term)] = [True] * len(term)
+    return "".join(mask if h else ch for ch, h in zip(text, hidden))
+
+
+def make_stream() -> FilterStream:
+    return FilterStream(Automaton(TERMS), "*")
+
+
+def random_text(rng: random.Random) -> str:
+    pieces = TERMS + ["SeCrEt", "x", " ", "机密", "文件", "内", "ab", "cd", "hello "]
+    return "".join(rng.choice(pieces) for _ in range(rng.randint(0, 25)))
+
+
+def test_masks_terms_split_across_chunks_like_the_whole_text():
+    rng = random.Random(48)
+    for _ in range(500):
+        text = random_text(rng)
+        cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, rng.randint(0, 10))))
+        stream = make_stream()
+        out = "".join(stream.feed(text[a:b]) for a, b in zip([0] + cuts, cuts + [len(text)]))
+        out += stream.flush()
+        assert out == masked_whole(text, TERMS), text
+
+
+def test_held_back_text_never_exceeds_longest_term_minus_one():
+    rng = random.Random(7)
+    longest = max(map(len, TERMS))
+    for _ in range(200):
+        text = random_text(rng)
+        stream = make_stream()
+        released = 0
+        for ch in text: # Worst case: one character per chunk
+            released += len(stream.feed(ch))
+            assert len(stream.pending) <= longest - 1
+        assert released + len(stream.flush()) == len(text)
+
+
+def test_text_without_a_term_prefix_is_released_at_once():
+    stream = make_stream()
+    assert stream.feed("hello world ") == "hello world "
+    assert stream.feed("the sec") == "the "
+    assert stream.feed("ret is out") == "****** is out"
+
+
+def test_apply_flushes_on_the_last_event():
+    stream = make_stream()
+    assert stream.apply({"text": "top sec", "is_finish": False})["text"] == "top "
+    assert stream.apply({"text": "", "is_finish": True})["text"] == "sec"
+    stream = make_stream()
+    stream.apply({"text": "内", "is_finish": False})
+    assert stream.apply({"error": "upstream failed"})["text"] == "内"
+    assert stream.apply({"is_finish": False, "sources": []}) == {"is_finish": False, "sources": []}
+
+
+def test_terms_file_is_loaded_case_insensitively(tmp_path):
+    path = tmp_path / "terms.txt"
+    path.write_text("# comment\nSecret\n\n机密\n", encoding="utf-8")
+    output_filter = OutputFilter(str(path))
+    stream = output_filter.stream()
+    assert stream.feed("a SECRET and 机密.") + stream.flush() == "a ****** and **."
+    assert OutputFilter(str(tmp_path / "missing.txt")).stream() is None
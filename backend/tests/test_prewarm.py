@@ -0,0 +1,79 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.core.config import settings
+from app.services import prewarm as prewarm_module
+from app.services.prewarm import PrewarmPool
+
+
+class FakeSession:
+    def __init__(self):
+        self.closed = False
+        self.closed_while_in_use = False
+        self.in_use = False
+
+    def close(self):
+        self.closed = True
+        self.closed_while_in_use = self.in_use
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    release = threading.Event()
+
+    def open_connection(session):
+        session.in_use = True # Blocked in session.head
+        release.wait(5)
+        session.in_use = False
+        return True
+
+    async def warm_up_pool(engine, n):
+        return None
+
+    monkeypatch.setattr(prewarm_module.upstream, "new_http_session", FakeSession)
+    monkeypatch.setattr(prewarm_module.upstream, "open_connection", open_connection)
+    monkeypatch.setattr(prewarm_module, "warm_up_pool", warm_up_pool)
+    monkeypatch.setattr(settings, "PREWARM_SLOTS_PER_CLIENT_MINUTE", 100)
+    pool = PrewarmPool()
+    pool.release = release
+    yield pool
+    release.set()
+
+
+@pytest.mark.anyio
+async def test_discard_during_handshake_leaves_closing_to_the_warm_up(pool):
+    slot = pool.prepare("s1", "client")
+    await asyncio.sleep(0.05)
+    assert slot.http_session.in_use
+
+    assert pool.take("s1") is None # Not ready yet: discarded
+    assert not slot.http_session.closed
+
+    pool.release.set()
+    await slot.task
+    assert slot.http_session.closed
+    assert not slot.http_session.closed_while_in_use
+
+
+@pytest.mark.anyio
+async def test_ready_slot_is_handed_over_and_counts_as_a_hit(pool):
+    pool.release.set()
+    slot = pool.prepare("s1", "client")
+    await slot.task
+
+    assert pool.take("s1") is slot.http_session
+    assert not slot.http_session.closed # The caller closes it
+    assert pool.take("s2") is None # Prepared elsewhere / never prepared
+    assert pool._hits == 1 and pool._lookups == 2
+
+
+@pytest.mark.anyio
+async def test_expired_ready_slot_is_closed_right_away(pool, monkeypatch):
+    pool.release.set()
+    monkeypatch.setattr(settings, "PREWARM_TTL_SECONDS", -1)
+    slot = pool.prepare("s1", "client")
+    await slot.task
+    pool.take(None) # Any call evicts expired slots
+    assert slot.http_session.closed
@@ -0,0 +1,175 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from app.core.config import settings
+from app.services import resilience
+from app.services.resilience import CircuitBreaker, HedgePolicy, UpstreamCall
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # /hang: headers, then nothing for a long time; /fast: a few lines right away; /fail: 500
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path == "/fail":
+            self.send_response(500)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.end_headers()
+        self.wfile.flush()
+        if self.path == "/hang":
+            time.sleep(20)
+            return
+        for i in range(3):
+            self.wfile.write(f"chunk {i}\n".encode())
+            self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(resilience, "breaker", CircuitBreaker(failure_threshold=2, cooldown=0.2))
+    monkeypatch.setattr(resilience, "hedge_policy", HedgePolicy())
+    monkeypatch.setattr(settings, "UPSTREAM_RETRIES", 0)
+    monkeypatch.setattr(settings, "HEDGE_ENABLED", False)
+
+
+def http_call(base: str, paths: list):
+    """
+    call(session) for UpstreamCall: attempt i posts to paths[i] with the
+    attempt's session and yields one response per line.
+    """
+    calls = iter(paths)
+
+    def call(session):
+        path = next(calls)
+        response = session.post(base + path, stream=True, timeout=(1, 30))
+        if response.status_code != 200:
+            raise requests.HTTPError(f"HTTP {response.status_code}")
+        for line in response.iter_lines():
+            if line:
+                yield SimpleNamespace(status_code=200, text=line.decode())
+
+    return call
+
+
+def run(upstream_call: UpstreamCall) -> threading.Thread:
+    thread = threading.Thread(target=upstream_call.run, daemon=True)
+    thread.start()
+    return thread
+
+
+def enable_hedging(monkeypatch, delay_ms: int):
+    monkeypatch.setattr(settings, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "HEDGE_MAX_DELAY_MS", delay_ms) # Used until enough TTFT samples exist
+
+
+def test_hedge_wins_and_loser_is_aborted_at_the_socket(server, monkeypatch):
+    enable_hedging(monkeypatch, 100)
+    emitted = []
+    with requests.Session() as session:
+        call = UpstreamCall(http_call(server, ["/hang", "/fast"]), emitted.append, session, session)
+        thread = run(call)
+        thread.join(5)
+
+        assert not thread.is_alive()
+        assert [r.text for r in emitted[:-1]] == ["chunk 0", "chunk 1", "chunk 2"]
+        assert emitted[-1] is None
+        # The primary was blocked on a silent socket; it must not wait for its 30s read timeout
+        deadline = time.monotonic() + 2
+        while call._attempts and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert call._attempts == {}
+    assert resilience.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_cancel_interrupts_a_blocked_read(server):
+    emitted = []
+    with requests.Session() as session:
+        call = UpstreamCall(http_call(server, ["/hang"]), emitted.append, session, session)
+        thread = run(call)
+        time.sleep(0.2)
+        started = time.monotonic()
+        call.cancel()
+        thread.join(5)
+        assert not thread.is_alive()
+        assert time.monotonic() - started < 2
+    assert emitted == [] # Nobody is listening anymore: no error, no completion
+    assert resilience.breaker._failures == 0
+
+
+def test_losing_attempt_failure_does_not_count_against_the_breaker(monkeypatch):
+    enable_hedging(monkeypatch, 50)
+    monkeypatch.setattr(settings, "HEDGE_BUDGET_RATIO", 1.0) # Hedge every call
+
+    def hedged_call():
+        hedge_won = threading.Event()
+        attempts = iter(["primary", "hedge"])
+
+        def call(session):
+            if next(attempts) == "primary":
+                hedge_won.wait(5) # Slow, then fails after the hedge already won
+                raise requests.ConnectionError("reset")
+            yield SimpleNamespace(status_code=200, text="hedged answer")
+            hedge_won.set()
+
+        return call
+
+    emitted = []
+    for _ in range(3): # More than the breaker's failure threshold
+        run(UpstreamCall(hedged_call(), emitted.append, object(), object())).join(5)
+        time.sleep(0.05) # Let the primary fail
+    assert [e.text for e in emitted if e is not None] == ["hedged answer"] * 3
+    assert resilience.breaker.state == CircuitBreaker.CLOSED
+    assert resilience.breaker._failures == 0
+
+
+def test_failed_round_counts_once_and_opens_the_breaker(server):
+    emitted = []
+    with requests.Session() as session:
+        for _ in range(2):
+            run(UpstreamCall(http_call(server, ["/fail"]), emitted.append, session, session)).join(5)
+    assert all(isinstance(e, requests.HTTPError) for e in emitted)
+    assert resilience.breaker.state == CircuitBreaker.OPEN
+
+    # Open: rejected without calling upstream
+    with requests.Session() as session:
+        run(UpstreamCall(http_call(server, []), emitted.append, session, session)).join(5)
+    assert isinstance(emitted[-1], resilience.CircuitOpenError)
+
+
+def test_breaker_half_open_probe():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.1)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.15)
+    assert breaker.allow() # The probe
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow() # Only one probe at a time
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.15)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
@@ -0,0 +1,60 @@
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.lifecycle import streams
+from app.main import app
+from app.services import retention_service
+from app.services.retention_service import RetentionService
+
+
+@pytest.mark.anyio
+async def test_job_cut_off_by_the_drain_is_published_as_interrupted(monkeypatch):
+    monkeypatch.setattr(settings, "DRAIN_TIMEOUT_SECONDS", 0)
+    monkeypatch.setattr(settings, "DRAIN_WRITE_TIMEOUT_SECONDS", 0.1)
+    published = []
+
+    class Session:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def execute(self, statement):
+            await asyncio.sleep(30) # A batch stuck on a lock
+
+    async def publish(job):
+        published.append(job.to_dict())
+
+    monkeypatch.setattr(retention_service, "AsyncSessionLocal", Session)
+    monkeypatch.setattr(retention_service.DeletionJob, "publish", publish)
+    job = RetentionService.start("before", {}, before=retention_service.datetime.now(retention_service.timezone.utc))
+    await asyncio.sleep(0.05)
+
+    await streams.shutdown()
+    assert job.task.cancelled()
+    assert published[-1]["status"] == "interrupted"
+    assert published[-1]["finished_at"] is not None
+
+
+def test_single_row_delete_forgets_its_faq_answer(monkeypatch):
+    forgotten = []
+    monkeypatch.setattr("app.api.routers.chat.forget_rows", lambda ids: forgotten.append(list(ids)) or 0)
+    with TestClient(app) as client:
+        client.post("/api/v1/chat/ask?stream=false", json={"question": "hello"})
+        for _ in range(50): # The save runs detached from the request
+            rows = json.loads(client.get("/api/v1/chat/history?limit=1").content)
+            if rows:
+                break
+            time.sleep(0.05)
+        log_id = rows[0]["id"]
+
+        assert client.delete(f"/api/v1/chat/history/{log_id}").status_code == 200
+        assert forgotten == [[log_id]]
+        assert client.delete(f"/api/v1/chat/history/{log_id}").status_code == 404
+        assert forgotten == [[log_id]]
@@ -0,0 +1,75 @@
+import pytest
+from sqlalchemy import delete, select, update
+
+from app.db.base_class import Base
+from app.db.session import AsyncSessionLocal, engine
+from app.models.chat_log import ChatLog
+from app.models.usage_rollup import RollupCheckpoint, UsageRollup
+from app.services.chat_service import ChatService
+from app.services.rollup_service import LIVE_CHECKPOINT, RollupService
+
+
+@pytest.fixture
+async def db():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        for table in (ChatLog, UsageRollup, RollupCheckpoint):
+            await conn.execute(delete(table))
+    yield
+    await engine.dispose()
+
+
+async def tenant_turns():
+    async with AsyncSessionLocal() as session:
+        rows = await session.scalars(select(UsageRollup).where(UsageRollup.dimension == "tenant", UsageRollup.grain == "hour"))
+        return sum(row.turns for row in rows)
+
+
+def turn(n):
+    return {"question": f"q{n}", "answer": "a", "session_id": "s1", "metadata_info": {"latency": 100, "usage": {"output_tokens": 3}}}
+
+
+@pytest.mark.anyio
+async def test_saves_leave_rollups_to_the_background_run(db):
+    await ChatService.save_chat_log("r-old", "s1", "before", "a", {}) # Before the checkpoint existed
+    await RollupService.ensure_checkpoint()
+    await RollupService.ensure_checkpoint() # Idempotent
+
+    await ChatService.save_chat_log("r1", "s1", "q", "a", {"latency": 100})
+    await ChatService.save_chat_logs([turn(2), turn(3)])
+    assert await tenant_turns() == 0 # Not in the insert transaction
+
+    assert await RollupService.roll_up_new(batch_size=2, lag_seconds=0) == 2
+    assert await RollupService.roll_up_new(batch_size=2, lag_seconds=0) == 1
+    assert await RollupService.roll_up_new(batch_size=2, lag_seconds=0) == 0
+    assert await tenant_turns() == 3 # The row saved before the checkpoint is left to the backfill
+
+
+@pytest.mark.anyio
+async def test_young_rows_wait_for_the_next_run(db):
+    await RollupService.ensure_checkpoint()
+    await ChatService.save_chat_logs([turn(1)])
+    assert await RollupService.roll_up_new(batch_size=10, lag_seconds=3600) == 0
+    assert await RollupService.roll_up_new(batch_size=10, lag_seconds=0) == 1
+
+
+@pytest.mark.anyio
+async def test_lost_checkpoint_race_rolls_back(db, monkeypatch):
+    await RollupService.ensure_checkpoint()
+    await ChatService.save_chat_logs([turn(1), turn(2)])
+    real_execute = AsyncSessionLocal.class_.execute
+    raced = []
+
+    async def execute(self, statement, *args, **kwargs):
+        # Another worker advances the checkpoint between our read and our claim
+        if not raced and getattr(statement, "is_update", False) and statement.table.name == "rollup_checkpoints":
+            raced.append(True)
+            async with AsyncSessionLocal() as other:
+                await other.execute(update(RollupCheckpoint).values(last_id=10**9))
+                await other.commit()
+        return await real_execute(self, statement, *args, **kwargs)
+
+    monkeypatch.setattr(AsyncSessionLocal.class_, "execute", execute)
+    assert await RollupService.roll_up_new(batch_size=10, lag_seconds=0) == 0
+    assert raced
+    assert await tenant_turns() == 0
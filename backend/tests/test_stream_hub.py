@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+import pytest
+
+from app.core.config import settings
+from app.services import stream_hub as stream_hub_module
+from app.services.stream_hub import ReplayBuffer, StreamHub
+
+
+class BrokenCache:
+    def __getattr__(self, name):
+        async def fail(*args, **kwargs):
+            raise ConnectionError("redis down")
+        return fail
+
+
+@pytest.mark.anyio
+async def test_finish_shared_survives_a_cache_outage(monkeypatch):
+    monkeypatch.setattr(settings, "REDIS_URL", "redis://unreachable")
+    monkeypatch.setattr(stream_hub_module, "get_cache", BrokenCache)
+    hub = StreamHub()
+    buffer = ReplayBuffer("s1")
+    await hub._emit(buffer, "frame") # _mirror already swallowed it
+    await hub._finish_shared(buffer)
+
+
+@pytest.mark.anyio
+async def test_size_cut_off_closes_upstream_and_keeps_the_held_back_tail(monkeypatch):
+    from app.core.automaton import Automaton
+    from app.services import chat_service
+    from app.services.chat_service import ChatService
+    from app.services.output_filter import FilterStream
+
+    monkeypatch.setattr(settings, "STREAM_MAX_BYTES", 200)
+    monkeypatch.setattr(settings, "OUTPUT_FILTER_ENABLED", True)
+    monkeypatch.setattr(chat_service.output_filter, "stream", lambda: FilterStream(Automaton(["secret"]), "*"))
+    upstream = {}
+
+    async def endless_answer(question, session_id, paced):
+        yield {"text": "", "is_finish": False, "request_id": "r1"}
+        try:
+            while True:
+                yield {"text": "a secret, then sec", "is_finish": False} # "sec" is held back each time
+        finally:
+            upstream["closed_after_frames"] = len(buffer.frames)
+
+    async def save_chat_log(**kwargs):
+        upstream["saved"] = kwargs["answer"]
+
+    monkeypatch.setattr(ChatService, "_answer_events", staticmethod(endless_answer))
+    monkeypatch.setattr(ChatService, "save_chat_log", staticmethod(save_chat_log))
+    hub = StreamHub()
+    buffer = hub.start("q", None)
+    await buffer.task
+    for _ in range(20):
+        await asyncio.sleep(0) # Let the detached save run
+
+    frames = [json.loads(f) for f in buffer.frames if f.startswith("{")]
+    truncation = next(i for i, f in enumerate(frames) if f.get("truncated"))
+    assert upstream["closed_after_frames"] <= truncation # Upstream closed before the truncation frame
+    assert frames[truncation - 1] == {"text": "sec", "is_finish": False} # The tail, released
+    assert upstream["saved"].endswith("a ******, then sec")
@@ -0,0 +1,71 @@
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.services.stream_hub import stream_hub
+
+
+def receive(ws) -> dict:
+    return json.loads(ws.receive_text())
+
+
+def drain(ws, request_id: str) -> list:
+    # Frames of request_id up to and including its done message
+    frames = []
+    while True:
+        message = receive(ws)
+        assert message["id"] == request_id, message
+        frames.append(message)
+        if message.get("done") or "error" in message and "seq" not in message:
+            return frames
+
+
+def test_turn_stalls_without_credit_until_granted():
+    with TestClient(app) as client, client.websocket_connect("/api/v1/chat/ws") as ws:
+        ws.send_text(json.dumps({"type": "ask", "id": "q1", "question": "hello", "credit": 2}))
+        first = [receive(ws), receive(ws)]
+        assert [m["seq"] for m in first] == [0, 1]
+        buffer = stream_hub.get(first[0]["stream_id"])
+
+        deadline = time.monotonic() + 5
+        while len(buffer.frames) <= 3 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert len(buffer.frames) > 3 # The producer keeps going into the ReplayBuffer
+        # Frames leave in outbox order: had q1 sent a third frame, it would come before this error
+        ws.send_text(json.dumps({"type": "nope", "id": "probe"}))
+        assert receive(ws)["id"] == "probe"
+
+        ws.send_text(json.dumps({"type": "credit", "id": "q1", "n": 100000}))
+        rest = drain(ws, "q1")
+        assert rest[0]["seq"] == 2
+        assert rest[-1]["done"] is True
+        assert [m["seq"] for m in rest] == list(range(2, 2 + len(rest)))
+
+
+def test_cancel_stops_the_turn(monkeypatch):
+    monkeypatch.setattr(settings, "MOCK_CHUNK_INTERVAL_MS", 50) # Long enough to cancel midway
+    with TestClient(app) as client, client.websocket_connect("/api/v1/chat/ws") as ws:
+        ws.send_text(json.dumps({"type": "ask", "id": "q1", "question": "hello"}))
+        first = receive(ws)
+        ws.send_text(json.dumps({"type": "cancel", "id": "q1"}))
+        frames = drain(ws, "q1")
+
+        assert frames[-1]["done"] is True
+        assert frames[-2]["data"] == {"error": "Cancelled", "cancelled": True}
+        assert stream_hub.get(first["stream_id"]).done
+
+        # The id is free again once the turn ended
+        ws.send_text(json.dumps({"type": "cancel", "id": "q1"}))
+        ws.send_text(json.dumps({"type": "ask", "id": "q1", "question": " "}))
+        assert receive(ws) == {"id": "q1", "error": "Question cannot be empty"}
+
+
+def test_bad_credit_is_refused():
+    with TestClient(app) as client, client.websocket_connect("/api/v1/chat/ws") as ws:
+        ws.send_text(json.dumps({"type": "ask", "id": "q1", "question": "hello", "credit": "10"}))
+        assert receive(ws) == {"id": "q1", "error": "credit must be an integer"}
+        ws.send_text("not json")
+        assert receive(ws) == {"id": None, "error": "Message is not valid JSON"}
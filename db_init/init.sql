@@ -13,3 +13,36 @@ CREATE TABLE IF NOT EXISTS chat_logs (
 CREATE INDEX IF NOT EXISTS ix_chat_logs_id ON chat_logs (id);
 CREATE UNIQUE INDEX IF NOT EXISTS ix_chat_logs_request_id ON chat_logs (request_id);
 CREATE INDEX IF NOT EXISTS ix_chat_logs_session_id ON chat_logs (session_id);
+-- Date-bounded bulk deletes / retention (app/services/retention_service.py).
+-- Existing databases get it at backend startup (CONCURRENTLY on PostgreSQL) or via scripts/retention.py --create-index
+CREATE INDEX IF NOT EXISTS ix_chat_logs_created_at ON chat_logs (created_at);
+
+-- Usage / latency rollups, maintained on every chat_logs insert (see app/services/rollup_service.py)
+CREATE TABLE IF NOT EXISTS usage_rollups (
+    id SERIAL PRIMARY KEY,
+    grain VARCHAR(8) NOT NULL,
+    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL,
+    dimension VARCHAR(16) NOT NULL,
+    dim_key VARCHAR NOT NULL,
+    turns BIGINT NOT NULL DEFAULT 0,
+    errors BIGINT NOT NULL DEFAULT 0,
+    input_tokens BIGINT NOT NULL DEFAULT 0,
+    output_tokens BIGINT NOT NULL DEFAULT 0,
+    latency_count BIGINT NOT NULL DEFAULT 0,
+    latency_sum_ms BIGINT NOT NULL DEFAULT 0,
+    lat_le_250 BIGINT NOT NULL DEFAULT 0,
+    lat_le_500 BIGINT NOT NULL DEFAULT 0,
+    lat_le_1000 BIGINT NOT NULL DEFAULT 0,
+    lat_le_2000 BIGINT NOT NULL DEFAULT 0,
+    lat_le_5000 BIGINT NOT NULL DEFAULT 0,
+    lat_le_10000 BIGINT NOT NULL DEFAULT 0,
+    lat_le_30000 BIGINT NOT NULL DEFAULT 0,
+    lat_gt_30000 BIGINT NOT NULL DEFAULT 0,
+    CONSTRAINT uq_usage_rollups_bucket UNIQUE (grain, dimension, dim_key, bucket_start)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_checkpoints (
+    name VARCHAR PRIMARY KEY,
+    last_id BIGINT NOT NULL DEFAULT 0,
+    until_id BIGINT NOT NULL
+);
@@ -0,0 +1,10 @@
+#!/bin/sh
+# Runs once on first start of the primary (docker-entrypoint-initdb.d).
+# Creates the streaming replication role and allows it in pg_hba.conf.
+set -e
+
+psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-EOSQL
+    CREATE ROLE ${REPLICATION_USER:-replicator} WITH REPLICATION LOGIN PASSWORD '${REPLICATION_PASSWORD:-replicator}';
+EOSQL
+
+echo "host replication ${REPLICATION_USER:-replicator} all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -31,6 +31,21 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    // Pre-warm the upstream connection while the user is typing (slot lives PREWARM_TTL_SECONDS)
+    let lastPrepare = 0;
+    function prepareSession() {
+        const now = Date.now();
+        if (now - lastPrepare < 10000) return;
+        lastPrepare = now;
+        fetch('http://localhost:8000/api/v1/chat/prepare', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'X-Session-Id': getSessionId() },
+            body: JSON.stringify({ session_id: getSessionId() })
+        }).catch(() => {}); // Best effort
+    }
+    userInput.addEventListener('focus', prepareSession);
+    userInput.addEventListener('input', prepareSession);
+
     // Navigation Logic
     toHistoryBtn.addEventListener('click', () => {
         viewChat.style.display = 'none';
@@ -258,6 +273,7 @@ document.addEventListener('DOMContentLoaded', () => {
     async function sendMessage() {
         const text = userInput.value.trim();
         if (!text) return;
+        lastPrepare = 0; // The slot is consumed by this question
 
         // Reset UI
         toggleInput(false);
@@ -271,72 +287,158 @@ document.addEventListener('DOMContentLoaded', () => {
         let finalUsage = null;
         let finalLatency = null;
 
-        try {
-            const response = await fetch('http://localhost:8000/api/v1/chat/ask', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ 
-                    question: text,
-                    session_id: getSessionId()
-                })
-            });
+        // Resume state: every frame carries "id: <streamId>:<seq>"
+        let lastEventId = null;
+        let streamId = null;
+        let finished = false;
+        let attempt = 0;
+
+        // Server-side Markdown (render_markdown): completed blocks arrive as HTML once,
+        // accumulatedText[mdOffset:] is the open tail that still needs marked.parse
+        let mdOffset = null;
+        let blocksDiv = null;
+        let tailDiv = null;
+        let renderMs = 0;
+
+        function renderAnswer() {
+            const t = performance.now();
+            if (mdOffset === null) {
+                textContainer.innerHTML = marked.parse(accumulatedText);
+            } else {
+                tailDiv.innerHTML = marked.parse(accumulatedText.slice(mdOffset));
+            }
+            renderMs += performance.now() - t;
+        }
+
+        function handleFrame(data) {
+            // Handle Error from Backend
+            if (data.error) {
+                accumulatedText += `<br><span style="color:red">⚠️ ${data.error}</span>`;
+            }
+            
+            // Handle Text
+            if (data.text) {
+                accumulatedText += data.text;
+            }
 
-            const reader = response.body.getReader();
-            const decoder = new TextDecoder();
+            // Handle pre-rendered blocks
+            if (data.md_offset !== undefined) {
+                if (mdOffset === null) {
+                    textContainer.innerHTML = '';
+                    blocksDiv = document.createElement('div');
+                    tailDiv = document.createElement('div');
+                    textContainer.append(blocksDiv, tailDiv);
+                }
+                if (data.html_blocks) {
+                    blocksDiv.insertAdjacentHTML('beforeend', data.html_blocks.join(''));
+                }
+                mdOffset = data.md_offset;
+            }
 
-            while (true) {
-                const { done, value } = await reader.read();
-                if (done) break;
+            if (data.error || data.text || data.html_blocks) {
+                renderAnswer();
+            }
 
-                const chunk = decoder.decode(value);
-                const lines = chunk.split('\n\n');
-                
-                for (const line of lines) {
-                    if (line.startsWith('data: ')) {
-                        const dataStr = line.slice(6);
-                        if (dataStr === '[DONE]') break;
-                        try {
-                            const data = JSON.parse(dataStr);
-
-                            // Handle Error from Backend
-                            if (data.error) {
-                                accumulatedText += `<br><span style="color:red">⚠️ ${data.error}</span>`;
-                                textContainer.innerHTML = marked.parse(accumulatedText);
-                            }
-                            
-                            // Handle Text
-                            if (data.text) {
-                                accumulatedText += data.text;
-                                textContainer.innerHTML = marked.parse(accumulatedText);
-                            }
-
-                            // Handle Sources
-                            if (data.sources && Array.isArray(data.sources)) {
-                                // Merge logic: append new distinct sources instead of overwriting
-                                data.sources.forEach(newSource => {
-                                    // Deduplicate based on URL and Title to avoid duplicates if backend sends overlapping chunks
-                                    const exists = accumulatedSources.some(s => 
-                                        (s.url === newSource.url && s.title === newSource.title)
-                                    );
-                                    if (!exists) {
-                                        accumulatedSources.push(newSource);
-                                    }
-                                });
-                                updateMeta(metaContainer, accumulatedSources, finalUsage, finalLatency);
-                            }
-
-                            // Handle Usage/Latency
-                            if (data.usage) finalUsage = data.usage;
-                            if (data.latency) finalLatency = data.latency;
-                            
-                            if (data.usage || data.latency) {
-                                updateMeta(metaContainer, accumulatedSources, finalUsage, finalLatency);
-                            }
-
-                        } catch (e) {
-                            console.error('Parse Error', e);
+            // Handle Sources
+            if (data.sources && Array.isArray(data.sources)) {
+                // Merge logic: append new distinct sources instead of overwriting
+                data.sources.forEach(newSource => {
+                    // Deduplicate based on URL and Title to avoid duplicates if backend sends overlapping chunks
+                    const exists = accumulatedSources.some(s => 
+                        (s.url === newSource.url && s.title === newSource.title)
+                    );
+                    if (!exists) {
+                        accumulatedSources.push(newSource);
+                    }
+                });
+                updateMeta(metaContainer, accumulatedSources, finalUsage, finalLatency);
+            }
+
+            // Handle Usage/Latency
+            if (data.usage) finalUsage = data.usage;
+            if (data.latency) finalLatency = data.latency;
+            
+            if (data.usage || data.latency) {
+                updateMeta(metaContainer, accumulatedSources, finalUsage, finalLatency);
+            }
+        }
+
+        function handleEvent(block) {
+            let id = null;
+            let dataStr = null;
+            for (const line of block.split('\n')) {
+                if (line.startsWith('id: ')) id = line.slice(4);
+                else if (line.startsWith('data: ')) dataStr = line.slice(6);
+            }
+            if (id) {
+                const frameStream = id.slice(0, id.lastIndexOf(':'));
+                if (streamId && frameStream !== streamId) {
+                    // Server could not resume (expired) and started over: reset the card
+                    accumulatedText = "";
+                    accumulatedSources = [];
+                    mdOffset = null;
+                }
+                streamId = frameStream;
+                lastEventId = id;
+                attempt = 0; // Progress made, reset the retry budget
+            }
+            if (dataStr === null) return;
+            if (dataStr === '[DONE]') {
+                finished = true;
+                console.debug(`Answer render time: ${renderMs.toFixed(1)}ms (${mdOffset === null ? 'client' : 'server'} markdown)`);
+                return;
+            }
+            try {
+                handleFrame(JSON.parse(dataStr));
+            } catch (e) {
+                console.error('Parse Error', e);
+            }
+        }
+
+        try {
+            // Reconnect with Last-Event-ID when the connection drops mid-answer (mobile networks)
+            while (!finished) {
+                const headers = { 'Content-Type': 'application/json', 'X-Session-Id': getSessionId() };
+                if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+
+                try {
+                    const response = await fetch('http://localhost:8000/api/v1/chat/ask', {
+                        method: 'POST',
+                        // X-Session-Id lets the load balancer keep a session on one node
+                        headers: headers,
+                        body: JSON.stringify({ 
+                            question: text,
+                            session_id: getSessionId(),
+                            render_markdown: true
+                        })
+                    });
+                    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+
+                    const reader = response.body.getReader();
+                    const decoder = new TextDecoder();
+                    let buffer = '';
+
+                    while (!finished) {
+                        const { done, value } = await reader.read();
+                        if (done) break;
+
+                        // Frames can be split across network chunks, only handle complete ones
+                        buffer += decoder.decode(value, { stream: true });
+                        const blocks = buffer.split('\n\n');
+                        buffer = blocks.pop();
+                        for (const block of blocks) {
+                            handleEvent(block);
                         }
                     }
+                } catch (err) {
+                    // Nothing received yet: this is a plain failure, not a drop to resume from
+                    if (!lastEventId) throw err;
+                }
+
+                if (!finished) {
+                    if (!lastEventId) break; // Stream without event ids, nothing to resume
+                    if (++attempt > 5) throw new Error('连接中断');
+                    await new Promise(r => setTimeout(r, 500 * attempt));
                 }
             }
         } catch (err) {